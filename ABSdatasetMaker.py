@@ -5,24 +5,36 @@
  This file is part of a project licensed under the MIT License.
  See the LICENSE file in the project root for more information.
  
- last modified in 2507131536
+ last modified in 2610191200
 """
 
-import random
-import matplotlib.pyplot as plt
 import numpy as np
 import os
+import io
 from tqdm import tqdm
-import json
 from datetime import datetime
+from functools import partial
+from contextlib import nullcontext
+
+from sampleRenderer import get_renderer, BACKEND, FIGSIZE, DPI
+from pointPlacer import place_points, retry_placement
+from datasetStore import MetaWriter, iter_parallel, img_name_for
+from packStore import PackWriter
+from imageStore import transcode_image, image_ext, IMAGE_FORMAT, IMAGE_QUALITY
+from stageProfiler import GenProfiler, stage
+from promptTemplates import point_fields
 
-# np.random.seed(42)
 FIXSET = True
+SEED = 42
 DATASET_SIZE = 300
+# questions asked about every rendered layout, the first one is always the layout's own (enlarged) target
+QUESTIONS_PER_IMAGE = 1
 
 nowtime = datetime.now().strftime("%y%m%d%H%M")
 DATASET_SAVE_PATH = os.path.join(os.getcwd(), f'{nowtime}_ABSdataset')
-META_SAVE_PATH = os.path.join(os.getcwd(), f'{nowtime}_ABSmetaList.json')
+META_SAVE_PATH = os.path.join(os.getcwd(), f'{nowtime}_ABSmetaList.jsonl')
+PACK_SAVE_PATH = os.path.join(os.getcwd(), f'{nowtime}_ABSpack')
+PROFILE_SAVE_PATH = os.path.join(os.getcwd(), f'{nowtime}_ABSprofile.json')
 
 POINT_MIN_NUM = 5
 POINT_MAX_NUM = 10
@@ -74,25 +86,17 @@ POINT_NAME_LIST = [
 ]
 
 
-def save_list2json(
-    meta_list, 
-    save_filename, 
-):
-    def convert(obj):
-        if isinstance(obj, np.integer):
-            return int(obj)
-        raise TypeError(f"Type {type(obj)} not serializable")
-
-    with open(save_filename, "w") as file:
-        json.dump(meta_list, file, indent=4, default=convert)
-
 def quadrant_positioner(
     quadrant, 
     margin, 
     min_sep, 
     center_x=0.5, 
-    center_y=0.5
+    center_y=0.5, 
+    rng=None, 
 ):
+    if rng is None:
+        rng = np.random.default_rng()
+
     if quadrant == 'quadrant_1':
         valid_x_min = max(center_x + min_sep, margin)
         valid_x_max = 1 - margin
@@ -123,8 +127,8 @@ def quadrant_positioner(
     if valid_x_max <= valid_x_min or valid_y_max <= valid_y_min:
         raise ValueError(f"No valid space for quadrant '{quadrant}' with given margin/min_sep")
 
-    px = np.random.uniform(valid_x_min, valid_x_max)
-    py = np.random.uniform(valid_y_min, valid_y_max)
+    px = rng.uniform(valid_x_min, valid_x_max)
+    py = rng.uniform(valid_y_min, valid_y_max)
 
     return px, py
 
@@ -132,9 +136,13 @@ def choose_quadrant(
     margin, 
     min_sep, 
     center_x=0.5, 
-    center_y=0.5
+    center_y=0.5, 
+    rng=None, 
 ):
-    idx = random.randint(0, len(QUADRANT_LIST) - 1)
+    if rng is None:
+        rng = np.random.default_rng()
+
+    idx = int(rng.integers(len(QUADRANT_LIST)))
     quadrant_key = QUADRANT_LIST[idx]
     px, py = quadrant_positioner(
         quadrant=quadrant_key, 
@@ -142,28 +150,63 @@ def choose_quadrant(
         min_sep=min_sep, 
         center_x=center_x, 
         center_y=center_y,
+        rng=rng, 
     )
     return quadrant_key, (px, py)
 
+def quadrant_of(
+    position, 
+    min_sep, 
+    center_x=0.5, 
+    center_y=0.5, 
+):
+    # quadrant of a point, None when it is closer than min_sep to either center line
+    # (the same separation quadrant_positioner() guarantees for the layout's own target)
+    dx = position[0] - center_x
+    dy = position[1] - center_y
+    if abs(dx) < min_sep or abs(dy) < min_sep:
+        return None
+    if dy > 0:
+        return 'quadrant_1' if dx > 0 else 'quadrant_2'
+    return 'quadrant_4' if dx > 0 else 'quadrant_3'
+
+def sample_targets(
+    positions, 
+    num_targets, 
+    min_sep, 
+    rng, 
+    exclude_name: str = None, 
+):
+    # up to num_targets distinct points (in random order) whose quadrant is unambiguous,
+    # fewer when the layout does not have that many
+    name_list = [
+        name for name in positions if name != exclude_name and quadrant_of(positions[name], min_sep) is not None
+    ]
+    return [
+        (name_list[name_idx], quadrant_of(positions[name_list[name_idx]], min_sep)) 
+        for name_idx in rng.permutation(len(name_list))[:num_targets]
+    ]
+
 def get_random_points(
     point_min_num, 
     point_max_num,
+    rng, 
 ):
-    point_num = random.randint(point_min_num, point_max_num)
-    random.shuffle(POINT_NAME_LIST)
+    point_num = int(rng.integers(point_min_num, point_max_num + 1))
+    point_name_list = [POINT_NAME_LIST[i] for i in rng.permutation(len(POINT_NAME_LIST))]
 
     marker_items = list(MARKER_DICT.items())
-    random.shuffle(marker_items)
+    marker_items = [marker_items[i] for i in rng.permutation(len(marker_items))]
     shuffled_marker_dict = dict(marker_items)
 
     color_items = list(COLOR_DICT.items())
-    random.shuffle(color_items)
+    color_items = [color_items[i] for i in rng.permutation(len(color_items))]
     shuffled_color_dict = dict(color_items)
 
     points_dict = {}
     gt_list = []
     for idx in range(point_num):
-        point_name = POINT_NAME_LIST[idx]
+        point_name = point_name_list[idx]
 
         marker_key = list(shuffled_marker_dict.keys())[idx]
         marker_value = shuffled_marker_dict[marker_key]
@@ -183,29 +226,12 @@ def get_random_points(
 
     return points_dict, gt_list
 
-def syb2str(
-    point_dict,
-):
-    return {
-        'sybVp': f"object {point_dict['name']}",
-        'imgVp': f"{point_dict['color']} object",
-    }
-
-def promptTem(
-    point_name, 
-):
-    return f"""
-    The figure represents a map with multiple objects. Each object is associated with a name as shown in the figure. Please answer the following multiple-choice question based on the provided information. Which direction is {point_name} located in the image? Available options:
-    A. UpperRight
-    B. UpperLeft
-    C. LowerLeft
-    D. LowerRight.
-    """
-
 def gt2prompt(
     img_name, 
     quadrant_info,
+    positions, 
 ):
+    # compact question record, the sybVp/imgVp prompts are rendered from the 'abs' template on use
     opt_dict = {
         'quadrant_1': 'A. UpperRight', 
         'quadrant_2': 'B. UpperLeft', 
@@ -213,109 +239,280 @@ def gt2prompt(
         'quadrant_4': 'D. LowerRight', 
     }
 
-    target_point = quadrant_info['target_point']
-    target_quadrant = quadrant_info['quadrant']
-
-    sybVp_promptTem = promptTem(
-        point_name=syb2str(target_point)['sybVp'], 
-    )
-    imgVp_promptTem = promptTem(
-        point_name=syb2str(target_point)['imgVp'], 
-    )
-    ans = opt_dict[target_quadrant]
-
     return {
         'img_name': img_name, 
-        'sybVp_promptTem': sybVp_promptTem, 
-        'imgVp_promptTem': imgVp_promptTem, 
-        'ans': ans, 
+        'tem': 'abs', 
+        **point_fields([quadrant_info['target_point']], positions), 
+        'ans': opt_dict[quadrant_info['quadrant']], 
     }
 
-def is_valid(pt, existing, min_dist):
-    return all(np.hypot(pt[0]-ex[0], pt[1]-ex[1]) >= min_dist for ex in existing)
-
-def gen_absdataset(
-    dataset_size: int = DATASET_SIZE, 
+def sample_rng(
+    sample_idx: int, 
     fixset: bool = FIXSET, 
+    seed: int = SEED, 
 ):
-    print('buliding absdataset...')
-    os.makedirs(DATASET_SAVE_PATH, exist_ok=True)
-
-    data_list = []
-    for sample_idx in tqdm(range(dataset_size)):
-        if fixset:
-            np.random.seed(42 + sample_idx)
+    # every sample owns an independent stream derived from (seed, sample_idx), so any index can be rebuilt alone
+    if fixset:
+        return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(sample_idx,)))
+    return np.random.default_rng()
+
+def build_sample(
+    sample_idx: int, 
+    dataset_save_path: str = None, 
+    fixset: bool = FIXSET, 
+    seed: int = SEED, 
+    backend: str = BACKEND, 
+    dataset_size: int = DATASET_SIZE, 
+    figsize: tuple = FIGSIZE, 
+    dpi: int = DPI, 
+    image_format: str = IMAGE_FORMAT, 
+    quality: int = IMAGE_QUALITY, 
+    questions_per_image: int = QUESTIONS_PER_IMAGE, 
+):
+    # returns (image, metadata); the image is saved under dataset_save_path and its path returned,
+    # or rendered to memory and returned as image bytes (image_format) when dataset_save_path is None;
+    # with questions_per_image > 1 metadata is a list of question records sharing img_name
+    rng = sample_rng(
+        sample_idx=sample_idx, 
+        fixset=fixset, 
+        seed=seed, 
+    )
 
-        positions = {}
+    positions = {}
+    with stage('points'):
         points_dict, gt_list = get_random_points(
             POINT_MIN_NUM, 
             POINT_MAX_NUM, 
+            rng=rng, 
         )
 
-        target_point_name = random.choice(list(points_dict.keys()))
-        target_point_info = None
-        for point_info in gt_list:
-            if point_info['name'] == target_point_name:
-                target_point_info = point_info
-                break
-
-        quadrant_key, quadrant_position = choose_quadrant(
+    target_point_name = str(rng.choice(list(points_dict.keys())))
+    target_point_info = None
+    for point_info in gt_list:
+        if point_info['name'] == target_point_name:
+            target_point_info = point_info
+            break
+
+    with stage('placement'):
+        quadrant_key, quadrant_position = retry_placement(
+            partial(
+                choose_quadrant, 
+                margin=MARGIN, 
+                min_sep=MINSEP, 
+                rng=rng, 
+            )
+        )
+    
+    positions[target_point_name] = quadrant_position
+
+    other_names = [name for name in points_dict if name not in positions]
+    with stage('placement'):
+        other_positions = place_points(
+            num_points=len(other_names), 
+            existing=positions.values(), 
             margin=MARGIN, 
             min_sep=MINSEP, 
+            rng=rng, 
         )
-        
-        positions[target_point_name] = quadrant_position
-
-        for name in points_dict:
-            if name in positions:
-                continue
-            while True:
-                x = np.random.uniform(MARGIN, 1 - MARGIN)
-                y = np.random.uniform(MARGIN, 1 - MARGIN)
-                if is_valid((x, y), positions.values(), MINSEP):
-                    positions[name] = (x, y)
-                    break
-
-        fig, ax = plt.subplots(figsize=(8,8))
-        
-        # ax.axhline(y=0.5, color='lightgray', linestyle='--', alpha=0.5)
-        # ax.axvline(x=0.5, color='lightgray', linestyle='--', alpha=0.5)
-        
-        for name, attrs in points_dict.items():
-            x, y = positions[name]
-            size = 400 if name == target_point_name else 300
-            ax.scatter(x, y, marker=attrs["marker"], s=size,
-                    facecolor=attrs["color"], edgecolor='black', linewidth=1)
-            ax.text(x + 0.02, y + 0.02, name, fontsize=12, va='center')
-
-        ax.set_xlim(0,1)
-        ax.set_ylim(0,1)
-        ax.set_xticks([])
-        ax.set_yticks([])
-        for spine in ax.spines.values():
-            spine.set_linewidth(1.5)
-
-        quadrant_info = {
-            'target_point': target_point_info,
-            'quadrant': quadrant_key,
-        }
+    positions.update(zip(other_names, other_positions))
+
+    # drawn after the layout, so the image and its first question do not depend on questions_per_image
+    extra_target_list = []
+    if questions_per_image > 1:
+        with stage('questions'):
+            extra_target_list = sample_targets(
+                positions=positions, 
+                num_targets=questions_per_image - 1, 
+                min_sep=MINSEP, 
+                rng=rng, 
+                exclude_name=target_point_name, 
+            )
+
+    quadrant_info = {
+        'target_point': target_point_info,
+        'quadrant': quadrant_key,
+    }
 
-        img_name = f"{str(sample_idx).zfill(3)}.png"
-        plt.savefig(os.path.join(DATASET_SAVE_PATH, img_name), dpi=200, bbox_inches='tight')
-        data_list += [gt2prompt(img_name, quadrant_info)]
-        # plt.show()
-        plt.close()
+    img_name = img_name_for(sample_idx, dataset_size, ext=image_ext(image_format))
+    # other formats are rendered as png in memory and re-encoded
+    direct_save = dataset_save_path is not None and image_format == 'png'
+    image_target = os.path.join(dataset_save_path, img_name) if direct_save else io.BytesIO()
+    # the first sample of a process pays for the figure (plt.subplots) here
+    with stage('setup'):
+        renderer = get_renderer(max_points=POINT_MAX_NUM, backend=backend, figsize=figsize, dpi=dpi)
+    renderer.render(
+        points_dict=points_dict, 
+        positions=positions, 
+        save_path=image_target, 
+        sizes={target_point_name: 400}, 
+    )
 
+    meta = gt2prompt(img_name, quadrant_info, positions)
+    if questions_per_image > 1:
+        point_info_dict = {point_info['name']: point_info for point_info in gt_list}
+        question_list = [meta] + [
+            gt2prompt(img_name, {'target_point': point_info_dict[name], 'quadrant': quadrant}, positions) 
+            for name, quadrant in extra_target_list
+        ]
+        meta = [
+            {**question, 'image_idx': sample_idx, 'question_idx': question_idx} 
+            for question_idx, question in enumerate(question_list)
+        ]
+    if direct_save:
+        return image_target, meta
+    with stage('transcode'):
+        image = transcode_image(image_target.getvalue(), image_format=image_format, quality=quality)
+    if dataset_save_path is None:
+        return image, meta
+    image_path = os.path.join(dataset_save_path, img_name)
+    with stage('write_image'), open(image_path, 'wb') as image_file:
+        image_file.write(image)
+    return image_path, meta
+
+def gen_sample(
+    sample_idx: int, 
+    dataset_size: int, 
+    dataset_save_path: str = None, 
+    fixset: bool = FIXSET, 
+    seed: int = SEED, 
+    backend: str = BACKEND, 
+    figsize: tuple = FIGSIZE, 
+    dpi: int = DPI, 
+    image_format: str = IMAGE_FORMAT, 
+    quality: int = IMAGE_QUALITY, 
+    questions_per_image: int = QUESTIONS_PER_IMAGE, 
+):
+    # one sample of a dataset of dataset_size images (which sets the zero padding of its name), as
+    # (image path, or image bytes when dataset_save_path is None, metadata)
+    if dataset_save_path is not None:
+        os.makedirs(dataset_save_path, exist_ok=True)
+    return build_sample(
+        sample_idx=sample_idx, 
+        dataset_save_path=dataset_save_path, 
+        fixset=fixset, 
+        seed=seed, 
+        backend=backend, 
+        dataset_size=dataset_size, 
+        figsize=figsize, 
+        dpi=dpi, 
+        image_format=image_format, 
+        quality=quality, 
+        questions_per_image=questions_per_image, 
+    )
 
-    save_list2json(
-        meta_list=data_list, 
-        save_filename=META_SAVE_PATH, 
+def iter_abssamples(
+    dataset_size: int = DATASET_SIZE, 
+    fixset: bool = FIXSET, 
+    seed: int = SEED, 
+    workers: int = 1, 
+    backend: str = BACKEND, 
+    dataset_save_path: str = None, 
+    figsize: tuple = FIGSIZE, 
+    dpi: int = DPI, 
+    image_format: str = IMAGE_FORMAT, 
+    quality: int = IMAGE_QUALITY, 
+    questions_per_image: int = QUESTIONS_PER_IMAGE, 
+    profiler: GenProfiler = None, 
+):
+    # yields (image path or image bytes, metadata) in index order, one sample at a time;
+    # with a profiler every sample is timed stage by stage in the process that builds it
+    sample_fn = partial(
+        build_sample, 
+        dataset_save_path=dataset_save_path, 
+        fixset=fixset, 
+        seed=seed, 
+        backend=backend, 
+        dataset_size=dataset_size, 
+        figsize=figsize, 
+        dpi=dpi, 
+        image_format=image_format, 
+        quality=quality, 
+        questions_per_image=questions_per_image, 
     )
-    print(f"\n{DATASET_SAVE_PATH}\n{META_SAVE_PATH}\n")
+    if profiler is None:
+        yield from iter_parallel(
+            sample_fn=sample_fn, 
+            index_list=range(dataset_size), 
+            workers=workers, 
+        )
+        return
+    for profiled_result in iter_parallel(
+        sample_fn=profiler.wrap(sample_fn), 
+        index_list=range(dataset_size), 
+        workers=workers, 
+    ):
+        yield profiler.add(profiled_result)
+
+def gen_absdataset(
+    dataset_size: int = DATASET_SIZE, 
+    fixset: bool = FIXSET, 
+    seed: int = SEED, 
+    workers: int = 1, 
+    backend: str = BACKEND, 
+    packed: bool = False, 
+    figsize: tuple = FIGSIZE, 
+    dpi: int = DPI, 
+    image_format: str = IMAGE_FORMAT, 
+    quality: int = IMAGE_QUALITY, 
+    questions_per_image: int = QUESTIONS_PER_IMAGE, 
+    profile: bool = False, 
+    cprofile: bool = False, 
+):
+    # profile writes per-stage / per-sample timings and peak RSS to PROFILE_SAVE_PATH,
+    # cprofile additionally dumps the merged cProfile stats of every sample next to it (.prof);
+    # questions_per_image > 1 writes one record per question, dataset_size still counts rendered images
+    print('buliding absdataset...')
+    if packed:
+        # images never touch the filesystem one by one, they are rendered to memory and appended to shards
+        writer = PackWriter(PACK_SAVE_PATH)
+        data_path, meta_path = PACK_SAVE_PATH, writer.meta_path
+    else:
+        os.makedirs(DATASET_SAVE_PATH, exist_ok=True)
+        # records are appended as samples finish, an interrupted run keeps every sample written so far
+        writer = MetaWriter(META_SAVE_PATH)
+        data_path, meta_path = DATASET_SAVE_PATH, META_SAVE_PATH
+
+    profiler = GenProfiler(cprofile=cprofile) if profile or cprofile else None
+    try:
+        for image, meta in tqdm(iter_abssamples(
+            dataset_size=dataset_size, 
+            fixset=fixset, 
+            seed=seed, 
+            workers=workers, 
+            backend=backend, 
+            dataset_save_path=None if packed else DATASET_SAVE_PATH, 
+            figsize=figsize, 
+            dpi=dpi, 
+            image_format=image_format, 
+            quality=quality, 
+            questions_per_image=questions_per_image, 
+            profiler=profiler, 
+        ), total=dataset_size):
+            with profiler.stage('write') if profiler is not None else nullcontext():
+                if packed:
+                    writer.write(image, meta)
+                else:
+                    for record in meta if isinstance(meta, list) else [meta]:
+                        writer.write(record)
+    finally:
+        writer.close()
+    print(f"\n{data_path}\n{meta_path}\n")
+    if profiler is not None:
+        profiler.write(
+            PROFILE_SAVE_PATH, 
+            dataset='ABS', 
+            dataset_size=dataset_size, 
+            workers=workers, 
+            backend=backend, 
+            packed=packed, 
+            image_format=image_format, 
+            figsize=list(figsize), 
+            dpi=dpi, 
+        )
 
     return {
-        'METADATA_PATH': META_SAVE_PATH,
-        'DATA_PATH': DATASET_SAVE_PATH,
+        'METADATA_PATH': meta_path,
+        'DATA_PATH': data_path,
     }
 
 if __name__ == "__main__":
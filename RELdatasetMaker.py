@@ -5,24 +5,36 @@
  This file is part of a project licensed under the MIT License.
  See the LICENSE file in the project root for more information.
  
- last modified in 2507131536
+ last modified in 2610191200
 """
 
-import random
-import matplotlib.pyplot as plt
 import numpy as np
 import os
+import io
 from tqdm import tqdm
-import json
 from datetime import datetime
+from functools import partial
+from contextlib import nullcontext
+
+from sampleRenderer import get_renderer, BACKEND, FIGSIZE, DPI
+from pointPlacer import place_points, retry_placement
+from datasetStore import MetaWriter, iter_parallel, img_name_for
+from packStore import PackWriter
+from imageStore import transcode_image, image_ext, IMAGE_FORMAT, IMAGE_QUALITY
+from stageProfiler import GenProfiler, stage
+from promptTemplates import point_fields
 
-# np.random.seed(42)
 FIXSET = True
+SEED = 42
 DATASET_SIZE = 300
+# questions asked about every rendered layout, the first one is always the layout's own A-relative-to-B question
+QUESTIONS_PER_IMAGE = 1
 
 nowtime = datetime.now().strftime("%y%m%d%H%M")
 DATASET_SAVE_PATH = os.path.join(os.getcwd(), f'{nowtime}_RELdataset')
-META_SAVE_PATH = os.path.join(os.getcwd(), f'{nowtime}_RELmetaList.json')
+META_SAVE_PATH = os.path.join(os.getcwd(), f'{nowtime}_RELmetaList.jsonl')
+PACK_SAVE_PATH = os.path.join(os.getcwd(), f'{nowtime}_RELpack')
+PROFILE_SAVE_PATH = os.path.join(os.getcwd(), f'{nowtime}_RELprofile.json')
 
 POINT_MIN_NUM = 5
 POINT_MAX_NUM = 10
@@ -74,24 +86,16 @@ POINT_NAME_LIST = [
 ]
 
 
-def save_list2json(
-    meta_list, 
-    save_filename, 
-):
-    def convert(obj):
-        if isinstance(obj, np.integer):
-            return int(obj)
-        raise TypeError(f"Type {type(obj)} not serializable")
-
-    with open(save_filename, "w") as file:
-        json.dump(meta_list, file, indent=4, default=convert)
-
 def directer(
     direct, 
     margin, 
     min_sep, 
-    bx, by
+    bx, by, 
+    rng=None, 
 ):
+    if rng is None:
+        rng = np.random.default_rng()
+
     if direct == 'lower_left':
         valid_x_min = margin
         valid_x_max = bx - min_sep
@@ -122,8 +126,8 @@ def directer(
     if valid_x_max <= valid_x_min or valid_y_max <= valid_y_min:
         raise ValueError(f"No valid space for direction '{direct}' with given margin/min_sep/bx/by")
 
-    ax = np.random.uniform(valid_x_min, valid_x_max)
-    ay = np.random.uniform(valid_y_min, valid_y_max)
+    ax = rng.uniform(valid_x_min, valid_x_max)
+    ay = rng.uniform(valid_y_min, valid_y_max)
 
     return ax, ay
 
@@ -132,8 +136,12 @@ def choose_direct(
     min_sep, 
     bx, 
     by, 
+    rng=None, 
 ):
-    idx = random.randint(0, len(DIRECT_LIST) - 1)
+    if rng is None:
+        rng = np.random.default_rng()
+
+    idx = int(rng.integers(len(DIRECT_LIST)))
     key = DIRECT_LIST[idx]
     ax, ay = directer(
         direct=key, 
@@ -141,29 +149,70 @@ def choose_direct(
         min_sep=min_sep, 
         bx=bx, 
         by=by,
+        rng=rng, 
     )
     value = (ax, ay)
     return key, value
 
+def relative_direct(
+    position_a, 
+    position_b, 
+    min_sep, 
+):
+    # direction of a relative to b, None when they are closer than min_sep on either axis
+    # (the same separation directer() guarantees for the layout's own pair)
+    dx = position_a[0] - position_b[0]
+    dy = position_a[1] - position_b[1]
+    if abs(dx) < min_sep or abs(dy) < min_sep:
+        return None
+    return f"{'upper' if dy > 0 else 'lower'}_{'right' if dx > 0 else 'left'}"
+
+def sample_pairs(
+    positions, 
+    num_pairs, 
+    min_sep, 
+    rng, 
+    exclude_pair: tuple = (), 
+):
+    # up to num_pairs distinct point pairs (in random order and orientation) whose direction is unambiguous,
+    # fewer when the layout does not have that many
+    name_list = list(positions)
+    pair_list = []
+    for idx, name_a in enumerate(name_list):
+        for name_b in name_list[idx + 1:]:
+            if {name_a, name_b} == set(exclude_pair):
+                continue
+            if relative_direct(positions[name_a], positions[name_b], min_sep) is not None:
+                pair_list += [(name_a, name_b)]
+
+    chosen_list = []
+    for pair_idx in rng.permutation(len(pair_list))[:num_pairs]:
+        name_a, name_b = pair_list[pair_idx]
+        if rng.random() < 0.5:
+            name_a, name_b = name_b, name_a
+        chosen_list += [(name_a, name_b, relative_direct(positions[name_a], positions[name_b], min_sep))]
+    return chosen_list
+
 def get_random_points(
     point_min_num, 
     point_max_num,
+    rng, 
 ):
-    point_num = random.randint(point_min_num, point_max_num)
-    random.shuffle(POINT_NAME_LIST)
+    point_num = int(rng.integers(point_min_num, point_max_num + 1))
+    point_name_list = [POINT_NAME_LIST[i] for i in rng.permutation(len(POINT_NAME_LIST))]
 
     marker_items = list(MARKER_DICT.items())
-    random.shuffle(marker_items)
+    marker_items = [marker_items[i] for i in rng.permutation(len(marker_items))]
     shuffled_marker_dict = dict(marker_items)
 
     color_items = list(COLOR_DICT.items())
-    random.shuffle(color_items)
+    color_items = [color_items[i] for i in rng.permutation(len(color_items))]
     shuffled_color_dict = dict(color_items)
 
     points_dict = {}
     gt_list = []
     for idx in range(point_num):
-        point_name = POINT_NAME_LIST[idx]
+        point_name = point_name_list[idx]
 
         marker_key = list(shuffled_marker_dict.keys())[idx]
         marker_value = shuffled_marker_dict[marker_key]
@@ -183,30 +232,12 @@ def get_random_points(
 
     return points_dict, gt_list
 
-def syb2str(
-    point_dict,
-):
-    return {
-        'sybVp': f"object {point_dict['name']}",
-        'imgVp': f"{point_dict['color']} object",
-    }
-
-def promptTem(
-    point_a, 
-    point_b, 
-):
-    return f"""
-    The figure represents a map with multiple objects. Each object is associated with a name as shown in the figure. Please answer the following multiple-choice question based on the provided information. In which direction is {point_a} relative to {point_b}? Available options:
-    A. LowerLeft
-    B. LowerRight
-    C. UpperLeft
-    D. UpperRight.
-    """
-
 def gt2prompt(
     gt_list, 
     img_name, 
+    positions, 
 ):
+    # compact question record, the sybVp/imgVp prompts are rendered from the 'rel' template on use
     opt_dict = {
         'lower_left': 'A. LowerLeft', 
         'lower_right': 'B. LowerRight', 
@@ -214,105 +245,274 @@ def gt2prompt(
         'upper_right': 'D. UpperRight', 
     }
 
-    sybVp_promptTem = promptTem(
-        point_a=syb2str(gt_list[0])['sybVp'], 
-        point_b=syb2str(gt_list[1])['sybVp'], 
-    )
-    imgVp_promptTem = promptTem(
-        point_a=syb2str(gt_list[0])['imgVp'], 
-        point_b=syb2str(gt_list[1])['imgVp'], 
-    )
-    ans = opt_dict[gt_list[-1]]
-
     return {
         'img_name': img_name, 
-        'sybVp_promptTem': sybVp_promptTem, 
-        'imgVp_promptTem': imgVp_promptTem, 
-        'ans': ans, 
+        'tem': 'rel', 
+        **point_fields(gt_list[:2], positions), 
+        'ans': opt_dict[gt_list[-1]], 
     }
 
-def is_valid(pt, existing, min_dist):
-    return all(np.hypot(pt[0]-ex[0], pt[1]-ex[1]) >= min_dist for ex in existing)
-
-def gen_reldataset(
-    dataset_size: int = DATASET_SIZE, 
+def sample_rng(
+    sample_idx: int, 
     fixset: bool = FIXSET, 
+    seed: int = SEED, 
 ):
-    print('buliding reldataset...')
-    os.makedirs(DATASET_SAVE_PATH, exist_ok=True)
-
-    data_list = []
-    for sample_idx in tqdm(range(dataset_size)):
-        if fixset:
-            np.random.seed(42 + sample_idx)
+    # every sample owns an independent stream derived from (seed, sample_idx), so any index can be rebuilt alone
+    if fixset:
+        return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(sample_idx,)))
+    return np.random.default_rng()
+
+def build_sample(
+    sample_idx: int, 
+    dataset_save_path: str = None, 
+    fixset: bool = FIXSET, 
+    seed: int = SEED, 
+    backend: str = BACKEND, 
+    dataset_size: int = DATASET_SIZE, 
+    figsize: tuple = FIGSIZE, 
+    dpi: int = DPI, 
+    image_format: str = IMAGE_FORMAT, 
+    quality: int = IMAGE_QUALITY, 
+    questions_per_image: int = QUESTIONS_PER_IMAGE, 
+):
+    # returns (image, metadata); the image is saved under dataset_save_path and its path returned,
+    # or rendered to memory and returned as image bytes (image_format) when dataset_save_path is None;
+    # with questions_per_image > 1 metadata is a list of question records sharing img_name
+    rng = sample_rng(
+        sample_idx=sample_idx, 
+        fixset=fixset, 
+        seed=seed, 
+    )
 
-        positions = {}
+    positions = {}
+    with stage('points'):
         points_dict, gt_list = get_random_points(
             POINT_MIN_NUM, 
             POINT_MAX_NUM, 
+            rng=rng, 
         )
 
-        while True:
-            bx = np.random.uniform(MARGIN, 1 - MARGIN)
-            by = np.random.uniform(MARGIN, 1 - MARGIN)
-            positions[list(points_dict.keys())[1]] = (bx, by)
-            break
-
-        while True:
-            try:
-                direct_key, direct_value = choose_direct(
-                    margin=MARGIN, 
-                    min_sep=MINSEP, 
-                    bx=bx, 
-                    by=by, 
-                )
-                break
-            except ValueError:
-                continue
+    bx = rng.uniform(MARGIN, 1 - MARGIN)
+    by = rng.uniform(MARGIN, 1 - MARGIN)
+    positions[list(points_dict.keys())[1]] = (bx, by)
+
+    with stage('placement'):
+        direct_key, direct_value = retry_placement(
+            partial(
+                choose_direct, 
+                margin=MARGIN, 
+                min_sep=MINSEP, 
+                bx=bx, 
+                by=by, 
+                rng=rng, 
+            )
+        )
 
-        gt_list += [direct_key]
-        positions[list(points_dict.keys())[0]] = direct_value
+    gt_list += [direct_key]
+    positions[list(points_dict.keys())[0]] = direct_value
+
+    other_names = [name for name in points_dict if name not in positions]
+    with stage('placement'):
+        other_positions = place_points(
+            num_points=len(other_names), 
+            existing=positions.values(), 
+            margin=MARGIN, 
+            min_sep=MINSEP, 
+            rng=rng, 
+        )
+    positions.update(zip(other_names, other_positions))
+
+    # drawn after the layout, so the image and its first question do not depend on questions_per_image
+    extra_pair_list = []
+    if questions_per_image > 1:
+        with stage('questions'):
+            extra_pair_list = sample_pairs(
+                positions=positions, 
+                num_pairs=questions_per_image - 1, 
+                min_sep=MINSEP, 
+                rng=rng, 
+                exclude_pair=tuple(list(points_dict.keys())[:2]), 
+            )
+
+    img_name = img_name_for(sample_idx, dataset_size, ext=image_ext(image_format))
+    # other formats are rendered as png in memory and re-encoded
+    direct_save = dataset_save_path is not None and image_format == 'png'
+    image_target = os.path.join(dataset_save_path, img_name) if direct_save else io.BytesIO()
+    # the first sample of a process pays for the figure (plt.subplots) here
+    with stage('setup'):
+        renderer = get_renderer(max_points=POINT_MAX_NUM, backend=backend, figsize=figsize, dpi=dpi)
+    renderer.render(
+        points_dict=points_dict, 
+        positions=positions, 
+        save_path=image_target, 
+    )
 
-        for name in points_dict:
-            if name in positions:
-                continue
-            while True:
-                x = np.random.uniform(MARGIN, 1 - MARGIN)
-                y = np.random.uniform(MARGIN, 1 - MARGIN)
-                if is_valid((x, y), positions.values(), MINSEP):
-                    positions[name] = (x, y)
-                    break
-
-        fig, ax = plt.subplots(figsize=(8,8))
-        for name, attrs in points_dict.items():
-            x, y = positions[name]
-            ax.scatter(x, y, marker=attrs["marker"], s=300,
-                    facecolor=attrs["color"], edgecolor='black', linewidth=1)
-            ax.text(x + 0.02, y + 0.02, name, fontsize=12, va='center')
-
-        ax.set_xlim(0,1)
-        ax.set_ylim(0,1)
-        ax.set_xticks([])
-        ax.set_yticks([])
-        for spine in ax.spines.values():
-            spine.set_linewidth(1.5)
-
-        img_name = f"{str(sample_idx).zfill(3)}.png"
-        plt.savefig(os.path.join(DATASET_SAVE_PATH, img_name), dpi=200, bbox_inches='tight')
-        data_list += [gt2prompt(gt_list, img_name)]
-        # plt.show()
-        plt.close()
-
-
-    save_list2json(
-        meta_list=data_list, 
-        save_filename=META_SAVE_PATH, 
+    meta = gt2prompt(gt_list, img_name, positions)
+    if questions_per_image > 1:
+        point_info_dict = {point_info['name']: point_info for point_info in gt_list[:-1]}
+        question_list = [meta] + [
+            gt2prompt([point_info_dict[name_a], point_info_dict[name_b], direct], img_name, positions) 
+            for name_a, name_b, direct in extra_pair_list
+        ]
+        meta = [
+            {**question, 'image_idx': sample_idx, 'question_idx': question_idx} 
+            for question_idx, question in enumerate(question_list)
+        ]
+    if direct_save:
+        return image_target, meta
+    with stage('transcode'):
+        image = transcode_image(image_target.getvalue(), image_format=image_format, quality=quality)
+    if dataset_save_path is None:
+        return image, meta
+    image_path = os.path.join(dataset_save_path, img_name)
+    with stage('write_image'), open(image_path, 'wb') as image_file:
+        image_file.write(image)
+    return image_path, meta
+
+def gen_sample(
+    sample_idx: int, 
+    dataset_size: int, 
+    dataset_save_path: str = None, 
+    fixset: bool = FIXSET, 
+    seed: int = SEED, 
+    backend: str = BACKEND, 
+    figsize: tuple = FIGSIZE, 
+    dpi: int = DPI, 
+    image_format: str = IMAGE_FORMAT, 
+    quality: int = IMAGE_QUALITY, 
+    questions_per_image: int = QUESTIONS_PER_IMAGE, 
+):
+    # one sample of a dataset of dataset_size images (which sets the zero padding of its name), as
+    # (image path, or image bytes when dataset_save_path is None, metadata)
+    if dataset_save_path is not None:
+        os.makedirs(dataset_save_path, exist_ok=True)
+    return build_sample(
+        sample_idx=sample_idx, 
+        dataset_save_path=dataset_save_path, 
+        fixset=fixset, 
+        seed=seed, 
+        backend=backend, 
+        dataset_size=dataset_size, 
+        figsize=figsize, 
+        dpi=dpi, 
+        image_format=image_format, 
+        quality=quality, 
+        questions_per_image=questions_per_image, 
+    )
+
+def iter_relsamples(
+    dataset_size: int = DATASET_SIZE, 
+    fixset: bool = FIXSET, 
+    seed: int = SEED, 
+    workers: int = 1, 
+    backend: str = BACKEND, 
+    dataset_save_path: str = None, 
+    figsize: tuple = FIGSIZE, 
+    dpi: int = DPI, 
+    image_format: str = IMAGE_FORMAT, 
+    quality: int = IMAGE_QUALITY, 
+    questions_per_image: int = QUESTIONS_PER_IMAGE, 
+    profiler: GenProfiler = None, 
+):
+    # yields (image path or image bytes, metadata) in index order, one sample at a time;
+    # with a profiler every sample is timed stage by stage in the process that builds it
+    sample_fn = partial(
+        build_sample, 
+        dataset_save_path=dataset_save_path, 
+        fixset=fixset, 
+        seed=seed, 
+        backend=backend, 
+        dataset_size=dataset_size, 
+        figsize=figsize, 
+        dpi=dpi, 
+        image_format=image_format, 
+        quality=quality, 
+        questions_per_image=questions_per_image, 
     )
-    print(f"\n{DATASET_SAVE_PATH}\n{META_SAVE_PATH}\n")
+    if profiler is None:
+        yield from iter_parallel(
+            sample_fn=sample_fn, 
+            index_list=range(dataset_size), 
+            workers=workers, 
+        )
+        return
+    for profiled_result in iter_parallel(
+        sample_fn=profiler.wrap(sample_fn), 
+        index_list=range(dataset_size), 
+        workers=workers, 
+    ):
+        yield profiler.add(profiled_result)
+
+def gen_reldataset(
+    dataset_size: int = DATASET_SIZE, 
+    fixset: bool = FIXSET, 
+    seed: int = SEED, 
+    workers: int = 1, 
+    backend: str = BACKEND, 
+    packed: bool = False, 
+    figsize: tuple = FIGSIZE, 
+    dpi: int = DPI, 
+    image_format: str = IMAGE_FORMAT, 
+    quality: int = IMAGE_QUALITY, 
+    questions_per_image: int = QUESTIONS_PER_IMAGE, 
+    profile: bool = False, 
+    cprofile: bool = False, 
+):
+    # profile writes per-stage / per-sample timings and peak RSS to PROFILE_SAVE_PATH,
+    # cprofile additionally dumps the merged cProfile stats of every sample next to it (.prof);
+    # questions_per_image > 1 writes one record per question, dataset_size still counts rendered images
+    print('buliding reldataset...')
+    if packed:
+        # images never touch the filesystem one by one, they are rendered to memory and appended to shards
+        writer = PackWriter(PACK_SAVE_PATH)
+        data_path, meta_path = PACK_SAVE_PATH, writer.meta_path
+    else:
+        os.makedirs(DATASET_SAVE_PATH, exist_ok=True)
+        # records are appended as samples finish, an interrupted run keeps every sample written so far
+        writer = MetaWriter(META_SAVE_PATH)
+        data_path, meta_path = DATASET_SAVE_PATH, META_SAVE_PATH
+
+    profiler = GenProfiler(cprofile=cprofile) if profile or cprofile else None
+    try:
+        for image, meta in tqdm(iter_relsamples(
+            dataset_size=dataset_size, 
+            fixset=fixset, 
+            seed=seed, 
+            workers=workers, 
+            backend=backend, 
+            dataset_save_path=None if packed else DATASET_SAVE_PATH, 
+            figsize=figsize, 
+            dpi=dpi, 
+            image_format=image_format, 
+            quality=quality, 
+            questions_per_image=questions_per_image, 
+            profiler=profiler, 
+        ), total=dataset_size):
+            with profiler.stage('write') if profiler is not None else nullcontext():
+                if packed:
+                    writer.write(image, meta)
+                else:
+                    for record in meta if isinstance(meta, list) else [meta]:
+                        writer.write(record)
+    finally:
+        writer.close()
+    print(f"\n{data_path}\n{meta_path}\n")
+    if profiler is not None:
+        profiler.write(
+            PROFILE_SAVE_PATH, 
+            dataset='REL', 
+            dataset_size=dataset_size, 
+            workers=workers, 
+            backend=backend, 
+            packed=packed, 
+            image_format=image_format, 
+            figsize=list(figsize), 
+            dpi=dpi, 
+        )
 
     return {
-        'METADATA_PATH': META_SAVE_PATH,
-        'DATA_PATH': DATASET_SAVE_PATH,
+        'METADATA_PATH': meta_path,
+        'DATA_PATH': data_path,
     }
 
 if __name__ == "__main__":
@@ -0,0 +1,84 @@
+"""
+ SPDX-License-Identifier: MIT
+ Copyright (c) 2025, yasaisen (clover)
+ 
+ This file is part of a project licensed under the MIT License.
+ See the LICENSE file in the project root for more information.
+ 
+ last modified in 2610190010
+"""
+
+import re
+
+
+# 'free' keeps the prompt and the substring scoring as they are, the short modes ask for the option letter
+# alone or as JSON with a matching completion budget and score the parsed choice
+ANSWER_MODE_LIST = ['free', 'letter', 'json']
+MAX_TOKENS_DICT = {
+    'letter': 4, 
+    'json': 16, 
+}
+INSTRUCTION_DICT = {
+    'letter': "Reply with the letter of the correct option only, e.g. 'B'.", 
+    'json': 'Reply with JSON only, in the form {"option": "B"}.', 
+}
+
+OPTION_PATTERN = re.compile(r"^\s*([A-Z])\.\s*(.+?)\.?\s*$", re.MULTILINE)
+JSON_PATTERN = re.compile(r'"option"\s*:\s*"\s*([A-Za-z])\b')
+LEADING_PATTERN = re.compile(r"^[\s*_`\"'(\[]*(?:(?:the\s+)?(?:answer|option)(?:\s+is)?\s*[:\-]?\s*)?([A-Za-z])(?![A-Za-z])", re.IGNORECASE)
+
+
+def is_structured(
+    answer_mode, 
+):
+    return answer_mode in MAX_TOKENS_DICT
+
+def answer_mode_suffix(
+    answer_mode, 
+):
+    # results of a short mode are stored as '<setting>_<mode>', next to the free-form ones
+    return f"_{answer_mode}" if is_structured(answer_mode) else ''
+
+def format_prompt(
+    prompt, 
+    answer_mode, 
+):
+    if not is_structured(answer_mode):
+        return prompt
+    return prompt.rstrip() + "\n" + INSTRUCTION_DICT[answer_mode]
+
+def answer_max_tokens(
+    answer_mode, 
+):
+    # None leaves the backend's max_tokens
+    return MAX_TOKENS_DICT.get(answer_mode)
+
+def parse_options(
+    prompt, 
+):
+    # {'A': 'LowerLeft', ...} from the 'X. Name' lines of the prompt
+    return {letter: name for letter, name in OPTION_PATTERN.findall(prompt)}
+
+def parse_choice(
+    answer, 
+    option_dict, 
+):
+    # the chosen option as the ground truth spells it ('B. UpperLeft'), None if the answer names no
+    # single listed option; JSON, a leading letter, then a lone option name are tried in that order
+    letter = None
+    if '{' in answer:
+        match = JSON_PATTERN.search(answer)
+        if match is not None:
+            letter = match.group(1).upper()
+    if letter is None:
+        match = LEADING_PATTERN.match(answer)
+        if match is not None and match.group(1).upper() in option_dict:
+            letter = match.group(1).upper()
+    if letter is None:
+        lower_answer = answer.lower()
+        found_list = [key for key, name in option_dict.items() if name.lower() in lower_answer]
+        if len(found_list) == 1:
+            letter = found_list[0]
+    if letter not in option_dict:
+        return None
+    return f"{letter}. {option_dict[letter]}"
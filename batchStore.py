@@ -0,0 +1,137 @@
+"""
+ SPDX-License-Identifier: MIT
+ Copyright (c) 2025, yasaisen (clover)
+ 
+ This file is part of a project licensed under the MIT License.
+ See the LICENSE file in the project root for more information.
+ 
+ last modified in 2610191250
+"""
+
+import os
+import json
+
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+# per input file limits of the Batch API
+MAX_BATCH_REQUESTS = 50000
+MAX_BATCH_BYTES = 200 * 1024 * 1024
+
+
+def make_custom_id(
+    test_setting_name, 
+    sample_idx, 
+):
+    # stable across runs of the same dataset and settings, so any output file can be matched back
+    return f"{test_setting_name}/{sample_idx}"
+
+def parse_custom_id(
+    custom_id, 
+):
+    test_setting_name, sample_idx = custom_id.rsplit('/', 1)
+    return test_setting_name, int(sample_idx)
+
+def batch_part_path(
+    batch_path, 
+    part_idx, 
+):
+    stem, ext = os.path.splitext(batch_path)
+    return f"{stem}_part{str(part_idx).zfill(3)}{ext or '.jsonl'}"
+
+class BatchRequestWriter:
+    # writes chat-completions requests in the Batch API input format, starting a new part file
+    # before one would exceed max_requests lines or max_bytes
+    def __init__(
+        self, 
+        batch_path, 
+        max_requests: int = MAX_BATCH_REQUESTS, 
+        max_bytes: int = MAX_BATCH_BYTES, 
+    ):
+        self.batch_path = batch_path
+        self.max_requests = max_requests
+        self.max_bytes = max_bytes
+        self.path_list = []
+        self.file = None
+        self.request_num = 0
+        self.byte_num = 0
+        os.makedirs(os.path.dirname(os.path.abspath(batch_path)), exist_ok=True)
+
+    def _next_part(
+        self, 
+    ):
+        if self.file is not None:
+            self.file.close()
+        self.path_list += [batch_part_path(self.batch_path, len(self.path_list))]
+        self.file = open(self.path_list[-1], 'wb')
+        self.request_num = 0
+        self.byte_num = 0
+
+    def write(
+        self, 
+        custom_id, 
+        body, 
+    ):
+        line = json.dumps({
+            'custom_id': custom_id, 
+            'method': 'POST', 
+            'url': BATCH_ENDPOINT, 
+            'body': body, 
+        }).encode('utf-8') + b"\n"
+        if self.file is None or self.request_num >= self.max_requests or self.byte_num + len(line) > self.max_bytes:
+            self._next_part()
+        self.file.write(line)
+        self.request_num += 1
+        self.byte_num += len(line)
+
+    def close(
+        self, 
+    ):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+def usage_dict(
+    usage, 
+):
+    # same flat shape as the online path's vlmBackends.usage_dict
+    if not usage:
+        return None
+    return {
+        'prompt_tokens': usage.get('prompt_tokens'), 
+        'completion_tokens': usage.get('completion_tokens'), 
+        'cached_tokens': (usage.get('prompt_tokens_details') or {}).get('cached_tokens'), 
+    }
+
+def parse_batch_line(
+    line, 
+):
+    # custom_id and an engine-style result: answer, status 'ok'/'failed' and error
+    record = json.loads(line)
+    response = record.get('response') or {}
+    body = response.get('body') or {}
+    error = record.get('error')
+    if error is None and response.get('status_code') != 200:
+        error = body.get('error') or {'message': f"status {response.get('status_code')}"}
+    if error is not None:
+        return record['custom_id'], {
+            'answer': '', 
+            'status': 'failed', 
+            'error': f"{error.get('code') or error.get('type')}: {error.get('message')}", 
+        }
+    return record['custom_id'], {
+        'answer': body['choices'][0]['message']['content'].strip(), 
+        'status': 'ok', 
+        'error': None, 
+        'usage': usage_dict(body.get('usage')), 
+    }
+
+def iter_batch_output(
+    output_path_list, 
+):
+    if isinstance(output_path_list, str):
+        output_path_list = [output_path_list]
+    for output_path in output_path_list:
+        with open(output_path, 'r', encoding='utf-8') as output_file:
+            for line in output_file:
+                if line.strip():
+                    yield parse_batch_line(line)
@@ -0,0 +1,110 @@
+"""
+ SPDX-License-Identifier: MIT
+ Copyright (c) 2025, yasaisen (clover)
+ 
+ This file is part of a project licensed under the MIT License.
+ See the LICENSE file in the project root for more information.
+ 
+ last modified in 2610191311
+"""
+
+import os
+import time
+import argparse
+import tempfile
+import numpy as np
+import openai
+
+import runVLMTesting
+from mockVLMServer import start_mock_server
+
+
+BENCH_SIZE = 50
+CONCURRENCY_LIST = [1, 4, 16, 64]
+
+
+def summarize_run(
+    result_dict, 
+    wall_s, 
+):
+    record_list = [record for test_result_list in result_dict.values() for record in test_result_list]
+    latency_list = np.array([record['latency'] for record in record_list if record['status'] == 'ok'])
+    request_num = len(record_list)
+    return {
+        'requests': request_num, 
+        'failed': sum(record['status'] != 'ok' for record in record_list), 
+        'wall_s': wall_s, 
+        'req_per_s': request_num / wall_s, 
+        'p50_ms': float(np.percentile(latency_list, 50)) * 1000 if len(latency_list) else float('nan'), 
+        'p95_ms': float(np.percentile(latency_list, 95)) * 1000 if len(latency_list) else float('nan'), 
+        'p99_ms': float(np.percentile(latency_list, 99)) * 1000 if len(latency_list) else float('nan'), 
+    }
+
+def run_bench(
+    bench_size: int = BENCH_SIZE, 
+    concurrency_list: list = CONCURRENCY_LIST, 
+    base_url: str = None, 
+    adaptive: bool = False, 
+    **mock_kwargs, 
+):
+    # without base_url a local mock is started, so the whole path runs offline and for free
+    server = None
+    if base_url is None:
+        server, base_url = start_mock_server(**mock_kwargs)
+        openai.api_key = openai.api_key or "mock"
+
+    work_dir = tempfile.mkdtemp(prefix='benchEvaluation_')
+    cwd = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        # the dataset makers fix their save paths on import, generate_datasets imports them after the chdir
+        path_dict = runVLMTesting.generate_datasets(dataset_size=bench_size, backend='raster')
+        setting_list = runVLMTesting.default_setting_list(path_dict['rel'], path_dict['abs'])
+
+        summary_list = []
+        for concurrency in concurrency_list:
+            start = time.perf_counter()
+            result_dict = runVLMTesting.run_testingsets(
+                setting_list=setting_list, 
+                concurrency=concurrency, 
+                cache_path=None, 
+                result_dir=os.path.join(work_dir, f"results_c{concurrency}"), 
+                base_url=base_url, 
+                adaptive=adaptive, 
+            )
+            summary_list += [{'concurrency': concurrency, **summarize_run(result_dict, time.perf_counter() - start)}]
+    finally:
+        os.chdir(cwd)
+        if server is not None:
+            server.shutdown()
+
+    print(f"\n{'concurrency':>11}{'requests':>10}{'failed':>8}{'wall s':>9}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for summary in summary_list:
+        print(f"{summary['concurrency']:>11}{summary['requests']:>10}{summary['failed']:>8}{summary['wall_s']:>9.2f}"
+              f"{summary['req_per_s']:>9.1f}{summary['p50_ms']:>9.0f}{summary['p95_ms']:>9.0f}{summary['p99_ms']:>9.0f}")
+    return summary_list
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="end-to-end run_testingsets throughput benchmark")
+    parser.add_argument("--size", type=int, default=BENCH_SIZE, help="samples per dataset")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=CONCURRENCY_LIST)
+    parser.add_argument("--base-url", default=None, help="benchmark a real endpoint instead of the local mock")
+    parser.add_argument("--adaptive", action="store_true", help="let the AIMD limiter grow past each level")
+    parser.add_argument("--latency-ms", type=float, default=300.0)
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--max-concurrency", type=int, default=0, help="mock answers 429 above this many in flight")
+    args = parser.parse_args()
+
+    run_bench(
+        bench_size=args.size, 
+        concurrency_list=args.concurrency, 
+        base_url=args.base_url, 
+        adaptive=args.adaptive, 
+        latency_ms=args.latency_ms, 
+        latency_sigma=args.latency_sigma, 
+        error_rate=args.error_rate, 
+        rate_limit_rate=args.rate_limit_rate, 
+        max_concurrency=args.max_concurrency, 
+    )
@@ -0,0 +1,121 @@
+"""
+ SPDX-License-Identifier: MIT
+ Copyright (c) 2025, yasaisen (clover)
+ 
+ This file is part of a project licensed under the MIT License.
+ See the LICENSE file in the project root for more information.
+ 
+ last modified in 2610191100
+"""
+
+import os
+import gc
+import time
+import argparse
+import tempfile
+import numpy as np
+
+from RELdatasetMaker import iter_relsamples
+from ABSdatasetMaker import iter_abssamples
+from datasetStore import MetaWriter, load_meta_list, iter_meta
+from promptTemplates import prompt_for, convert_meta, VIEWPOINT_DICT
+
+
+BENCH_SIZE = 40
+BENCH_QUESTIONS = 4
+# records are repeated to reach a size where load time is measurable
+BENCH_REPEAT = 300
+BENCH_ROUNDS = 7
+
+
+def write_meta(
+    sample_iter, 
+    meta_path, 
+):
+    # images are rendered in memory and dropped, only the metadata is kept
+    writer = MetaWriter(meta_path)
+    try:
+        for _, meta in sample_iter:
+            for record in (meta if isinstance(meta, list) else [meta]):
+                writer.write(record)
+    finally:
+        writer.close()
+    return meta_path
+
+def repeat_meta(
+    meta_path, 
+    save_path, 
+    repeat, 
+):
+    with open(meta_path, 'rb') as meta_file:
+        data = meta_file.read()
+    with open(save_path, 'wb') as save_file:
+        save_file.write(data * repeat)
+    return save_path
+
+def time_best(
+    fn, 
+    rounds, 
+):
+    # fastest of rounds calls in ms, the machine's noise only ever adds time
+    time_list = []
+    for _ in range(rounds):
+        gc.collect()
+        start = time.perf_counter()
+        fn()
+        time_list += [time.perf_counter() - start]
+    return float(np.min(time_list)) * 1000
+
+def measure_meta(
+    meta_path, 
+    rounds, 
+):
+    meta_list = load_meta_list(meta_path)
+    return {
+        'records': len(meta_list), 
+        'file_kb': os.path.getsize(meta_path) / 1024, 
+        'per_line_ms': time_best(lambda: list(iter_meta(meta_path)), rounds), 
+        'load_ms': time_best(lambda: load_meta_list(meta_path), rounds), 
+        # what building the jobs of one setting per viewpoint adds on top of loading
+        'prompt_ms': time_best(lambda: [prompt_for(meta, test_vp) for meta in meta_list for test_vp in VIEWPOINT_DICT], rounds), 
+    }
+
+def run_bench(
+    bench_size: int = BENCH_SIZE, 
+    questions_per_image: int = BENCH_QUESTIONS, 
+    repeat: int = BENCH_REPEAT, 
+    rounds: int = BENCH_ROUNDS, 
+):
+    # the template-id metadata as generated against the same records in the older full-text form
+    work_dir = tempfile.mkdtemp(prefix='benchMeta_')
+    summary_list = []
+    for kind, iter_fn in [('rel', iter_relsamples), ('abs', iter_abssamples)]:
+        meta_path = write_meta(
+            iter_fn(dataset_size=bench_size, questions_per_image=questions_per_image), 
+            os.path.join(work_dir, f"{kind}_metaList.jsonl"), 
+        )
+        full_path = convert_meta(meta_path, os.path.join(work_dir, f"{kind}_full.jsonl"), compact=False)
+        for form, form_path in [('template-id', meta_path), ('full-text', full_path)]:
+            bench_path = repeat_meta(form_path, os.path.join(work_dir, f"{kind}_{form}_bench.jsonl"), repeat)
+            summary_list += [{'kind': kind, 'form': form, **measure_meta(bench_path, rounds)}]
+
+    print(f"\n{'kind':<6}{'form':<13}{'records':>9}{'file KB':>10}{'per-line ms':>13}{'load ms':>9}{'prompt ms':>11}")
+    for summary in summary_list:
+        print(f"{summary['kind']:<6}{summary['form']:<13}{summary['records']:>9}{summary['file_kb']:>10.0f}"
+              f"{summary['per_line_ms']:>13.1f}{summary['load_ms']:>9.1f}{summary['prompt_ms']:>11.1f}")
+    return summary_list
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="metadata size / load time / prompt rendering per metadata form")
+    parser.add_argument("--size", type=int, default=BENCH_SIZE, help="images per dataset")
+    parser.add_argument("--questions", type=int, default=BENCH_QUESTIONS, help="questions per image")
+    parser.add_argument("--repeat", type=int, default=BENCH_REPEAT, help="copies of the records in the timed files")
+    parser.add_argument("--rounds", type=int, default=BENCH_ROUNDS)
+    args = parser.parse_args()
+
+    run_bench(
+        bench_size=args.size, 
+        questions_per_image=args.questions, 
+        repeat=args.repeat, 
+        rounds=args.rounds, 
+    )
@@ -0,0 +1,152 @@
+"""
+ SPDX-License-Identifier: MIT
+ Copyright (c) 2025, yasaisen (clover)
+ 
+ This file is part of a project licensed under the MIT License.
+ See the LICENSE file in the project root for more information.
+ 
+ last modified in 2610191310
+"""
+
+import os
+import time
+import argparse
+import tempfile
+import numpy as np
+import openai
+
+import runVLMTesting
+from mockVLMServer import start_mock_server
+from imageStore import transcode_image, encode_image, read_image_bytes
+from datasetStore import load_meta_list
+
+
+BENCH_SIZE = 30
+# (label, image_format, quality, max_side), the first entry is what a run sends by default
+ENCODING_LIST = [
+    ('png', None, None, None), 
+    ('png-palette', 'png-palette', None, None), 
+    ('jpeg-q85', 'jpeg', 85, None), 
+    ('webp-q80', 'webp', 80, None), 
+    ('png-768', 'png', None, 768), 
+    ('png-palette-768', 'png-palette', None, 768), 
+    ('webp-q80-768', 'webp', 80, 768), 
+    ('jpeg-q70-512', 'jpeg', 70, 512), 
+]
+
+
+def measure_encoding(
+    setting_list, 
+    image_format, 
+    quality, 
+    max_side, 
+):
+    # bytes on the wire and time to re-encode + base64 one image, over every image of the datasets
+    size_list, time_list = [], []
+    for data_path, metadata_path in {(setting['data_path'], setting['metadata_path']) for setting in setting_list}:
+        for meta in load_meta_list(metadata_path):
+            img_bytes = read_image_bytes(data_path, meta['img_name'])
+            start = time.perf_counter()
+            if image_format is not None or max_side is not None:
+                img_bytes = transcode_image(img_bytes, image_format=image_format or 'png', quality=quality or 85, max_side=max_side)
+            payload = encode_image(img_bytes)
+            time_list += [time.perf_counter() - start]
+            size_list += [len(payload['b64'])]
+    return float(np.mean(size_list)), float(np.mean(time_list))
+
+def summarize_encoding(
+    result_dict, 
+    with_acc: bool = True, 
+):
+    record_list = [record for test_result_list in result_dict.values() for record in test_result_list]
+    latency_list = np.array([record['latency'] for record in record_list if record['status'] == 'ok'])
+    acc_dict = {}
+    for test_setting_name, test_result_list in result_dict.items():
+        answered = [record['correct'] for record in test_result_list if record['status'] == 'ok']
+        acc_dict[test_setting_name] = sum(answered) / max(1, len(answered))
+    return {
+        'p50_ms': float(np.percentile(latency_list, 50)) * 1000 if len(latency_list) else float('nan'), 
+        'p95_ms': float(np.percentile(latency_list, 95)) * 1000 if len(latency_list) else float('nan'), 
+        # None against the mock, whose answers do not follow the image
+        'acc': acc_dict if with_acc else None, 
+    }
+
+def run_bench(
+    bench_size: int = BENCH_SIZE, 
+    encoding_list: list = ENCODING_LIST, 
+    concurrency: int = 8, 
+    base_url: str = None, 
+    **mock_kwargs, 
+):
+    # accuracy is only reported against a real model (base_url): the mock picks its answer from a hash of the
+    # encoded image, so re-encoding reshuffles its answers and any accuracy difference between encodings is noise
+    with_acc = base_url is not None
+    server = None
+    if base_url is None:
+        server, base_url = start_mock_server(**mock_kwargs)
+        openai.api_key = openai.api_key or "mock"
+
+    work_dir = tempfile.mkdtemp(prefix='benchPayload_')
+    cwd = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        # the dataset makers fix their save paths on import, generate_datasets imports them after the chdir
+        path_dict = runVLMTesting.generate_datasets(dataset_size=bench_size)
+        setting_list = runVLMTesting.default_setting_list(path_dict['rel'], path_dict['abs'])
+
+        summary_list = []
+        for label, image_format, quality, max_side in encoding_list:
+            payload_bytes, encode_s = measure_encoding(setting_list, image_format, quality, max_side)
+            result_dict = runVLMTesting.run_testingsets(
+                setting_list=setting_list, 
+                concurrency=concurrency, 
+                cache_path=None, 
+                result_dir=os.path.join(work_dir, f"results_{label}"), 
+                base_url=base_url, 
+                adaptive=False, 
+                image_format=image_format, 
+                image_quality=quality or 85, 
+                image_max_side=max_side, 
+            )
+            summary_list += [{
+                'encoding': label, 
+                'payload_kb': payload_bytes / 1024, 
+                'encode_ms': encode_s * 1000, 
+                **summarize_encoding(result_dict, with_acc=with_acc), 
+            }]
+    finally:
+        os.chdir(cwd)
+        if server is not None:
+            server.shutdown()
+
+    print(f"\n{'encoding':<18}{'payload KB':>11}{'encode ms':>10}{'p50 ms':>9}{'p95 ms':>9}{'mean acc':>9}")
+    for summary in summary_list:
+        mean_acc = f"{np.mean(list(summary['acc'].values())):>9.3f}" if with_acc else f"{'n/a':>9}"
+        print(f"{summary['encoding']:<18}{summary['payload_kb']:>11.1f}{summary['encode_ms']:>10.2f}"
+              f"{summary['p50_ms']:>9.0f}{summary['p95_ms']:>9.0f}{mean_acc}")
+    if not with_acc:
+        print("\naccuracy n/a against the local mock, pass --base-url of a real model to compare it")
+        return summary_list
+    print(f"\n{'encoding':<18}" + "".join(f"{name:>14}" for name in summary_list[0]['acc']))
+    for summary in summary_list:
+        print(f"{summary['encoding']:<18}" + "".join(f"{acc:>14.3f}" for acc in summary['acc'].values()))
+    return summary_list
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="payload size / encode time / latency / accuracy per image encoding")
+    parser.add_argument("--size", type=int, default=BENCH_SIZE, help="samples per dataset")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--base-url", default=None, help="benchmark a real endpoint instead of the local mock")
+    parser.add_argument("--latency-ms", type=float, default=300.0)
+    parser.add_argument("--latency-sigma", type=float, default=0.2)
+    parser.add_argument("--latency-per-mb-ms", type=float, default=400.0, help="mock latency added per MB uploaded")
+    args = parser.parse_args()
+
+    run_bench(
+        bench_size=args.size, 
+        concurrency=args.concurrency, 
+        base_url=args.base_url, 
+        latency_ms=args.latency_ms, 
+        latency_sigma=args.latency_sigma, 
+        latency_per_mb_ms=args.latency_per_mb_ms, 
+    )
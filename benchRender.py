@@ -0,0 +1,73 @@
+"""
+ SPDX-License-Identifier: MIT
+ Copyright (c) 2025, yasaisen (clover)
+ 
+ This file is part of a project licensed under the MIT License.
+ See the LICENSE file in the project root for more information.
+ 
+ last modified in 2610191200
+"""
+
+import os
+import sys
+import time
+import tempfile
+import subprocess
+
+import RELdatasetMaker
+import ABSdatasetMaker
+from sampleRenderer import BACKEND_LIST
+
+
+BENCH_SIZE = 100
+
+
+def measure_import_time(
+    backend, 
+):
+    # cold interpreter: import a dataset maker and build the first renderer
+    code = (
+        "import time; t = time.perf_counter(); "
+        "import RELdatasetMaker; from sampleRenderer import get_renderer; "
+        f"get_renderer(backend='{backend}'); print(time.perf_counter() - t)"
+    )
+    out = subprocess.run(
+        [sys.executable, '-c', code], 
+        cwd=os.path.dirname(os.path.abspath(__file__)), 
+        capture_output=True, 
+        text=True, 
+        check=True, 
+    )
+    return float(out.stdout.strip())
+
+def measure_samples_per_sec(
+    maker, 
+    backend, 
+    bench_size, 
+):
+    with tempfile.TemporaryDirectory() as save_path:
+        # first sample builds the renderer, keep it out of the steady-state number
+        maker.gen_sample(0, bench_size + 1, dataset_save_path=save_path, backend=backend)
+        start = time.perf_counter()
+        for sample_idx in range(1, bench_size + 1):
+            maker.gen_sample(sample_idx, bench_size + 1, dataset_save_path=save_path, backend=backend)
+        elapsed = time.perf_counter() - start
+        png_bytes = sum(
+            os.path.getsize(os.path.join(save_path, name)) for name in os.listdir(save_path)
+        ) / (bench_size + 1)
+    return bench_size / elapsed, png_bytes
+
+def run_bench(
+    bench_size: int = BENCH_SIZE, 
+):
+    print(f"{'backend':<12}{'dataset':<8}{'samples/s':>12}{'avg png KB':>12}{'startup s':>12}")
+    for backend in BACKEND_LIST:
+        startup = measure_import_time(backend)
+        for name, maker in [('rel', RELdatasetMaker), ('abs', ABSdatasetMaker)]:
+            rate, png_bytes = measure_samples_per_sec(maker, backend, bench_size)
+            print(f"{backend:<12}{name:<8}{rate:>12.2f}{png_bytes / 1024:>12.1f}{startup:>12.3f}")
+
+if __name__ == "__main__":
+    run_bench(
+        bench_size=int(sys.argv[1]) if len(sys.argv) > 1 else BENCH_SIZE, 
+    )
@@ -0,0 +1,147 @@
+"""
+ SPDX-License-Identifier: MIT
+ Copyright (c) 2025, yasaisen (clover)
+ 
+ This file is part of a project licensed under the MIT License.
+ See the LICENSE file in the project root for more information.
+ 
+ last modified in 2610191050
+"""
+
+import os
+import json
+import struct
+import numpy as np
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+
+# one little-endian uint64 byte offset per complete metadata record
+INDEX_ENTRY = struct.Struct('<Q')
+PREFETCH_PER_WORKER = 4
+
+
+def _json_default(obj):
+    if isinstance(obj, np.integer):
+        return int(obj)
+    if isinstance(obj, np.floating):
+        return float(obj)
+    raise TypeError(f"Type {type(obj)} not serializable")
+
+def img_name_for(
+    sample_idx, 
+    dataset_size, 
+    ext: str = 'png', 
+):
+    # zero padded to the widest index of the dataset (at least 3 digits), so names sort in sample order
+    return f"{str(sample_idx).zfill(max(3, len(str(dataset_size - 1))))}.{ext}"
+
+def index_path_for(
+    meta_path, 
+):
+    return os.path.splitext(meta_path)[0] + '.idx'
+
+class MetaWriter:
+    # appends one JSONL record per sample and its offset to the index; the offset is only written
+    # after the record is flushed, so every indexed record is complete even while generation runs
+    def __init__(
+        self, 
+        meta_path, 
+    ):
+        self.meta_path = meta_path
+        self.meta_file = open(meta_path, 'wb')
+        self.index_file = open(index_path_for(meta_path), 'wb')
+        self.count = 0
+
+    def write(
+        self, 
+        record, 
+    ):
+        offset = self.meta_file.tell()
+        self.meta_file.write(json.dumps(record, default=_json_default).encode('utf-8') + b'\n')
+        self.meta_file.flush()
+        self.index_file.write(INDEX_ENTRY.pack(offset))
+        self.index_file.flush()
+        self.count += 1
+
+    def close(
+        self, 
+    ):
+        self.meta_file.close()
+        self.index_file.close()
+
+def meta_count(
+    meta_path, 
+):
+    # number of complete records, readable while the writer is still appending
+    index_path = index_path_for(meta_path)
+    if os.path.exists(index_path):
+        return os.path.getsize(index_path) // INDEX_ENTRY.size
+    return len(load_meta_list(meta_path))
+
+def read_meta_record(
+    meta_path, 
+    idx, 
+):
+    with open(index_path_for(meta_path), 'rb') as index_file:
+        index_file.seek(idx * INDEX_ENTRY.size)
+        entry = index_file.read(INDEX_ENTRY.size)
+    if len(entry) < INDEX_ENTRY.size:
+        raise IndexError(f"record {idx} not in {meta_path}")
+    with open(meta_path, 'rb') as meta_file:
+        meta_file.seek(INDEX_ENTRY.unpack(entry)[0])
+        return json.loads(meta_file.readline())
+
+def iter_meta(
+    meta_path, 
+):
+    # streams records of a JSONL metadata file; the older single-list _metaList.json is loaded whole
+    if meta_path.endswith('.jsonl'):
+        with open(meta_path, 'r', encoding='utf-8') as meta_file:
+            for line in meta_file:
+                if line.strip():
+                    yield json.loads(line)
+        return
+    with open(meta_path, 'r', encoding='utf-8') as meta_file:
+        yield from json.load(meta_file)
+
+def load_meta_list(
+    meta_path, 
+):
+    # a JSONL file is parsed as one JSON array, which saves a decode call per record;
+    # one that does not parse that way (e.g. blank lines) is read line by line
+    if meta_path.endswith('.jsonl'):
+        with open(meta_path, 'rb') as meta_file:
+            data = meta_file.read().rstrip(b'\n')
+        try:
+            return json.loads(b'[' + data.replace(b'\n', b',') + b']')
+        except json.JSONDecodeError:
+            pass
+    return list(iter_meta(meta_path))
+
+def iter_parallel(
+    sample_fn, 
+    index_list, 
+    workers: int = 1, 
+    prefetch: int = PREFETCH_PER_WORKER, 
+):
+    # in-order results of sample_fn over index_list; with workers > 1 only workers * prefetch samples
+    # are queued or finished-but-unconsumed at a time, so memory stays flat however long the run is
+    if workers <= 1:
+        for sample_idx in index_list:
+            yield sample_fn(sample_idx)
+        return
+
+    index_iter = iter(index_list)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        future_queue = deque()
+        for sample_idx in index_iter:
+            future_queue.append(executor.submit(sample_fn, sample_idx))
+            if len(future_queue) >= workers * prefetch:
+                break
+        while future_queue:
+            result = future_queue.popleft().result()
+            for sample_idx in index_iter:
+                future_queue.append(executor.submit(sample_fn, sample_idx))
+                break
+            yield result
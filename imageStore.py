@@ -0,0 +1,187 @@
+"""
+ SPDX-License-Identifier: MIT
+ Copyright (c) 2025, yasaisen (clover)
+ 
+ This file is part of a project licensed under the MIT License.
+ See the LICENSE file in the project root for more information.
+ 
+ last modified in 2610191020
+"""
+
+import io
+import os
+import time
+import base64
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from packStore import is_pack, open_pack
+
+
+IMAGE_CACHE_SIZE = 256
+IMAGE_FORMAT = 'png'
+IMAGE_QUALITY = 85
+PALETTE_COLORS = 64
+# image_format -> (Pillow format, file extension)
+IMAGE_FORMAT_DICT = {
+    'png': ('PNG', 'png'), 
+    'png-palette': ('PNG', 'png'), 
+    'jpeg': ('JPEG', 'jpg'), 
+    'webp': ('WEBP', 'webp'), 
+}
+
+
+def read_image_bytes(
+    data_path, 
+    img_name, 
+):
+    # data_path is either an image directory or a packed dataset, packs are read through their mmap
+    if is_pack(data_path):
+        return open_pack(data_path).get(img_name)
+    with open(os.path.join(data_path, img_name), "rb") as image_file:
+        return image_file.read()
+
+def image_ext(
+    image_format, 
+):
+    if image_format not in IMAGE_FORMAT_DICT:
+        raise ValueError(f"Unknown image format '{image_format}', expected one of {list(IMAGE_FORMAT_DICT)}")
+    return IMAGE_FORMAT_DICT[image_format][1]
+
+def sniff_mime(
+    img_bytes, 
+):
+    if img_bytes[:3] == b"\xff\xd8\xff":
+        return "image/jpeg"
+    if img_bytes[:4] == b"RIFF" and img_bytes[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/png"
+
+def transcode_image(
+    img_bytes, 
+    image_format: str = IMAGE_FORMAT, 
+    quality: int = IMAGE_QUALITY, 
+    max_side: int = None, 
+):
+    # re-encodes an image, downscaled so its longest side is at most max_side; png at full size is passed through
+    from PIL import Image
+
+    image_ext(image_format)
+    image = Image.open(io.BytesIO(img_bytes))
+    resize = max_side is not None and max(image.size) > max_side
+    if image_format == 'png' and not resize:
+        return img_bytes
+
+    image = image.convert("RGB")
+    if resize:
+        scale = max_side / max(image.size)
+        image = image.resize((max(1, round(image.size[0] * scale)), max(1, round(image.size[1] * scale))), Image.LANCZOS)
+
+    out = io.BytesIO()
+    if image_format == 'png-palette':
+        # the plots are a handful of flat colours, a small palette keeps them exact at a fraction of the size
+        image.quantize(colors=PALETTE_COLORS, method=Image.Quantize.FASTOCTREE).save(out, format="PNG", optimize=True)
+    elif image_format == 'png':
+        image.save(out, format="PNG")
+    else:
+        image.save(out, format=IMAGE_FORMAT_DICT[image_format][0], quality=quality)
+    return out.getvalue()
+
+def encode_image(
+    img_bytes, 
+):
+    return {
+        'b64': base64.b64encode(img_bytes).decode("utf-8"), 
+        'sha': hashlib.sha256(img_bytes).hexdigest(), 
+        'size': len(img_bytes), 
+        'mime': sniff_mime(img_bytes), 
+    }
+
+class EncodedImageCache:
+    # LRU of base64 payloads, every image is read and encoded once while the settings that use it run,
+    # memory stays bounded by max_items instead of growing with the dataset
+    def __init__(
+        self, 
+        max_items: int = IMAGE_CACHE_SIZE, 
+        image_format: str = None, 
+        quality: int = IMAGE_QUALITY, 
+        max_side: int = None, 
+    ):
+        # image_format / max_side re-encode every image on load, None sends the stored bytes as they are
+        self.max_items = max_items
+        self.image_format = image_format
+        self.quality = quality
+        self.max_side = max_side
+        self.items = OrderedDict()
+        self.hits = 0
+        self.loads = 0
+        self.load_bytes = 0
+        self.encode_s = 0.0
+        # re-encoding is slow enough to run off the event loop, get() may then be called from threads
+        self.transcodes = image_format is not None or max_side is not None
+        self.lock = threading.Lock()
+        # key -> Future of a load in progress
+        self.loading = {}
+
+    def get(
+        self, 
+        data_path, 
+        img_name, 
+    ):
+        # the first caller of a key loads it, concurrent callers of the same key wait for that load
+        key = (data_path, img_name)
+        with self.lock:
+            if key in self.items:
+                self.hits += 1
+                self.items.move_to_end(key)
+                return self.items[key]
+            future = self.loading.get(key)
+            if future is None:
+                future = self.loading[key] = Future()
+                owner = True
+            else:
+                self.hits += 1
+                owner = False
+        if not owner:
+            return future.result()
+
+        try:
+            img_bytes = read_image_bytes(data_path, img_name)
+            start = time.perf_counter()
+            if self.transcodes:
+                img_bytes = transcode_image(
+                    img_bytes, 
+                    image_format=self.image_format or IMAGE_FORMAT, 
+                    quality=self.quality, 
+                    max_side=self.max_side, 
+                )
+            payload = encode_image(img_bytes)
+        except BaseException as e:
+            with self.lock:
+                del self.loading[key]
+            future.set_exception(e)
+            raise
+
+        with self.lock:
+            self.loads += 1
+            self.encode_s += time.perf_counter() - start
+            self.load_bytes += len(payload['b64'])
+            self.items[key] = payload
+            if len(self.items) > self.max_items:
+                self.items.popitem(last=False)
+            del self.loading[key]
+        future.set_result(payload)
+        return payload
+
+    def stats(
+        self, 
+    ):
+        return {
+            'hits': self.hits, 
+            'loads': self.loads, 
+            'items': len(self.items), 
+            'avg_payload_kb': self.load_bytes / max(1, self.loads) / 1024, 
+            'avg_encode_ms': self.encode_s / max(1, self.loads) * 1000, 
+        }
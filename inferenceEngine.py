@@ -0,0 +1,351 @@
+"""
+ SPDX-License-Identifier: MIT
+ Copyright (c) 2025, yasaisen (clover)
+ 
+ This file is part of a project licensed under the MIT License.
+ See the LICENSE file in the project root for more information.
+ 
+ last modified in 2610182200
+"""
+
+import time
+import random
+import asyncio
+
+
+CONCURRENCY = 8
+MAX_CONCURRENCY = 64
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+LATENCY_TOLERANCE = 2.0
+QUEUE_SIZE = 32
+BATCH_WAIT_S = 0.005
+
+
+class AdaptiveLimiter:
+    # AIMD concurrency window: +1 per window of successes, halved on a 429 (at most once per window),
+    # admissions paused for retry-after, and held while latency is well above the best seen
+    def __init__(
+        self,
+        initial: int = CONCURRENCY,
+        min_limit: int = 1,
+        max_limit: int = MAX_CONCURRENCY,
+        adaptive: bool = True,
+    ):
+        self.limit = float(max(min_limit, initial))
+        self.min_limit = min_limit
+        self.max_limit = max(max_limit, initial)
+        self.adaptive = adaptive
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.latency_ewma = None
+        self.latency_floor = None
+        self.last_decrease = 0.0
+        self.cond = asyncio.Condition()
+
+    async def acquire(
+        self,
+    ):
+        while True:
+            wait_s = self.paused_until - time.monotonic()
+            if wait_s > 0:
+                await asyncio.sleep(wait_s)
+                continue
+            async with self.cond:
+                if self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return
+                await self.cond.wait()
+
+    async def release(
+        self,
+    ):
+        async with self.cond:
+            self.in_flight -= 1
+            self.cond.notify_all()
+
+    def _decrease(
+        self,
+        factor,
+    ):
+        # many requests of the same window fail together, only react once per window
+        now = time.monotonic()
+        window_s = self.latency_ewma if self.latency_ewma is not None else 1.0
+        if now - self.last_decrease < window_s:
+            return
+        self.last_decrease = now
+        self.limit = max(self.min_limit, self.limit * factor)
+
+    def on_success(
+        self,
+        latency,
+    ):
+        if self.latency_ewma is None:
+            self.latency_ewma = latency
+        else:
+            self.latency_ewma = 0.8 * self.latency_ewma + 0.2 * latency
+        self.latency_floor = latency if self.latency_floor is None else min(self.latency_floor, latency)
+        if not self.adaptive:
+            return
+
+        # queueing shows up as latency before it shows up as 429s, stop growing once it does
+        if self.latency_ewma <= LATENCY_TOLERANCE * self.latency_floor:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def on_rate_limit(
+        self,
+        retry_after=None,
+    ):
+        if retry_after:
+            self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+        if self.adaptive:
+            self._decrease(0.5)
+
+    def on_transient_error(
+        self,
+    ):
+        if self.adaptive:
+            self._decrease(0.75)
+
+class MicroBatcher:
+    # turns single calls into batches of up to batch_size for backends that run many samples per call;
+    # a partial batch goes out after max_wait_s, and batch_fn may return an exception for one item
+    # so only that job is retried
+    def __init__(
+        self,
+        batch_fn,
+        batch_size: int = 1,
+        max_wait_s: float = BATCH_WAIT_S,
+    ):
+        self.batch_fn = batch_fn
+        self.batch_size = batch_size
+        self.max_wait_s = max_wait_s
+        self.pending = []
+        self.timer = None
+        self.task_set = set()
+
+    async def submit(
+        self,
+        item,
+    ):
+        if self.batch_size <= 1:
+            out = (await self.batch_fn([item]))[0]
+            if isinstance(out, Exception):
+                raise out
+            return out
+
+        future = asyncio.get_running_loop().create_future()
+        self.pending += [(item, future)]
+        if len(self.pending) >= self.batch_size:
+            self._flush()
+        elif self.timer is None:
+            self.timer = asyncio.get_running_loop().call_later(self.max_wait_s, self._flush)
+        return await future
+
+    def _flush(
+        self,
+    ):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        batch, self.pending = self.pending, []
+        if batch:
+            task = asyncio.create_task(self._run_batch(batch))
+            self.task_set.add(task)
+            task.add_done_callback(self.task_set.discard)
+
+    async def _run_batch(
+        self,
+        batch,
+    ):
+        try:
+            out_list = await self.batch_fn([item for item, _ in batch])
+        except Exception as e:
+            out_list = [e] * len(batch)
+        for (_, future), out in zip(batch, out_list):
+            if future.done():
+                continue
+            if isinstance(out, Exception):
+                future.set_exception(out)
+            else:
+                future.set_result(out)
+
+def backoff_delay(
+    attempt,
+    retry_after=None,
+):
+    # server hint wins, otherwise exponential backoff with full jitter
+    if retry_after:
+        return retry_after + random.uniform(0, BACKOFF_BASE)
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+def classify_error(
+    e,
+):
+    # returns (transient, rate_limited, retry_after), callers plug in API specific rules
+    if isinstance(e, (asyncio.TimeoutError, ConnectionError)):
+        return True, False, None
+    return False, False, None
+
+async def call_with_retries(
+    call_fn,
+    limiter: AdaptiveLimiter,
+    classify_fn = classify_error,
+    max_retries: int = MAX_RETRIES,
+):
+    attempt = 0
+    while True:
+        await limiter.acquire()
+        start = time.perf_counter()
+        try:
+            out = await call_fn()
+        except Exception as e:
+            await limiter.release()
+            transient, rate_limited, retry_after = classify_fn(e)
+            if rate_limited:
+                limiter.on_rate_limit(retry_after)
+            elif transient:
+                limiter.on_transient_error()
+
+            if not (transient or rate_limited) or attempt >= max_retries:
+                return {
+                    'answer': '',
+                    'status': 'failed',
+                    'error': f"{type(e).__name__}: {e}",
+                    'retries': attempt,
+                    'latency': time.perf_counter() - start,
+                }
+            await asyncio.sleep(backoff_delay(attempt, retry_after))
+            attempt += 1
+            continue
+
+        latency = time.perf_counter() - start
+        await limiter.release()
+        limiter.on_success(latency)
+        return {
+            **out,
+            'status': 'ok',
+            'retries': attempt,
+            'latency': latency,
+        }
+
+async def run_job(
+    job,
+    infer_fn,
+    limiter: AdaptiveLimiter,
+    classify_fn = classify_error,
+    max_retries: int = MAX_RETRIES,
+    lookup_fn = None,
+):
+    out = None
+    if lookup_fn is not None:
+        out = await lookup_fn(job)
+    if out is None:
+        out = await call_with_retries(
+            call_fn=lambda: infer_fn(job),
+            limiter=limiter,
+            classify_fn=classify_fn,
+            max_retries=max_retries,
+        )
+    return out
+
+async def run_jobs(
+    job_list: list,
+    infer_fn,
+    concurrency: int = CONCURRENCY,
+    max_concurrency: int = MAX_CONCURRENCY,
+    adaptive: bool = True,
+    classify_fn = classify_error,
+    max_retries: int = MAX_RETRIES,
+    lookup_fn = None,
+    on_result = None,
+):
+    # a fixed pool of workers takes jobs in order, so at most max_concurrency jobs are past lookup
+    # at any time and whatever they share (images, cache rows) is still hot when the request goes out;
+    # lookup_fn(job) may answer a job without a request (cache hit), on_result(job, out) sees every result,
+    # infer_fn raises on failure and a job that still fails after retries is returned with status 'failed'
+    limiter = AdaptiveLimiter(
+        initial=concurrency,
+        max_limit=max_concurrency if adaptive else concurrency,
+        adaptive=adaptive,
+    )
+    out_list = [None] * len(job_list)
+    job_iter = iter(enumerate(job_list))
+    from tqdm import tqdm
+    progress = tqdm(total=len(job_list))
+
+    async def worker():
+        for idx, job in job_iter:
+            out = await run_job(job, infer_fn, limiter, classify_fn, max_retries, lookup_fn)
+            if on_result is not None:
+                on_result(job, out)
+            out_list[idx] = out
+            progress.update(1)
+
+    try:
+        await asyncio.gather(*[worker() for _ in range(min(int(limiter.max_limit), max(1, len(job_list))))])
+    finally:
+        progress.close()
+    return out_list
+
+_STREAM_END = object()
+
+async def run_job_stream(
+    job_iter,
+    infer_fn,
+    total: int = None,
+    queue_size: int = QUEUE_SIZE,
+    concurrency: int = CONCURRENCY,
+    max_concurrency: int = MAX_CONCURRENCY,
+    adaptive: bool = True,
+    classify_fn = classify_error,
+    max_retries: int = MAX_RETRIES,
+    lookup_fn = None,
+    on_result = None,
+):
+    # like run_jobs, but jobs come from a (possibly slow, e.g. rendering) iterator that is advanced in a
+    # thread and feeds a bounded queue, so producing the next jobs overlaps with requests in flight and
+    # at most queue_size jobs wait in memory; results are only delivered through on_result
+    limiter = AdaptiveLimiter(
+        initial=concurrency,
+        max_limit=max_concurrency if adaptive else concurrency,
+        adaptive=adaptive,
+    )
+    num_workers = int(limiter.max_limit)
+    job_queue = asyncio.Queue(maxsize=queue_size)
+    from tqdm import tqdm
+    progress = tqdm(total=total)
+    done_num = 0
+
+    async def producer():
+        try:
+            while True:
+                job = await asyncio.to_thread(next, job_iter, _STREAM_END)
+                if job is _STREAM_END:
+                    break
+                await job_queue.put(job)
+        finally:
+            for _ in range(num_workers):
+                await job_queue.put(_STREAM_END)
+
+    async def worker():
+        nonlocal done_num
+        while True:
+            job = await job_queue.get()
+            if job is _STREAM_END:
+                return
+            out = await run_job(job, infer_fn, limiter, classify_fn, max_retries, lookup_fn)
+            if on_result is not None:
+                on_result(job, out)
+            done_num += 1
+            progress.update(1)
+
+    task_list = [asyncio.create_task(producer())] + [asyncio.create_task(worker()) for _ in range(num_workers)]
+    try:
+        await asyncio.gather(*task_list)
+    finally:
+        for task in task_list:
+            task.cancel()
+        progress.close()
+    return done_num
@@ -0,0 +1,51 @@
+"""
+ SPDX-License-Identifier: MIT
+ Copyright (c) 2025, yasaisen (clover)
+ 
+ This file is part of a project licensed under the MIT License.
+ See the LICENSE file in the project root for more information.
+ 
+ last modified in 2610191230
+"""
+
+import re
+import hashlib
+
+from questionBundle import split_bundle_prompt
+from answerFormat import INSTRUCTION_DICT
+
+
+# offline answers shared by the mock server and DeterministicBackend, kept apart from the HTTP server
+OPTION_PATTERN = re.compile(r"^\s*([A-Z])\.\s*(\w+)", re.MULTILINE)
+
+
+def mock_answer(
+    text, 
+    image_list, 
+):
+    # deterministic: the same image and prompt always pick the same listed option;
+    # a bundled prompt gets one '<n>: <option>' line per question, each answered as if it had been asked alone;
+    # a short answer format instruction or the message layout only changes how the same option is spelled
+    bundle = split_bundle_prompt(text)
+    if bundle is not None:
+        prefix, question_list = bundle
+        return "\n".join(
+            f"{idx + 1}: {mock_answer(prefix + question, image_list)}" for idx, question in enumerate(question_list)
+        )
+    answer_mode = None
+    for mode, instruction in INSTRUCTION_DICT.items():
+        if text.endswith("\n" + instruction):
+            answer_mode = mode
+            text = text[:-len(instruction) - 1]
+    digest = hashlib.sha256(" ".join(text.split()).encode("utf-8"))
+    for image_url in image_list:
+        digest.update(image_url.encode("utf-8"))
+    option_list = OPTION_PATTERN.findall(text)
+    if not option_list:
+        return "A"
+    letter, name = option_list[int(digest.hexdigest(), 16) % len(option_list)]
+    if answer_mode == 'letter':
+        return letter
+    if answer_mode == 'json':
+        return f'{{"option": "{letter}"}}'
+    return f"{letter}. {name}"
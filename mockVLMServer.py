@@ -0,0 +1,371 @@
+"""
+ SPDX-License-Identifier: MIT
+ Copyright (c) 2025, yasaisen (clover)
+ 
+ This file is part of a project licensed under the MIT License.
+ See the LICENSE file in the project root for more information.
+ 
+ last modified in 2610191230
+"""
+
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from mockAnswer import mock_answer
+
+
+LATENCY_MS = 300.0
+LATENCY_SIGMA = 0.5
+ERROR_RATE = 0.0
+RATE_LIMIT_RATE = 0.0
+RETRY_AFTER_MS = 200
+MAX_CONCURRENCY = 0
+LATENCY_PER_MB_MS = 0.0
+LATENCY_PER_1K_TOKENS_MS = 0.0
+IMAGE_TOKENS = 765
+# provider-side prompt caching: prompts of at least 1024 tokens reuse earlier prefixes in 128-token steps
+PREFIX_MIN_TOKENS = 1024
+PREFIX_BLOCK_TOKENS = 128
+PREFIX_CACHE_ENTRIES = 65536
+
+
+def message_text(
+    messages, 
+):
+    text_list, image_list = [], []
+    for message in messages:
+        content = message.get('content')
+        if isinstance(content, str):
+            text_list += [content]
+            continue
+        for part in content or []:
+            if part.get('type') == 'text':
+                text_list += [part['text']]
+            elif part.get('type') == 'image_url':
+                image_list += [part['image_url']['url']]
+    return "\n".join(text_list), image_list
+
+def message_tokens(
+    messages, 
+):
+    # the prompt as a token sequence in message order: four characters of text, or one of an image's IMAGE_TOKENS
+    token_list = []
+    for message in messages:
+        content = message.get('content')
+        part_list = [{'type': 'text', 'text': content}] if isinstance(content, str) else content or []
+        token_list += [f"<{message.get('role')}>"]
+        for part in part_list:
+            if part.get('type') == 'text':
+                token_list += [part['text'][idx:idx + 4] for idx in range(0, len(part['text']), 4)]
+            elif part.get('type') == 'image_url':
+                image_sha = hashlib.sha1(part['image_url']['url'].encode('utf-8')).hexdigest()
+                token_list += [f"<{image_sha}:{idx}>" for idx in range(IMAGE_TOKENS)]
+    return token_list
+
+class PrefixCache:
+    # stand-in for provider-side prompt caching: the token sequence is hashed in PREFIX_BLOCK_TOKENS blocks,
+    # each hash covering everything before it, and the leading blocks seen before count as cached
+    def __init__(
+        self, 
+        min_tokens: int = PREFIX_MIN_TOKENS, 
+        max_entries: int = PREFIX_CACHE_ENTRIES, 
+    ):
+        self.min_tokens = min_tokens
+        self.max_entries = max_entries
+        self.block_dict = OrderedDict()
+        self.lock = threading.Lock()
+
+    def lookup(
+        self, 
+        messages, 
+    ):
+        token_list = message_tokens(messages)
+        if len(token_list) < self.min_tokens:
+            return 0
+        digest = hashlib.sha1()
+        key_list = []
+        for start in range(0, len(token_list) - PREFIX_BLOCK_TOKENS + 1, PREFIX_BLOCK_TOKENS):
+            digest.update("\x00".join(token_list[start:start + PREFIX_BLOCK_TOKENS]).encode('utf-8'))
+            key_list += [digest.copy().hexdigest()]
+
+        cached_blocks = 0
+        with self.lock:
+            for key in key_list:
+                if key not in self.block_dict:
+                    break
+                cached_blocks += 1
+            for key in key_list:
+                self.block_dict[key] = True
+                self.block_dict.move_to_end(key)
+            while len(self.block_dict) > self.max_entries:
+                self.block_dict.popitem(last=False)
+        return cached_blocks * PREFIX_BLOCK_TOKENS
+
+def mock_usage(
+    text, 
+    image_list, 
+    answer, 
+    cached_tokens: int = 0, 
+):
+    prompt_tokens = len(text) // 4 + IMAGE_TOKENS * len(image_list)
+    completion_tokens = max(1, len(answer) // 4)
+    return {
+        'prompt_tokens': prompt_tokens, 
+        'completion_tokens': completion_tokens, 
+        'total_tokens': prompt_tokens + completion_tokens, 
+        'prompt_tokens_details': {'cached_tokens': min(cached_tokens, prompt_tokens)}, 
+    }
+
+def mock_completion(
+    body, 
+    prefix_cache: PrefixCache = None, 
+):
+    # chat.completion response for a chat-completions request body, prefix_cache reports cached prompt tokens
+    text, image_list = message_text(body.get('messages', []))
+    answer = mock_answer(text, image_list)
+    cached_tokens = prefix_cache.lookup(body.get('messages', [])) if prefix_cache is not None else 0
+    return {
+        'id': f"chatcmpl-mock-{hashlib.sha1(text.encode('utf-8')).hexdigest()[:12]}", 
+        'object': 'chat.completion', 
+        'created': int(time.time()), 
+        'model': body.get('model', 'mock'), 
+        'choices': [{
+            'index': 0, 
+            'message': {'role': 'assistant', 'content': answer}, 
+            'finish_reason': 'stop', 
+        }], 
+        'usage': mock_usage(text, image_list, answer, cached_tokens=cached_tokens), 
+    }
+
+def write_mock_batch_output(
+    input_path_list, 
+    output_path, 
+    error_rate: float = ERROR_RATE, 
+    seed: int = None, 
+):
+    # answers Batch API request files offline in the Batch API output format, error_rate of the lines fail
+    rng = random.Random(seed)
+    line_num = 0
+    with open(output_path, 'w', encoding='utf-8') as output_file:
+        for input_path in input_path_list:
+            with open(input_path, 'r', encoding='utf-8') as input_file:
+                for line in input_file:
+                    request = json.loads(line)
+                    line_num += 1
+                    if rng.random() < error_rate:
+                        response = {'status_code': 500, 'request_id': f"req-mock-{line_num}", 
+                                    'body': {'error': {'message': 'Internal error (mock)', 'type': 'server_error'}}}
+                    else:
+                        response = {'status_code': 200, 'request_id': f"req-mock-{line_num}", 
+                                    'body': mock_completion(request['body'])}
+                    output_file.write(json.dumps({
+                        'id': f"batch_req_mock_{line_num}", 
+                        'custom_id': request['custom_id'], 
+                        'response': response, 
+                        'error': None, 
+                    }) + "\n")
+    return output_path
+
+class MockConfig:
+    def __init__(
+        self, 
+        latency_ms: float = LATENCY_MS, 
+        latency_sigma: float = LATENCY_SIGMA, 
+        error_rate: float = ERROR_RATE, 
+        rate_limit_rate: float = RATE_LIMIT_RATE, 
+        retry_after_ms: int = RETRY_AFTER_MS, 
+        max_concurrency: int = MAX_CONCURRENCY, 
+        seed: int = None, 
+        latency_per_mb_ms: float = LATENCY_PER_MB_MS, 
+        prefix_min_tokens: int = PREFIX_MIN_TOKENS, 
+        latency_per_1k_tokens_ms: float = LATENCY_PER_1K_TOKENS_MS, 
+    ):
+        # latency is lognormal around latency_ms; max_concurrency > 0 answers 429 above that many requests in flight
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after_ms = retry_after_ms
+        self.max_concurrency = max_concurrency
+        # extra latency per MB of request body, stands in for upload and image tokenization cost
+        self.latency_per_mb_ms = latency_per_mb_ms
+        # extra latency per 1k prompt tokens that missed the prefix cache, stands in for prefill
+        self.latency_per_1k_tokens_ms = latency_per_1k_tokens_ms
+        self.prefix_cache = PrefixCache(min_tokens=prefix_min_tokens)
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.counters = {'requests': 0, 'ok': 0, 'errors': 0, 'rate_limited': 0}
+
+    def draw(
+        self, 
+    ):
+        with self.lock:
+            roll = self.rng.random()
+            latency_s = self.latency_ms / 1000 * self.rng.lognormvariate(0, self.latency_sigma)
+        return roll, latency_s
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(
+        self, 
+        format, 
+        *args, 
+    ):
+        pass
+
+    def _send_json(
+        self, 
+        status, 
+        body, 
+        headers=None, 
+    ):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_stream(
+        self, 
+        completion, 
+        stream_options, 
+        headers=None, 
+    ):
+        # server-sent chat.completion.chunk events: role, the answer, finish, then usage if asked for
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.close_connection = True
+
+        base = {key: completion[key] for key in ('id', 'created', 'model')}
+        chunk_list = [
+            {'index': 0, 'delta': {'role': 'assistant', 'content': ''}, 'finish_reason': None}, 
+            {'index': 0, 'delta': {'content': completion['choices'][0]['message']['content']}, 'finish_reason': None}, 
+            {'index': 0, 'delta': {}, 'finish_reason': 'stop'}, 
+        ]
+        event_list = [{**base, 'object': 'chat.completion.chunk', 'choices': [choice]} for choice in chunk_list]
+        if stream_options.get('include_usage'):
+            event_list += [{**base, 'object': 'chat.completion.chunk', 'choices': [], 'usage': completion['usage']}]
+        for event in event_list:
+            self.wfile.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def do_POST(
+        self, 
+    ):
+        config = self.server.config
+        raw_body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = json.loads(raw_body or b"{}")
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {'error': {'message': f"unknown path {self.path}", 'type': 'invalid_request_error'}})
+            return
+
+        with config.lock:
+            config.counters['requests'] += 1
+            config.in_flight += 1
+            over_capacity = config.max_concurrency > 0 and config.in_flight > config.max_concurrency
+        try:
+            roll, latency_s = config.draw()
+            if over_capacity or roll < config.rate_limit_rate:
+                with config.lock:
+                    config.counters['rate_limited'] += 1
+                self._send_json(429, {'error': {'message': 'Rate limit reached (mock)', 'type': 'rate_limit_error'}}, 
+                        headers={'retry-after-ms': str(config.retry_after_ms)})
+                return
+
+            failed = roll < config.rate_limit_rate + config.error_rate
+            completion = None if failed else mock_completion(body, prefix_cache=config.prefix_cache)
+            latency_s += config.latency_per_mb_ms / 1000 * len(raw_body) / (1024 * 1024)
+            if completion is not None:
+                usage = completion['usage']
+                uncached_tokens = usage['prompt_tokens'] - usage['prompt_tokens_details']['cached_tokens']
+                latency_s += config.latency_per_1k_tokens_ms / 1000 * uncached_tokens / 1000
+            time.sleep(latency_s)
+            if failed:
+                with config.lock:
+                    config.counters['errors'] += 1
+                self._send_json(500, {'error': {'message': 'Internal error (mock)', 'type': 'server_error'}})
+                return
+
+            with config.lock:
+                config.counters['ok'] += 1
+            processing_ms = {'openai-processing-ms': str(round(latency_s * 1000))}
+            if body.get('stream'):
+                self._send_stream(completion, body.get('stream_options') or {}, headers=processing_ms)
+            else:
+                self._send_json(200, completion, headers=processing_ms)
+        finally:
+            with config.lock:
+                config.in_flight -= 1
+
+def start_mock_server(
+    host: str = "127.0.0.1", 
+    port: int = 0, 
+    **config_kwargs, 
+):
+    # serves in a daemon thread, returns (server, base_url); port=0 picks a free port
+    server = ThreadingHTTPServer((host, port), MockHandler)
+    server.daemon_threads = True
+    server.config = MockConfig(**config_kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="local OpenAI-compatible chat-completions mock")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency-ms", type=float, default=LATENCY_MS)
+    parser.add_argument("--latency-sigma", type=float, default=LATENCY_SIGMA)
+    parser.add_argument("--error-rate", type=float, default=ERROR_RATE)
+    parser.add_argument("--rate-limit-rate", type=float, default=RATE_LIMIT_RATE)
+    parser.add_argument("--retry-after-ms", type=int, default=RETRY_AFTER_MS)
+    parser.add_argument("--max-concurrency", type=int, default=MAX_CONCURRENCY)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--latency-per-mb-ms", type=float, default=LATENCY_PER_MB_MS)
+    parser.add_argument("--prefix-min-tokens", type=int, default=PREFIX_MIN_TOKENS, 
+                        help="shortest prompt whose prefix is cached")
+    parser.add_argument("--latency-per-1k-tokens-ms", type=float, default=LATENCY_PER_1K_TOKENS_MS, 
+                        help="extra latency per 1k uncached prompt tokens")
+    parser.add_argument("--batch-input", nargs="+", default=None, help="answer these Batch API request files offline and exit")
+    parser.add_argument("--batch-output", default="mockBatchOutput.jsonl")
+    args = parser.parse_args()
+
+    if args.batch_input:
+        print(write_mock_batch_output(args.batch_input, args.batch_output, error_rate=args.error_rate, seed=args.seed))
+        raise SystemExit(0)
+
+    server, base_url = start_mock_server(
+        host=args.host, 
+        port=args.port, 
+        latency_ms=args.latency_ms, 
+        latency_sigma=args.latency_sigma, 
+        error_rate=args.error_rate, 
+        rate_limit_rate=args.rate_limit_rate, 
+        retry_after_ms=args.retry_after_ms, 
+        max_concurrency=args.max_concurrency, 
+        seed=args.seed, 
+        latency_per_mb_ms=args.latency_per_mb_ms, 
+        prefix_min_tokens=args.prefix_min_tokens, 
+        latency_per_1k_tokens_ms=args.latency_per_1k_tokens_ms, 
+    )
+    print(f"mock chat-completions server at {base_url} (set OPENAI_BASE_URL to use it)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,238 @@
+"""
+ SPDX-License-Identifier: MIT
+ Copyright (c) 2025, yasaisen (clover)
+ 
+ This file is part of a project licensed under the MIT License.
+ See the LICENSE file in the project root for more information.
+ 
+ last modified in 2610182230
+"""
+
+import os
+import mmap
+import json
+import argparse
+import numpy as np
+from itertools import groupby
+
+from datasetStore import MetaWriter, iter_meta
+
+
+SHARD_SIZE = 256 * 1024 * 1024
+PACK_HEADER_NAME = 'pack.json'
+PACK_INDEX_NAME = 'images.idx'
+PACK_META_NAME = 'metaList.jsonl'
+PACK_VERSION = 1
+
+# one (shard, offset, length) entry per image, in sample order; several metadata records (questions)
+# may share one image, they are consecutive and carry its img_name
+INDEX_DTYPE = np.dtype([
+    ('shard', '<u4'), 
+    ('offset', '<u8'), 
+    ('length', '<u4'), 
+])
+
+
+def shard_name(
+    shard_idx, 
+):
+    return f"shard_{str(shard_idx).zfill(5)}.bin"
+
+def is_pack(
+    data_path, 
+):
+    return os.path.isfile(os.path.join(data_path, PACK_INDEX_NAME))
+
+class PackWriter:
+    # appends image bytes to fixed-size shards and the matching record to metaList.jsonl,
+    # the index entry goes last so every indexed sample is complete even while writing
+    def __init__(
+        self, 
+        pack_path, 
+        shard_size: int = SHARD_SIZE, 
+    ):
+        os.makedirs(pack_path, exist_ok=True)
+        self.pack_path = pack_path
+        self.shard_size = shard_size
+        self.meta_path = os.path.join(pack_path, PACK_META_NAME)
+        self.meta_writer = MetaWriter(self.meta_path)
+        self.index_file = open(os.path.join(pack_path, PACK_INDEX_NAME), 'wb')
+        self.count = 0
+        self.record_count = 0
+        self.shard_idx = 0
+        self.shard_file = None
+        self._open_shard()
+
+    def _open_shard(
+        self, 
+    ):
+        if self.shard_file is not None:
+            self.shard_file.close()
+        self.shard_file = open(os.path.join(self.pack_path, shard_name(self.shard_idx)), 'wb')
+
+    def write(
+        self, 
+        img_bytes, 
+        record, 
+    ):
+        # record may be a list of records that all refer to this image
+        offset = self.shard_file.tell()
+        if offset > 0 and offset + len(img_bytes) > self.shard_size:
+            self.shard_idx += 1
+            self._open_shard()
+            offset = 0
+        self.shard_file.write(img_bytes)
+        self.shard_file.flush()
+        for sample_record in record if isinstance(record, list) else [record]:
+            self.meta_writer.write(sample_record)
+            self.record_count += 1
+
+        entry = np.array([(self.shard_idx, offset, len(img_bytes))], dtype=INDEX_DTYPE)
+        self.index_file.write(entry.tobytes())
+        self.index_file.flush()
+        self.count += 1
+
+    def close(
+        self, 
+    ):
+        self.shard_file.close()
+        self.index_file.close()
+        self.meta_writer.close()
+        with open(os.path.join(self.pack_path, PACK_HEADER_NAME), 'w', encoding='utf-8') as header_file:
+            json.dump({
+                'version': PACK_VERSION, 
+                'count': self.count, 
+                'records': self.record_count, 
+                'shards': self.shard_idx + 1, 
+                'shard_size': self.shard_size, 
+            }, header_file, indent=4)
+
+class PackReader:
+    # shards are memory-mapped on first use, reading a sample is a slice of the map
+    # instead of an open/read/close per image
+    def __init__(
+        self, 
+        pack_path, 
+    ):
+        self.pack_path = pack_path
+        self.meta_path = os.path.join(pack_path, PACK_META_NAME)
+        self.index = None
+        self.name_dict = None
+        self.shard_list = {}
+        self._load_index()
+
+    def _load_index(
+        self, 
+    ):
+        self.index = np.fromfile(os.path.join(self.pack_path, PACK_INDEX_NAME), dtype=INDEX_DTYPE)
+
+    def _shard(
+        self, 
+        shard_idx, 
+    ):
+        if shard_idx not in self.shard_list:
+            with open(os.path.join(self.pack_path, shard_name(shard_idx)), 'rb') as shard_file:
+                self.shard_list[shard_idx] = mmap.mmap(shard_file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.shard_list[shard_idx]
+
+    def __len__(
+        self, 
+    ):
+        return len(self.index)
+
+    def read(
+        self, 
+        idx, 
+    ):
+        if idx >= len(self.index):
+            # the pack may still be growing, pick up entries written since open
+            self._load_index()
+            if idx >= len(self.index):
+                raise IndexError(f"sample {idx} not in {self.pack_path}")
+        shard_idx, offset, length = self.index[idx].tolist()
+        shard = self._shard(shard_idx)
+        if offset + length > len(shard):
+            shard.close()
+            del self.shard_list[shard_idx]
+            shard = self._shard(shard_idx)
+        return shard[offset:offset + length]
+
+    def get(
+        self, 
+        img_name, 
+    ):
+        if self.name_dict is None or img_name not in self.name_dict:
+            # images are indexed in order of their first record
+            self.name_dict = {}
+            for record in iter_meta(self.meta_path):
+                self.name_dict.setdefault(record['img_name'], len(self.name_dict))
+        return self.read(self.name_dict[img_name])
+
+    def close(
+        self, 
+    ):
+        for shard in self.shard_list.values():
+            shard.close()
+        self.shard_list = {}
+
+_READER_CACHE = {}
+
+def open_pack(
+    pack_path, 
+):
+    # one reader per pack and process, so every setting reuses the same maps
+    pack_path = os.path.abspath(pack_path)
+    if pack_path not in _READER_CACHE:
+        _READER_CACHE[pack_path] = PackReader(pack_path)
+    return _READER_CACHE[pack_path]
+
+def default_pack_path(
+    data_path, 
+):
+    data_path = os.path.normpath(data_path)
+    if data_path.endswith('dataset'):
+        return data_path[:-len('dataset')] + 'pack'
+    return data_path + '_pack'
+
+def convert_to_pack(
+    data_path, 
+    metadata_path, 
+    pack_path: str = None, 
+    shard_size: int = SHARD_SIZE, 
+):
+    # packs an existing image directory + _metaList.json(l) in metadata order, img_name is kept as the key;
+    # consecutive records of one image (several questions) share its single copy
+    if pack_path is None:
+        pack_path = default_pack_path(data_path)
+    if is_pack(pack_path):
+        raise FileExistsError(f"{pack_path} already holds a pack")
+
+    from tqdm import tqdm
+    writer = PackWriter(pack_path, shard_size=shard_size)
+    try:
+        for img_name, record_group in groupby(tqdm(iter_meta(metadata_path)), key=lambda record: record['img_name']):
+            with open(os.path.join(data_path, img_name), 'rb') as image_file:
+                writer.write(image_file.read(), list(record_group))
+    finally:
+        writer.close()
+    print(f"\n{pack_path} ({writer.count} images, {writer.record_count} records, {writer.shard_idx + 1} shards)\n")
+
+    return {
+        'METADATA_PATH': writer.meta_path, 
+        'DATA_PATH': pack_path, 
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="convert an image directory + metadata list into a packed dataset")
+    parser.add_argument("data_path")
+    parser.add_argument("metadata_path")
+    parser.add_argument("--out", default=None)
+    parser.add_argument("--shard-size-mb", type=int, default=SHARD_SIZE // (1024 * 1024))
+    args = parser.parse_args()
+
+    convert_to_pack(
+        data_path=args.data_path, 
+        metadata_path=args.metadata_path, 
+        pack_path=args.out, 
+        shard_size=args.shard_size_mb * 1024 * 1024, 
+    )
@@ -0,0 +1,97 @@
+"""
+ SPDX-License-Identifier: MIT
+ Copyright (c) 2025, yasaisen (clover)
+ 
+ This file is part of a project licensed under the MIT License.
+ See the LICENSE file in the project root for more information.
+ 
+ last modified in 2610181230
+"""
+
+import numpy as np
+
+
+BATCH_SIZE = 64
+MAX_STALL_BATCHES = 200
+MAX_RETRIES = 100
+
+# densest packing of points kept min_sep apart, one point per sqrt(3)/2 * min_sep^2 of area
+HEX_PACKING_AREA = np.sqrt(3) / 2
+
+
+class PlacementError(ValueError):
+    pass
+
+def max_points_for(
+    margin, 
+    min_sep, 
+):
+    # upper bound on how many points fit in the [margin, 1 - margin] square with pairwise distance >= min_sep
+    side = 1 - 2 * margin
+    if side <= 0:
+        return 0
+    if min_sep <= 0:
+        return np.inf
+    return int((side + min_sep) ** 2 / (HEX_PACKING_AREA * min_sep ** 2))
+
+def place_points(
+    num_points, 
+    existing, 
+    margin, 
+    min_sep, 
+    rng, 
+    batch_size: int = BATCH_SIZE, 
+    max_stall_batches: int = MAX_STALL_BATCHES, 
+):
+    placed = np.array(list(existing), dtype=float).reshape(-1, 2)
+    total_points = len(placed) + num_points
+    if total_points > max_points_for(margin, min_sep):
+        raise PlacementError(
+            f"Cannot place {total_points} points with margin={margin} and min_sep={min_sep}, "
+            f"at most {max_points_for(margin, min_sep)} fit"
+        )
+
+    min_sep_sq = min_sep ** 2
+    new_points = []
+    stall_batches = 0
+    while len(new_points) < num_points:
+        # reject a whole batch of candidates against the fixed points in one broadcasted distance check
+        candidates = rng.uniform(margin, 1 - margin, size=(batch_size, 2))
+        if len(placed):
+            dist_sq = ((candidates[:, None, :] - placed[None, :, :]) ** 2).sum(axis=-1)
+            candidates = candidates[(dist_sq >= min_sep_sq).all(axis=1)]
+
+        accepted = []
+        for candidate in candidates:
+            if accepted and (((np.array(accepted) - candidate) ** 2).sum(axis=-1) < min_sep_sq).any():
+                continue
+            accepted += [candidate]
+            if len(new_points) + len(accepted) == num_points:
+                break
+
+        if accepted:
+            stall_batches = 0
+            new_points += [(float(x), float(y)) for x, y in accepted]
+            placed = np.vstack([placed, accepted])
+        else:
+            stall_batches += 1
+            if stall_batches >= max_stall_batches:
+                raise PlacementError(
+                    f"Placed {len(new_points)} of {num_points} points, no candidate fit after "
+                    f"{max_stall_batches * batch_size} draws (margin={margin}, min_sep={min_sep})"
+                )
+
+    return new_points
+
+def retry_placement(
+    place_fn, 
+    max_retries: int = MAX_RETRIES, 
+):
+    # place_fn raises ValueError when the random choice it made has no room, try a bounded number of times
+    last_error = None
+    for _ in range(max_retries):
+        try:
+            return place_fn()
+        except ValueError as e:
+            last_error = e
+    raise PlacementError(f"No valid placement after {max_retries} retries: {last_error}")
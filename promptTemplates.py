@@ -0,0 +1,159 @@
+"""
+ SPDX-License-Identifier: MIT
+ Copyright (c) 2025, yasaisen (clover)
+ 
+ This file is part of a project licensed under the MIT License.
+ See the LICENSE file in the project root for more information.
+ 
+ last modified in 2610191050
+"""
+
+import re
+import argparse
+
+from datasetStore import MetaWriter, iter_meta
+
+
+# question records store the template id, the asked-about points as flat 'a', 'a_color', 'a_x', 'a_y', 'b', ...
+# fields (nested objects would make every line slower to parse) and the answer; prompts are rendered when a
+# setting asks for them, older records carry both prompts as full text
+TEMPLATE_DICT = {
+    'rel': """
+    The figure represents a map with multiple objects. Each object is associated with a name as shown in the figure. Please answer the following multiple-choice question based on the provided information. In which direction is {0} relative to {1}? Available options:
+    A. LowerLeft
+    B. LowerRight
+    C. UpperLeft
+    D. UpperRight.
+    """, 
+    'abs': """
+    The figure represents a map with multiple objects. Each object is associated with a name as shown in the figure. Please answer the following multiple-choice question based on the provided information. Which direction is {0} located in the image? Available options:
+    A. UpperRight
+    B. UpperLeft
+    C. LowerLeft
+    D. LowerRight.
+    """, 
+}
+POINT_KEY_LIST = ['a', 'b']
+# how each viewpoint refers to a point ('object H', 'orange object') and which point field it names
+VIEWPOINT_DICT = {
+    'sybVp': ("object {}", ''), 
+    'imgVp': ("{} object", '_color'), 
+}
+VIEWPOINT_PATTERN_DICT = {
+    'sybVp': re.compile(r"^object (\w+)$"), 
+    'imgVp': re.compile(r"^(\w+) object$"), 
+}
+# positions are stored rounded, they document the layout and are not used to render prompts
+POSITION_DIGITS = 4
+
+
+def _template_pattern(
+    template_id, 
+):
+    pattern = re.escape(TEMPLATE_DICT[template_id])
+    for idx in range(TEMPLATE_DICT[template_id].count('{')):
+        pattern = pattern.replace(re.escape(f"{{{idx}}}"), r"(.+?)")
+    return re.compile(f"^{pattern}$", re.DOTALL)
+
+TEMPLATE_PATTERN_DICT = {template_id: _template_pattern(template_id) for template_id in TEMPLATE_DICT}
+def _render_parts(
+    template_id, 
+    test_vp, 
+):
+    # the template split around the point fields it names: ('... is ', [('a_color', ' object relative to '),
+    # ('b_color', ' object? ...')]); joining literals and field values is much cheaper than formatting the text
+    ref_format, field_suffix = VIEWPOINT_DICT[test_vp]
+    field_list = [key + field_suffix for key in POINT_KEY_LIST[:TEMPLATE_PATTERN_DICT[template_id].groups]]
+    literal_list = TEMPLATE_DICT[template_id].format(*[ref_format.format('\0') for _ in field_list]).split('\0')
+    return literal_list[0], list(zip(field_list, literal_list[1:]))
+
+RENDER_PART_DICT = {
+    (template_id, test_vp): _render_parts(template_id, test_vp) for template_id in TEMPLATE_DICT for test_vp in VIEWPOINT_DICT
+}
+
+def point_fields(
+    point_info_list, 
+    positions, 
+):
+    # {'a': 'H', 'a_color': 'orange', 'a_x': 0.1168, 'a_y': 0.4168, 'b': ...} for the points of one question
+    field_dict = {}
+    for key, point_info in zip(POINT_KEY_LIST, point_info_list):
+        x, y = positions[point_info['name']]
+        field_dict.update({
+            key: point_info['name'], 
+            f"{key}_color": point_info['color'], 
+            f"{key}_x": round(float(x), POSITION_DIGITS), 
+            f"{key}_y": round(float(y), POSITION_DIGITS), 
+        })
+    return field_dict
+
+def prompt_for(
+    record, 
+    test_vp, 
+):
+    if 'tem' not in record:
+        return record[f"{test_vp}_promptTem"]
+    prompt, part_list = RENDER_PART_DICT[(record['tem'], test_vp)]
+    for field, literal in part_list:
+        prompt += record[field] + literal
+    return prompt
+
+def compact_record(
+    record, 
+):
+    # a full-text record in the template-id form, records that match no template are kept as they are;
+    # full-text records never had positions, only names and colors come back
+    if 'tem' in record or not all(f"{test_vp}_promptTem" in record for test_vp in VIEWPOINT_DICT):
+        return record
+    for template_id, pattern in TEMPLATE_PATTERN_DICT.items():
+        match_dict = {test_vp: pattern.match(record[f"{test_vp}_promptTem"]) for test_vp in VIEWPOINT_DICT}
+        if any(match is None for match in match_dict.values()):
+            continue
+        field_dict = {}
+        for key_idx, key in enumerate(POINT_KEY_LIST[:pattern.groups]):
+            for test_vp, match in match_dict.items():
+                ref_match = VIEWPOINT_PATTERN_DICT[test_vp].match(match.group(key_idx + 1))
+                if ref_match is None:
+                    return record
+                field_dict[key + VIEWPOINT_DICT[test_vp][1]] = ref_match.group(1)
+        compact = {key: value for key, value in record.items() if not key.endswith('_promptTem')}
+        return {'img_name': compact.pop('img_name'), 'tem': template_id, **field_dict, **compact}
+    return record
+
+def expand_record(
+    record, 
+):
+    # the older full-text form, for tools that read the prompts straight from the metadata
+    if 'tem' not in record:
+        return record
+    point_key_set = {key + suffix for key in POINT_KEY_LIST for suffix in ('', '_color', '_x', '_y')}
+    full = {key: value for key, value in record.items() if key != 'tem' and key not in point_key_set}
+    return {
+        'img_name': full.pop('img_name'), 
+        **{f"{test_vp}_promptTem": prompt_for(record, test_vp) for test_vp in VIEWPOINT_DICT}, 
+        **full, 
+    }
+
+def convert_meta(
+    meta_path, 
+    save_path, 
+    compact: bool = True, 
+):
+    # rewrites a metadata list (.json or .jsonl) as indexed JSONL in the compact or the full-text form
+    writer = MetaWriter(save_path)
+    try:
+        for record in iter_meta(meta_path):
+            writer.write(compact_record(record) if compact else expand_record(record))
+    finally:
+        writer.close()
+    print(f"\n{save_path} ({writer.count} records)\n")
+    return save_path
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="convert metadata lists between the full-text and the template-id form")
+    parser.add_argument("meta_path")
+    parser.add_argument("save_path")
+    parser.add_argument("--full", action='store_true', help="write full-text prompts instead of template ids")
+    args = parser.parse_args()
+
+    convert_meta(args.meta_path, args.save_path, compact=not args.full)
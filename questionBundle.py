@@ -0,0 +1,139 @@
+"""
+ SPDX-License-Identifier: MIT
+ Copyright (c) 2025, yasaisen (clover)
+ 
+ This file is part of a project licensed under the MIT License.
+ See the LICENSE file in the project root for more information.
+ 
+ last modified in 2610190100
+"""
+
+import re
+
+
+# bundled results are stored as settings of their own, next to the one-question-per-request baseline
+BUNDLE_SUFFIX = '_bundled'
+BUNDLE_HEADER = (
+    "Answer each of the {num} questions below about the same figure independently. "
+    "Reply with exactly one line per question in the form '<question number>: <option>', "
+    "repeating the chosen option as it is listed, e.g. '1: B. UpperLeft'."
+)
+QUESTION_MARK = "\n\nQuestion {idx}:"
+
+HEADER_PATTERN = re.compile(r"Answer each of the (\d+) questions below about the same figure independently\.")
+QUESTION_PATTERN = re.compile(r"\n\nQuestion (\d+):")
+ANSWER_PATTERN = re.compile(r"^\W*(?:question\s*)?(\d+)\W*?[:.)\-][\s*_`]*(.+?)[\s*_`]*$", re.IGNORECASE)
+
+
+def bundle_prompt(
+    prompt_list, 
+):
+    # the questions are kept verbatim, so any prompt (with or without prompter) can be bundled
+    return BUNDLE_HEADER.format(num=len(prompt_list)) + "".join(
+        QUESTION_MARK.format(idx=idx + 1) + prompt for idx, prompt in enumerate(prompt_list)
+    )
+
+def split_bundle_prompt(
+    text, 
+):
+    # (text before the header, [question prompts]) of a bundled prompt, None for a single question
+    match = HEADER_PATTERN.search(text)
+    if match is None:
+        return None
+    part_list = QUESTION_PATTERN.split(text[match.end():])
+    return text[:match.start()], part_list[2::2]
+
+def parse_bundle_answer(
+    answer, 
+    num_questions, 
+):
+    # one answer per question, None where the reply has no line for it; the first line for a number wins
+    answer_list = [None] * num_questions
+    for line in answer.splitlines():
+        match = ANSWER_PATTERN.match(line)
+        if match is None:
+            continue
+        question_idx = int(match.group(1)) - 1
+        if 0 <= question_idx < num_questions and answer_list[question_idx] is None:
+            answer_list[question_idx] = match.group(2)
+    return answer_list
+
+def bundle_max_tokens(
+    member_list, 
+):
+    # short answer modes give each question a small budget, the bundle gets their sum
+    if any(member.get('max_tokens') is None for member in member_list):
+        return None
+    return sum(member['max_tokens'] for member in member_list)
+
+def bundle_jobs(
+    job_list, 
+    bundle_size, 
+):
+    # consecutive jobs on the same image (build_job_list queues them image-major) become one request of up
+    # to bundle_size questions; the original jobs ride along as 'members'
+    bundle_list = []
+    member_list = []
+
+    def flush():
+        bundle_list.append({
+            'setting_idx': member_list[0]['setting_idx'], 
+            'sample_idx': member_list[0]['sample_idx'], 
+            'prompt': bundle_prompt([member['prompt'] for member in member_list]), 
+            'data_path': member_list[0]['data_path'], 
+            'img_name': member_list[0]['img_name'], 
+            'max_tokens': bundle_max_tokens(member_list), 
+            'layout': member_list[0].get('layout'), 
+            'members': list(member_list), 
+        })
+        member_list.clear()
+
+    for job in job_list:
+        if member_list and (
+            len(member_list) >= bundle_size
+            or (job['data_path'], job['img_name']) != (member_list[0]['data_path'], member_list[0]['img_name'])
+        ):
+            flush()
+        member_list.append(job)
+    if member_list:
+        flush()
+    return bundle_list
+
+def share_usage(
+    usage, 
+    num_questions, 
+    bundle_pos, 
+):
+    # each question gets an even share of the request's tokens, the first one also the remainder
+    if usage is None:
+        return None
+    return {
+        key: value // num_questions + (value % num_questions if bundle_pos == 0 else 0) for key, value in usage.items()
+    }
+
+def split_bundle_result(
+    job, 
+    out, 
+):
+    # (member job, member out) per question of a bundled request; tokens are shared out over the questions
+    # and the payload is booked on the first one, so report totals still count every request once
+    member_list = job['members']
+    if out['status'] == 'ok':
+        answer_list = parse_bundle_answer(out['answer'], len(member_list))
+    else:
+        answer_list = [None] * len(member_list)
+
+    result_list = []
+    for bundle_pos, (member, answer) in enumerate(zip(member_list, answer_list)):
+        member_out = {**out, 'bundle': len(member_list), 'bundle_pos': bundle_pos}
+        member_out['usage'] = share_usage(out.get('usage'), len(member_list), bundle_pos)
+        if bundle_pos > 0:
+            member_out['payload_bytes'] = None
+        if answer is not None:
+            member_out['answer'] = answer
+        else:
+            member_out['answer'] = ''
+            member_out['status'] = 'failed'
+            member_out['error'] = out.get('error') or f"no answer for question {bundle_pos + 1} in the bundled reply"
+        result_list += [(member, member_out)]
+    return result_list
@@ -0,0 +1,124 @@
+"""
+ SPDX-License-Identifier: MIT
+ Copyright (c) 2025, yasaisen (clover)
+ 
+ This file is part of a project licensed under the MIT License.
+ See the LICENSE file in the project root for more information.
+ 
+ last modified in 2610181448
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+
+
+CACHE_PATH = os.path.join(os.getcwd(), 'vlmResponseCache.sqlite')
+MAX_ENTRIES = 200000
+
+
+def sha256_bytes(
+    data: bytes, 
+):
+    return hashlib.sha256(data).hexdigest()
+
+class ResponseCache:
+    # content-addressed completions: key = sha256(model, max_tokens, final prompt, image sha),
+    # least recently used entries are evicted once max_entries is exceeded
+    def __init__(
+        self, 
+        cache_path: str = CACHE_PATH, 
+        max_entries: int = MAX_ENTRIES, 
+    ):
+        self.cache_path = cache_path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self.conn = sqlite3.connect(cache_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, model TEXT, answer TEXT, created REAL, last_access REAL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self.conn.commit()
+        self.entries = self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def make_key(
+        model, 
+        max_tokens, 
+        prompt, 
+        image_sha, 
+        **request_options, 
+    ):
+        # anything else that changes the completion (answer mode, message layout, ...) goes in request_options
+        payload = json.dumps(
+            [model, max_tokens, prompt, image_sha, sorted(request_options.items())], 
+            ensure_ascii=False, 
+        )
+        return sha256_bytes(payload.encode("utf-8"))
+
+    def get(
+        self, 
+        key, 
+    ):
+        row = self.conn.execute("SELECT answer FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+        self.conn.commit()
+        return row[0]
+
+    def put(
+        self, 
+        key, 
+        answer, 
+        model=None, 
+    ):
+        exists = self.conn.execute("SELECT 1 FROM responses WHERE key = ?", (key,)).fetchone() is not None
+        now = time.time()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO responses (key, model, answer, created, last_access) VALUES (?, ?, ?, ?, ?)", 
+            (key, model, answer, now, now), 
+        )
+        if not exists:
+            self.entries += 1
+        if self.entries > self.max_entries:
+            self.evict(self.entries - self.max_entries)
+        self.conn.commit()
+
+    def evict(
+        self, 
+        num_entries, 
+    ):
+        self.conn.execute(
+            "DELETE FROM responses WHERE key IN "
+            "(SELECT key FROM responses ORDER BY last_access LIMIT ?)", 
+            (num_entries,), 
+        )
+        self.evictions += num_entries
+        self.entries = self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def stats(
+        self, 
+    ):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits, 
+            'misses': self.misses, 
+            'hit_rate': self.hits / lookups if lookups else 0.0, 
+            'entries': self.entries, 
+            'evictions': self.evictions, 
+        }
+
+    def close(
+        self, 
+    ):
+        self.conn.close()
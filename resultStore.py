@@ -0,0 +1,116 @@
+"""
+ SPDX-License-Identifier: MIT
+ Copyright (c) 2025, yasaisen (clover)
+ 
+ This file is part of a project licensed under the MIT License.
+ See the LICENSE file in the project root for more information.
+ 
+ last modified in 2610191210
+"""
+
+import os
+import re
+import json
+
+
+def result_file_name(
+    nowtime, 
+    test_setting_name, 
+):
+    return f"testResult_{nowtime}_{test_setting_name}.jsonl"
+
+def find_result_file(
+    result_dir, 
+    test_setting_name, 
+):
+    # newest testResult_<yymmddHHMM>_<setting>.jsonl of exactly this setting, None if there is none
+    pattern = re.compile(rf"^testResult_(\d{{10}})_{re.escape(test_setting_name)}\.jsonl$")
+    found_list = []
+    if os.path.isdir(result_dir):
+        for file_name in os.listdir(result_dir):
+            match = pattern.match(file_name)
+            if match:
+                found_list += [(match.group(1), file_name)]
+    if not found_list:
+        return None
+    return os.path.join(result_dir, max(found_list)[1])
+
+def resolve_result_path(
+    result_dir, 
+    test_setting_name, 
+    nowtime, 
+    resume: bool = False, 
+):
+    if resume:
+        result_path = find_result_file(result_dir, test_setting_name)
+        if result_path is not None:
+            return result_path
+    return os.path.join(result_dir, result_file_name(nowtime, test_setting_name))
+
+def load_results(
+    result_path, 
+):
+    # index -> record, a later record of the same index (e.g. a retried failure) replaces the earlier one;
+    # a torn last line from a crash is ignored
+    record_dict = {}
+    if not os.path.exists(result_path):
+        return record_dict
+    with open(result_path, 'r', encoding='utf-8') as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            record_dict[record['index']] = record
+    return record_dict
+
+def trim_torn_line(
+    result_path, 
+):
+    # cuts a file back to its last newline, so a record appended after a crash does not land on a torn line
+    if not os.path.exists(result_path):
+        return
+    with open(result_path, 'rb+') as file:
+        end = file.seek(0, os.SEEK_END)
+        pos = end
+        while pos > 0:
+            step = min(4096, pos)
+            file.seek(pos - step)
+            newline = file.read(step).rfind(b'\n')
+            if newline >= 0:
+                pos = pos - step + newline + 1
+                break
+            pos -= step
+        if pos < end:
+            file.truncate(pos)
+
+class ResultWriter:
+    # one JSONL file per setting, every record is flushed as soon as it is written;
+    # a resumed run appends to the files, a fresh one replaces a file of the same name
+    # (result names only have minute resolution, so two runs in one minute share it)
+    def __init__(
+        self, 
+        result_path_list: list, 
+        resume: bool = False, 
+    ):
+        self.file_list = []
+        for result_path in result_path_list:
+            os.makedirs(os.path.dirname(os.path.abspath(result_path)), exist_ok=True)
+            if resume:
+                trim_torn_line(result_path)
+            self.file_list += [open(result_path, 'a' if resume else 'w', encoding='utf-8')]
+
+    def write(
+        self, 
+        setting_idx, 
+        record, 
+    ):
+        file = self.file_list[setting_idx]
+        file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        file.flush()
+
+    def close(
+        self, 
+    ):
+        for file in self.file_list:
+            file.close()
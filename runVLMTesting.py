@@ -5,28 +5,45 @@
  This file is part of a project licensed under the MIT License.
  See the LICENSE file in the project root for more information.
  
- last modified in 2507131536
+ last modified in 2610191240
 """
 
 import os
-import openai
-import base64
-import os
+import re
+import sys
 from datetime import datetime
-from tqdm import tqdm
-import json
-
-from RELdatasetMaker import gen_reldataset, save_list2json
-from ABSdatasetMaker import gen_absdataset
+import asyncio
+import time
+import argparse
 
+# the dataset makers (matplotlib, tqdm) and openai are imported only on the paths that use them,
+# so evaluating or reporting on existing datasets starts without them
+from inferenceEngine import run_jobs, run_job_stream, MicroBatcher, CONCURRENCY, QUEUE_SIZE
+from responseCache import ResponseCache, CACHE_PATH, MAX_ENTRIES
+from imageStore import EncodedImageCache, encode_image, IMAGE_CACHE_SIZE, IMAGE_QUALITY
+from resultStore import resolve_result_path, find_result_file, load_results, ResultWriter
+from datasetStore import MetaWriter, load_meta_list
+from packStore import is_pack, PACK_META_NAME
+from batchStore import BatchRequestWriter, make_custom_id, parse_custom_id, iter_batch_output
+from vlmBackends import VLMBackend, OpenAIBackend, get_backend, build_messages, MESSAGE_LAYOUT_LIST
+from usageReport import (
+    summarize_records, report_path_for, write_report, print_report_table, print_delta_table, load_report, BATCH_PRICE_SCALE, 
+)
+from promptTemplates import prompt_for
+from questionBundle import bundle_jobs, split_bundle_result, BUNDLE_SUFFIX
+from answerFormat import (
+    format_prompt, answer_max_tokens, answer_mode_suffix, is_structured, parse_options, parse_choice, ANSWER_MODE_LIST, 
+)
 
-openai.api_key = ""  # TODO: Replace with your api key
 
+API_KEY = ""  # TODO: Replace with your api key
+# point at any OpenAI-compatible endpoint, e.g. the local mock in mockVLMServer.py
+BASE_URL = os.environ.get("OPENAI_BASE_URL")
+MODEL_NAME = "gpt-4.1-nano-2025-04-14"
+MAX_TOKENS = 512
+# sent to a base_url endpoint when no key is configured, the mock server does not check it
+PLACEHOLDER_API_KEY = "no-key"
 
-def load_json_data(file_path):
-    with open(file_path, 'r', encoding='utf-8') as file:
-        data = json.load(file)
-        return data
 
 def prompter(
     prompt
@@ -36,34 +53,415 @@ def prompter(
 
     return prompt.replace(target_str, add_str + target_str)
 
-def run_vlm_inference(
-    prompt, 
-    img_path
+def make_backend(
+    backend = None, 
+    base_url: str = None, 
 ):
-    with open(img_path, "rb") as image_file:
-        base64_img = base64.b64encode(image_file.read()).decode("utf-8")
+    # None / 'openai' is the chat-completions endpoint configured above, other names come from vlmBackends;
+    # a missing API key stops the run before any result file is opened, an OpenAI-compatible base_url
+    # (e.g. the mock) that needs none gets a placeholder
+    if backend is None or backend == 'openai':
+        base_url = base_url or BASE_URL
+        api_key = API_KEY or os.environ.get("OPENAI_API_KEY") or getattr(sys.modules.get('openai'), 'api_key', None)
+        if not api_key:
+            if base_url is None:
+                raise SystemExit(
+                    "No OpenAI API key: set OPENAI_API_KEY (or API_KEY in runVLMTesting.py), "
+                    "or pass --base-url / --backend deterministic"
+                )
+            api_key = PLACEHOLDER_API_KEY
+        return OpenAIBackend(
+            model_name=MODEL_NAME, 
+            max_tokens=MAX_TOKENS, 
+            base_url=base_url, 
+            api_key=api_key, 
+        )
+    return get_backend(backend)
 
-    messages = [
-        {"role": "system", "content": "You are a helpful visual assistant."},
-        {"role": "user", "content": [
-            {"type": "text", "text": prompt},
-            {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{base64_img}"}}
-        ]}
-    ]
+async def run_vlm_jobs(
+    job_list: list, 
+    concurrency: int = CONCURRENCY, 
+    cache: ResponseCache = None, 
+    image_cache: EncodedImageCache = None, 
+    on_result = None, 
+    base_url: str = None, 
+    adaptive: bool = True, 
+    total: int = None, 
+    queue_size: int = QUEUE_SIZE, 
+    backend: VLMBackend = None, 
+):
+    # jobs carry prompt, data_path and img_name; images come from the shared LRU so consecutive jobs
+    # on one image reuse its encoded payload, cache hits and duplicates of an in-flight request are
+    # answered in lookup_fn before the limiter so only real requests drive the concurrency window;
+    # a job may also carry its encoded image as 'payload' (streamed samples that never hit the disk),
+    # and a job iterator instead of a list is run as a stream, results then only go to on_result;
+    # requests go to the backend in batches of its batch_size, the window fits two so the next one fills meanwhile
+    backend = make_backend(backend, base_url=base_url)
+    if backend.batch_size > 1:
+        concurrency = max(concurrency, 2 * backend.batch_size)
+    if image_cache is None:
+        image_cache = EncodedImageCache()
+    inflight_dict = {}
 
-    try:
-        response = openai.chat.completions.create(
-            model="gpt-4.1-nano-2025-04-14", # Run GPT-4o
-            messages=messages,
-            max_tokens=512
+    async def lookup_fn(job):
+        # the payload stays on the job until its result is in, so an LRU eviction meanwhile costs nothing
+        if 'payload' not in job:
+            if image_cache.transcodes:
+                job['payload'] = await asyncio.to_thread(image_cache.get, job['data_path'], job['img_name'])
+            else:
+                job['payload'] = image_cache.get(job['data_path'], job['img_name'])
+        payload = job['payload']
+        if cache is None:
+            return None
+
+        job['cache_key'] = cache.make_key(
+            backend.model_name, job.get('max_tokens') or backend.max_tokens, job['prompt'], payload['sha'], 
+            **({'layout': job['layout']} if job.get('layout') else {}), **backend.cache_scope(), 
+        )
+        if job['cache_key'] in inflight_dict:
+            out = await inflight_dict[job['cache_key']]
+            return {**out, 'cached': out['status'] == 'ok'}
+        answer = cache.get(job['cache_key'])
+        if answer is not None:
+            return {'answer': answer, 'status': 'ok', 'retries': 0, 'latency': 0.0, 'cached': True}
+
+        job['owns_request'] = True
+        inflight_dict[job['cache_key']] = asyncio.get_running_loop().create_future()
+        return None
+
+    result_fn = on_result
+
+    def on_result(job, out):
+        # stored as soon as it arrives, a crash later in the run keeps everything answered so far
+        payload = job.pop('payload', None)
+        if payload is not None:
+            out = {**out, 'payload_bytes': len(payload['b64'])}
+        if job.pop('owns_request', False):
+            inflight_dict.pop(job['cache_key']).set_result(out)
+            if out['status'] == 'ok':
+                cache.put(job['cache_key'], out['answer'], model=backend.model_name)
+        if result_fn is not None:
+            result_fn(job, {'cached': False, **out})
+
+    batcher = MicroBatcher(backend.run_batch, batch_size=backend.batch_size)
+
+    async def infer_fn(job):
+        return await batcher.submit({
+            'prompt': job['prompt'], 
+            'payload': job['payload'], 
+            'max_tokens': job.get('max_tokens'), 
+            'layout': job.get('layout'), 
+        })
+
+    async with backend:
+        if not isinstance(job_list, list):
+            await run_job_stream(
+                job_iter=job_list, 
+                infer_fn=infer_fn, 
+                total=total, 
+                queue_size=queue_size, 
+                concurrency=concurrency, 
+                adaptive=adaptive, 
+                classify_fn=backend.classify_error, 
+                lookup_fn=lookup_fn, 
+                on_result=on_result, 
+            )
+            return None
+
+        out_list = await run_jobs(
+            job_list=job_list, 
+            infer_fn=infer_fn, 
+            concurrency=concurrency, 
+            adaptive=adaptive, 
+            classify_fn=backend.classify_error, 
+            lookup_fn=lookup_fn, 
+            on_result=on_result, 
+        )
+
+    return [{'cached': False, **out} for out in out_list]
+
+def setting_prompt(
+    setting: dict, 
+    question: dict, 
+):
+    # the final prompt of one question under a setting: viewpoint template, prompter, answer format;
+    # template-id records are rendered here, full-text ones are used as stored
+    prompt = prompt_for(question, setting['test_vp'])
+    if setting.get('prompter') is not None:
+        prompt = setting['prompter'](prompt)
+    return format_prompt(prompt, setting.get('answer_mode'))
+
+def layout_suffix(
+    message_layout: str = None, 
+):
+    return f"_{message_layout}" if message_layout not in (None, 'default') else ''
+
+def with_variants(
+    setting_list: list, 
+    answer_mode: str = None, 
+    message_layout: str = None, 
+):
+    # a short answer_mode ('letter', 'json') or the 'prefix' message layout applies to every setting,
+    # results are then stored as '<setting>_<mode>_<layout>'
+    if not is_structured(answer_mode) and not layout_suffix(message_layout):
+        return setting_list
+    setting_list = [{
+        **setting, 
+        'test_setting_name': setting['test_setting_name'] + answer_mode_suffix(answer_mode) + layout_suffix(message_layout), 
+    } for setting in setting_list]
+    for setting in setting_list:
+        if is_structured(answer_mode):
+            setting['answer_mode'] = answer_mode
+        if layout_suffix(message_layout):
+            setting['message_layout'] = message_layout
+    return setting_list
+
+def build_job_list(
+    setting_list: list, 
+    meta_list: list, 
+    done_list: list = None, 
+):
+    # image-major order: all prompts of one image are queued back to back while its payload is hot,
+    # done_list holds per setting the sample indices that already have an answer
+    job_list = []
+    for idx in range(len(meta_list)):
+        for setting_idx, setting in enumerate(setting_list):
+            if done_list is not None and idx in done_list[setting_idx]:
+                continue
+            job_list += [{
+                'setting_idx': setting_idx, 
+                'sample_idx': idx, 
+                'prompt': setting_prompt(setting, meta_list[idx]), 
+                'data_path': setting['data_path'], 
+                'img_name': meta_list[idx]['img_name'], 
+                'answer_mode': setting.get('answer_mode'), 
+                'max_tokens': answer_max_tokens(setting.get('answer_mode')), 
+                'layout': setting.get('message_layout'), 
+            }]
+    return job_list
+
+def make_result_record(
+    test_setting_name: str, 
+    job: dict, 
+    out: dict, 
+    gt: str, 
+):
+    # a short answer is scored by the option parsed from it, a free-form one by the substring check
+    correct, choice = None, None
+    if out['status'] == 'ok':
+        if is_structured(job.get('answer_mode')):
+            choice = parse_choice(out['answer'], parse_options(job['prompt']))
+            correct = choice == gt
+        else:
+            correct = gt in out['answer']
+    # token usage is only billed for requests that were sent, cache hits carry none
+    usage = (out.get('usage') or {}) if not out['cached'] else {}
+    return {
+        'index': job['sample_idx'], 
+        'img_name': job['img_name'], 
+        'setting': test_setting_name, 
+        'ans': out['answer'], 
+        'gt': gt, 
+        'correct': correct, 
+        'choice': choice, 
+        'status': out['status'], 
+        'latency': out['latency'], 
+        'retries': out['retries'], 
+        'cached': out['cached'], 
+        'error': out.get('error'), 
+        'ttfb': out.get('ttfb'), 
+        'server_ms': out.get('server_ms'), 
+        'prompt_tokens': usage.get('prompt_tokens'), 
+        'completion_tokens': usage.get('completion_tokens'), 
+        'cached_tokens': usage.get('cached_tokens'), 
+        'payload_bytes': out.get('payload_bytes'), 
+        'bundle': out.get('bundle'), 
+        'bundle_pos': out.get('bundle_pos'), 
+    }
+
+def score_test(
+    test_setting_name: str, 
+    meta_list: list, 
+    record_dict: dict, 
+    result_path: str, 
+):
+    # a sample without a record (run cut short) counts as failed
+    test_result_list = []
+    for idx in range(len(meta_list)):
+        record = record_dict.get(idx)
+        if record is None:
+            record = {'index': idx, 'img_name': meta_list[idx]['img_name'], 'setting': test_setting_name, 
+                      'ans': '', 'gt': meta_list[idx]['ans'], 'correct': None, 'status': 'failed'}
+        test_result_list += [record]
+
+    # failed requests are not answers, keep them out of the accuracy instead of scoring them wrong
+    acc_list = []
+    for sample in test_result_list:
+        if sample['status'] != 'ok':
+            continue
+        if sample['correct']:
+            acc_list += [1]
+        else:
+            acc_list += [0]
+    fail_num = len(test_result_list) - len(acc_list)
+    print(f"\n{test_setting_name} acc: {sum(acc_list) / max(1, len(acc_list))} (answered: {len(acc_list)}, failed: {fail_num})")
+
+    print(result_path)
+    return test_result_list
+
+def write_setting_reports(
+    setting_list: list, 
+    result_dict: dict, 
+    result_path_list: list, 
+    model_name: str = None, 
+    wall_s: float = None, 
+    price_scale: float = 1.0, 
+):
+    # one testReport_<nowtime>_<setting>.json next to each result file; settings of one group share
+    # the wall time, so their tokens/sec add up to the group's throughput
+    report_dict = {}
+    for setting_idx, setting in enumerate(setting_list):
+        report = summarize_records(
+            result_dict[setting['test_setting_name']], 
+            model_name=model_name, 
+            wall_s=wall_s, 
+            price_scale=price_scale, 
         )
-        content = response.choices[0].message.content.strip()
+        write_report(report, report_path_for(result_path_list[setting_idx]))
+        report_dict[setting['test_setting_name']] = report
+    return report_dict
+
+def variant_names(
+    test_setting_name: str, 
+):
+    # the setting under every answer mode and message layout, each one-question-per-request and bundled
+    return [
+        test_setting_name + answer_mode_suffix(answer_mode) + layout_suffix(message_layout) + bundle_suffix
+        for answer_mode in ANSWER_MODE_LIST for message_layout in MESSAGE_LAYOUT_LIST for bundle_suffix in ('', BUNDLE_SUFFIX)
+    ]
+
+def baseline_name(
+    test_setting_name: str, 
+):
+    # '<setting>_json_prefix_bundled' -> '<setting>', the free-form one-question-per-request default-layout run
+    if test_setting_name.endswith(BUNDLE_SUFFIX):
+        test_setting_name = test_setting_name[:-len(BUNDLE_SUFFIX)]
+    for message_layout in MESSAGE_LAYOUT_LIST:
+        suffix = layout_suffix(message_layout)
+        if suffix and test_setting_name.endswith(suffix):
+            test_setting_name = test_setting_name[:-len(suffix)]
+    for answer_mode in ANSWER_MODE_LIST:
+        suffix = answer_mode_suffix(answer_mode)
+        if suffix and test_setting_name.endswith(suffix):
+            return test_setting_name[:-len(suffix)]
+    return test_setting_name
+
+def print_baseline_deltas(
+    report_dict: dict, 
+    result_dir: str = None, 
+):
+    # bundled / short-answer / prefix-layout settings against their free-form one-question-per-request baseline,
+    # from this run or the newest result file of it in result_dir
+    if result_dir is None:
+        result_dir = os.getcwd()
+    variant_dict = {name: report for name, report in report_dict.items() if baseline_name(name) != name}
+    if not variant_dict:
+        return
+    baseline_dict = {}
+    for test_setting_name in variant_dict:
+        base_name = baseline_name(test_setting_name)
+        if base_name in report_dict:
+            baseline_dict[test_setting_name] = report_dict[base_name]
+            continue
+        result_path = find_result_file(result_dir, base_name)
+        if result_path is not None:
+            baseline_dict[test_setting_name] = load_report(result_path)
+    print_delta_table(variant_dict, baseline_dict)
+
+def run_setting_group(
+    setting_list: list, 
+    concurrency: int = CONCURRENCY, 
+    cache: ResponseCache = None, 
+    image_cache: EncodedImageCache = None, 
+    result_dir: str = None, 
+    resume: bool = False, 
+    base_url: str = None, 
+    adaptive: bool = True, 
+    backend: VLMBackend = None, 
+    report_dict: dict = None, 
+    bundle_size: int = None, 
+):
+    # every setting in the group reads the same metadata and images;
+    # the per-setting usage reports are written next to the results and added to report_dict if given;
+    # bundle_size > 1 asks up to that many of one image's questions (across settings) in a single request,
+    # results are then stored as '<setting>_bundled'
+    if bundle_size is not None and bundle_size > 1:
+        setting_list = [
+            {**setting, 'test_setting_name': setting['test_setting_name'] + BUNDLE_SUFFIX} for setting in setting_list
+        ]
+    nowtime = datetime.now().strftime("%y%m%d%H%M")
+    setting_names = ', '.join(setting['test_setting_name'] for setting in setting_list)
+    print(f'\ntesting {setting_names} ({nowtime})...')
+    meta_list = load_meta_list(setting_list[0]['metadata_path'])
+
+    if result_dir is None:
+        result_dir = os.getcwd()
+    result_path_list = [
+        resolve_result_path(result_dir, setting['test_setting_name'], nowtime, resume=resume) for setting in setting_list
+    ]
+    # with resume, answered samples are skipped and failed ones are asked again
+    done_list = []
+    for result_path in result_path_list:
+        record_dict = load_results(result_path) if resume else {}
+        done_list += [{idx for idx, record in record_dict.items() if record['status'] == 'ok'}]
+    if resume:
+        print(f"resuming, {sum(len(done) for done in done_list)} answers already recorded")
 
-        return {"answer": content}
+    writer = ResultWriter(result_path_list, resume=resume)
 
-    except Exception as e:
-        print("Error during inference:", e)
-        return {"answer": ""}
+    def on_result(job, out):
+        for member_job, member_out in split_bundle_result(job, out) if 'members' in job else [(job, out)]:
+            writer.write(member_job['setting_idx'], make_result_record(
+                test_setting_name=setting_list[member_job['setting_idx']]['test_setting_name'], 
+                job=member_job, 
+                out=member_out, 
+                gt=meta_list[member_job['sample_idx']]['ans'], 
+            ))
+
+    job_list = build_job_list(setting_list, meta_list, done_list=done_list)
+    if bundle_size is not None and bundle_size > 1:
+        job_list = bundle_jobs(job_list, bundle_size)
+    start = time.perf_counter()
+    try:
+        asyncio.run(run_vlm_jobs(
+            job_list=job_list, 
+            concurrency=concurrency, 
+            cache=cache, 
+            image_cache=image_cache, 
+            on_result=on_result, 
+            base_url=base_url, 
+            adaptive=adaptive, 
+            backend=backend, 
+        ))
+    finally:
+        writer.close()
+    wall_s = time.perf_counter() - start
+
+    # accuracy always comes from what is on disk, so a resumed run scores old and new answers alike
+    result_dict = {}
+    for setting_idx, setting in enumerate(setting_list):
+        result_dict[setting['test_setting_name']] = score_test(
+            test_setting_name=setting['test_setting_name'], 
+            meta_list=meta_list, 
+            record_dict=load_results(result_path_list[setting_idx]), 
+            result_path=result_path_list[setting_idx], 
+        )
+    group_report_dict = write_setting_reports(
+        setting_list, result_dict, result_path_list, model_name=backend.model_name if backend is not None else MODEL_NAME, wall_s=wall_s, 
+    )
+    if report_dict is not None:
+        report_dict.update(group_report_dict)
+    return result_dict
 
 def run_test(
     test_setting_name: str,
@@ -71,60 +469,339 @@ def run_test(
     data_path: str, 
     test_vp: str,
     prompter = None,
+    concurrency: int = CONCURRENCY, 
+    cache: ResponseCache = None, 
+    image_cache: EncodedImageCache = None, 
+    result_dir: str = None, 
+    resume: bool = False, 
+    base_url: str = None, 
+    adaptive: bool = True, 
+    backend = None, 
+    bundle_size: int = None, 
+    answer_mode: str = None, 
+    message_layout: str = None, 
+):
+    backend = make_backend(backend, base_url=base_url)
+    report_dict = {}
+    result_dict = run_setting_group(
+        setting_list=with_variants([{
+            'test_setting_name': test_setting_name, 
+            'metadata_path': metadata_path, 
+            'data_path': data_path, 
+            'test_vp': test_vp, 
+            'prompter': prompter, 
+        }], answer_mode, message_layout), 
+        concurrency=concurrency, 
+        cache=cache, 
+        image_cache=image_cache, 
+        result_dir=result_dir, 
+        resume=resume, 
+        base_url=base_url, 
+        adaptive=adaptive, 
+        backend=backend, 
+        report_dict=report_dict, 
+        bundle_size=bundle_size, 
+    )
+    print_report_table(report_dict)
+    print_baseline_deltas(report_dict, result_dir=result_dir)
+    print(f"backend: {backend.stats()}")
+    return list(result_dict.values())[0]
+
+def iter_stream_jobs(
+    sample_iter, 
+    setting_list: list, 
+    meta_list: list, 
+    data_save_path: str = None, 
+    meta_writer: MetaWriter = None, 
+):
+    # runs in the producer thread: each rendered sample is encoded once and fanned out to every setting
+    # and every question about it, writing the image and its records is an optional side output of the same pass
+    for img_bytes, meta in sample_iter:
+        question_list = meta if isinstance(meta, list) else [meta]
+        if data_save_path is not None:
+            with open(os.path.join(data_save_path, question_list[0]['img_name']), 'wb') as image_file:
+                image_file.write(img_bytes)
+
+        payload = encode_image(img_bytes)
+        for question in question_list:
+            sample_idx = len(meta_list)
+            meta_list += [question]
+            if meta_writer is not None:
+                meta_writer.write(question)
+            for setting_idx, setting in enumerate(setting_list):
+                yield {
+                    'setting_idx': setting_idx, 
+                    'sample_idx': sample_idx, 
+                    'prompt': setting_prompt(setting, question), 
+                    'img_name': question['img_name'], 
+                    'gt': question['ans'], 
+                    'payload': payload, 
+                    'answer_mode': setting.get('answer_mode'), 
+                    'max_tokens': answer_max_tokens(setting.get('answer_mode')), 
+                    'layout': setting.get('message_layout'), 
+                }
+
+def run_stream_test(
+    sample_iter, 
+    setting_list: list, 
+    dataset_size: int = None, 
+    questions_per_image: int = 1, 
+    concurrency: int = CONCURRENCY, 
+    queue_size: int = QUEUE_SIZE, 
+    cache: ResponseCache = None, 
+    data_save_path: str = None, 
+    meta_save_path: str = None, 
+    result_dir: str = None, 
+    base_url: str = None, 
+    adaptive: bool = True, 
+    backend = None, 
+    answer_mode: str = None, 
+    message_layout: str = None, 
 ):
+    # generate-and-evaluate in one pass: sample_iter yields (PNG bytes, metadata), e.g.
+    # iter_relsamples(dataset_size), and its samples go straight to the inference workers;
+    # settings only need test_setting_name, test_vp and prompter; questions_per_image is what sample_iter
+    # was built with, the progress total counts up to that many questions per image
+    setting_list = with_variants(setting_list, answer_mode, message_layout)
     nowtime = datetime.now().strftime("%y%m%d%H%M")
-    print(f'\ntesting {test_setting_name} ({nowtime})...')
-    meta_list = load_json_data(metadata_path)
+    setting_names = ', '.join(setting['test_setting_name'] for setting in setting_list)
+    print(f'\nstream testing {setting_names} ({nowtime})...')
 
-    test_result_list = []
-    for idx in tqdm(range(len(meta_list))):
+    if result_dir is None:
+        result_dir = os.getcwd()
+    result_path_list = [
+        resolve_result_path(result_dir, setting['test_setting_name'], nowtime) for setting in setting_list
+    ]
+    backend = make_backend(backend, base_url=base_url)
+    writer = ResultWriter(result_path_list)
+    if data_save_path is not None:
+        os.makedirs(data_save_path, exist_ok=True)
+    meta_writer = MetaWriter(meta_save_path) if meta_save_path is not None else None
 
-        img_path = os.path.join(data_path, meta_list[idx]['img_name'])
-        prompt = meta_list[idx][f"{test_vp}_promptTem"]
+    def on_result(job, out):
+        writer.write(job['setting_idx'], make_result_record(
+            test_setting_name=setting_list[job['setting_idx']]['test_setting_name'], 
+            job=job, 
+            out=out, 
+            gt=job['gt'], 
+        ))
 
-        if prompter is not None:
-            prompt = prompter(prompt)
+    meta_list = []
+    start = time.perf_counter()
+    try:
+        asyncio.run(run_vlm_jobs(
+            job_list=iter_stream_jobs(
+                sample_iter=sample_iter, 
+                setting_list=setting_list, 
+                meta_list=meta_list, 
+                data_save_path=data_save_path, 
+                meta_writer=meta_writer, 
+            ), 
+            concurrency=concurrency, 
+            cache=cache, 
+            on_result=on_result, 
+            base_url=base_url, 
+            adaptive=adaptive, 
+            total=None if dataset_size is None else dataset_size * questions_per_image * len(setting_list), 
+            queue_size=queue_size, 
+            backend=backend, 
+        ))
+    finally:
+        writer.close()
+        if meta_writer is not None:
+            meta_writer.close()
+    wall_s = time.perf_counter() - start
 
-        out = run_vlm_inference(
-            prompt=prompt,
-            img_path=img_path
+    result_dict = {}
+    for setting_idx, setting in enumerate(setting_list):
+        result_dict[setting['test_setting_name']] = score_test(
+            test_setting_name=setting['test_setting_name'], 
+            meta_list=meta_list, 
+            record_dict=load_results(result_path_list[setting_idx]), 
+            result_path=result_path_list[setting_idx], 
         )
+    print_report_table(write_setting_reports(
+        setting_list, result_dict, result_path_list, model_name=backend.model_name, wall_s=wall_s, 
+    ))
+    return result_dict
 
-        test_result_list += [{
-            'ans': out["answer"],
-            'gt': meta_list[idx]['ans']
-        }]
+def group_settings(
+    setting_list: list, 
+):
+    # settings over the same dataset (and backend) run together so each image is loaded and encoded once for all of them
+    group_dict = {}
+    for sample in setting_list:
+        group_dict.setdefault((sample['metadata_path'], sample['data_path'], sample.get('backend')), []).append(sample)
+    return list(group_dict.values())
 
-    acc_list = []
-    for sample in test_result_list:
-        if sample['gt'] in sample['ans']:
-            acc_list += [1]
-        else:
-            acc_list += [0]
-    print(f"\nacc: {sum(acc_list) / len(acc_list)}")
+def write_batch_requests(
+    setting_list: list, 
+    batch_path: str, 
+    image_cache: EncodedImageCache = None, 
+):
+    # every (setting, sample) request as Batch API input lines, custom_id '<test_setting_name>/<index>';
+    # returns the part files to upload
+    if image_cache is None:
+        image_cache = EncodedImageCache()
+    writer = BatchRequestWriter(batch_path)
+    try:
+        for group in group_settings(setting_list):
+            meta_list = load_meta_list(group[0]['metadata_path'])
+            for job in build_job_list(group, meta_list):
+                payload = image_cache.get(job['data_path'], job['img_name'])
+                writer.write(
+                    custom_id=make_custom_id(group[job['setting_idx']]['test_setting_name'], job['sample_idx']), 
+                    body={
+                        'model': MODEL_NAME, 
+                        'messages': build_messages(job['prompt'], payload['b64'], payload['mime'], layout=job['layout']), 
+                        'max_tokens': job['max_tokens'] or MAX_TOKENS, 
+                    }, 
+                )
+    finally:
+        writer.close()
+    print(f"\nbatch requests: {writer.path_list}")
+    return writer.path_list
+
+def ingest_batch_results(
+    setting_list: list, 
+    output_path, 
+    result_dir: str = None, 
+):
+    # reads Batch API output file(s) of write_batch_requests back into per-setting result files and scores
+    # them like an online run; lines of settings not in setting_list are ignored
+    nowtime = datetime.now().strftime("%y%m%d%H%M")
+    if result_dir is None:
+        result_dir = os.getcwd()
+    setting_dict = {setting['test_setting_name']: setting_idx for setting_idx, setting in enumerate(setting_list)}
+    meta_dict = {}
+    for setting in setting_list:
+        if setting['metadata_path'] not in meta_dict:
+            meta_dict[setting['metadata_path']] = load_meta_list(setting['metadata_path'])
+    result_path_list = [
+        resolve_result_path(result_dir, setting['test_setting_name'], nowtime) for setting in setting_list
+    ]
 
-    result_name = f"testResult_{nowtime}_{test_setting_name}"
-    print(result_name)
+    writer = ResultWriter(result_path_list)
+    try:
+        for custom_id, out in iter_batch_output(output_path):
+            test_setting_name, sample_idx = parse_custom_id(custom_id)
+            if test_setting_name not in setting_dict:
+                continue
+            setting_idx = setting_dict[test_setting_name]
+            setting = setting_list[setting_idx]
+            meta_list = meta_dict[setting['metadata_path']]
+            writer.write(setting_idx, make_result_record(
+                test_setting_name=test_setting_name, 
+                job={
+                    'sample_idx': sample_idx, 
+                    'img_name': meta_list[sample_idx]['img_name'], 
+                    'prompt': setting_prompt(setting, meta_list[sample_idx]), 
+                    'answer_mode': setting.get('answer_mode'), 
+                }, 
+                out={**out, 'latency': None, 'retries': 0, 'cached': False}, 
+                gt=meta_list[sample_idx]['ans'], 
+            ))
+    finally:
+        writer.close()
+
+    result_dict = {}
+    for setting_idx, setting in enumerate(setting_list):
+        result_dict[setting['test_setting_name']] = score_test(
+            test_setting_name=setting['test_setting_name'], 
+            meta_list=meta_dict[setting['metadata_path']], 
+            record_dict=load_results(result_path_list[setting_idx]), 
+            result_path=result_path_list[setting_idx], 
+        )
+    # no wall time for an offline batch, the cost is at the Batch API's discounted price
+    print_report_table(write_setting_reports(
+        setting_list, result_dict, result_path_list, model_name=MODEL_NAME, price_scale=BATCH_PRICE_SCALE, 
+    ))
+    return result_dict
 
 def run_testingsets(
-    setting_list: list
+    setting_list: list, 
+    concurrency: int = CONCURRENCY, 
+    cache_path: str = CACHE_PATH, 
+    cache_max_entries: int = MAX_ENTRIES, 
+    image_cache_size: int = IMAGE_CACHE_SIZE, 
+    result_dir: str = None, 
+    resume: bool = False, 
+    base_url: str = None, 
+    adaptive: bool = True, 
+    backend = None, 
+    batch_input_path: str = None, 
+    batch_output_path = None, 
+    image_format: str = None, 
+    image_quality: int = IMAGE_QUALITY, 
+    image_max_side: int = None, 
+    bundle_size: int = None, 
+    answer_mode: str = None, 
+    message_layout: str = None, 
 ):
+    # a setting may name its own 'backend', otherwise the run's backend (default the OpenAI endpoint) is used;
+    # batch_input_path only writes Batch API request files (returned instead of results),
+    # batch_output_path scores the downloaded output file(s) instead of sending requests;
+    # image_format ('png', 'png-palette', 'jpeg', 'webp') / image_max_side re-encode images before upload;
+    # bundle_size > 1 asks several questions about one image per request (results as '<setting>_bundled');
+    # answer_mode 'letter' / 'json' asks for the option alone with a small max_tokens (results as '<setting>_<mode>');
+    # message_layout 'prefix' puts the image before the question for provider prompt caching (as '<setting>_prefix')
+    setting_list = with_variants(setting_list, answer_mode, message_layout)
+    image_cache = EncodedImageCache(
+        max_items=image_cache_size, 
+        image_format=image_format, 
+        quality=image_quality, 
+        max_side=image_max_side, 
+    )
+    if batch_input_path is not None:
+        return write_batch_requests(setting_list, batch_input_path, image_cache=image_cache)
+    if batch_output_path is not None:
+        return ingest_batch_results(setting_list, batch_output_path, result_dir=result_dir)
+
     print('\nstart run_testingsets...\n')
-    for sample in setting_list:
-        run_test(
-            test_setting_name=sample['test_setting_name'],
-            metadata_path=sample['metadata_path'],
-            data_path=sample['data_path'],
-            test_vp=sample['test_vp'],
-            prompter=sample['prompter'],
+    cache = None
+    if cache_path is not None:
+        cache = ResponseCache(
+            cache_path=cache_path, 
+            max_entries=cache_max_entries, 
         )
-    print('\n...end run_testingsets\n')
 
-if __name__ == "__main__":
-    rel_path_dict = gen_reldataset() # dataset_size=5)
-    abs_path_dict = gen_absdataset() # dataset_size=5)
+    backend_dict = {}
+    result_dict = {}
+    report_dict = {}
+    for group in group_settings(setting_list):
+        group_backend = group[0].get('backend', backend)
+        if group_backend not in backend_dict:
+            backend_dict[group_backend] = make_backend(group_backend, base_url=base_url)
+        result_dict.update(run_setting_group(
+            setting_list=group, 
+            concurrency=max(sample.get('concurrency', concurrency) for sample in group), 
+            cache=cache, 
+            image_cache=image_cache, 
+            result_dir=result_dir, 
+            resume=resume, 
+            base_url=base_url, 
+            adaptive=adaptive, 
+            backend=backend_dict[group_backend], 
+            report_dict=report_dict, 
+            bundle_size=bundle_size, 
+        ))
 
-    setting_list = [
+    print(f"\nimage cache: {image_cache.stats()}")
+    for group_backend in backend_dict.values():
+        print(f"backend: {group_backend.stats()}")
+    if cache is not None:
+        print(f"cache: {cache.stats()}")
+        cache.close()
+    print_report_table(report_dict)
+    print_baseline_deltas(report_dict, result_dir=result_dir)
+    print('\n...end run_testingsets\n')
+    return result_dict
+
+def default_setting_list(
+    rel_path_dict: dict, 
+    abs_path_dict: dict, 
+):
+    return [
         {
             'test_setting_name': 'rel_sybVp_nP', 
             'metadata_path': rel_path_dict['METADATA_PATH'], 
@@ -169,9 +846,213 @@ if __name__ == "__main__":
         },
     ]
 
-    run_testingsets(
-        setting_list=setting_list,
+def find_dataset(
+    kind, 
+    data_dir: str = None, 
+):
+    # newest dataset gen_reldataset()/gen_absdataset() left in data_dir (kind 'rel' or 'abs'):
+    # <yymmddHHMM>_RELdataset with its _RELmetaList.jsonl (or .json), or a <yymmddHHMM>_RELpack
+    if data_dir is None:
+        data_dir = os.getcwd()
+    pattern = re.compile(rf"^(\d{{10}})_{kind.upper()}(dataset|pack)$")
+    found_list = []
+    for file_name in os.listdir(data_dir) if os.path.isdir(data_dir) else []:
+        match = pattern.match(file_name)
+        if match is None:
+            continue
+        data_path = os.path.join(data_dir, file_name)
+        if match.group(2) == 'pack':
+            if is_pack(data_path):
+                found_list += [(match.group(1), data_path, os.path.join(data_path, PACK_META_NAME))]
+            continue
+        for ext in ('.jsonl', '.json'):
+            metadata_path = os.path.join(data_dir, f"{match.group(1)}_{kind.upper()}metaList{ext}")
+            if os.path.isfile(metadata_path):
+                found_list += [(match.group(1), data_path, metadata_path)]
+                break
+    if not found_list:
+        return None
+    _, data_path, metadata_path = max(found_list)
+    return {
+        'METADATA_PATH': metadata_path, 
+        'DATA_PATH': data_path, 
+    }
+
+def generate_datasets(
+    kind_list: list = ('rel', 'abs'), 
+    **gen_kwargs, 
+):
+    # gen_kwargs go to gen_reldataset()/gen_absdataset() (dataset_size, workers, backend, packed, ...)
+    path_dict = {}
+    if 'rel' in kind_list:
+        from RELdatasetMaker import gen_reldataset
+        path_dict['rel'] = gen_reldataset(**gen_kwargs)
+    if 'abs' in kind_list:
+        from ABSdatasetMaker import gen_absdataset
+        path_dict['abs'] = gen_absdataset(**gen_kwargs)
+    return path_dict
+
+def select_settings(
+    path_dict: dict, 
+    setting_name_list: list = None, 
+):
+    # default settings of the datasets in path_dict, optionally only the named ones
+    empty_path_dict = {'METADATA_PATH': None, 'DATA_PATH': None}
+    setting_list = [
+        setting for setting in default_setting_list(
+            rel_path_dict=path_dict.get('rel') or empty_path_dict, 
+            abs_path_dict=path_dict.get('abs') or empty_path_dict, 
+        ) if setting['metadata_path'] is not None
+    ]
+    if setting_name_list:
+        unknown_list = sorted(set(setting_name_list) - {setting['test_setting_name'] for setting in setting_list})
+        if unknown_list:
+            raise ValueError(f"Unknown or missing settings {unknown_list}")
+        setting_list = [setting for setting in setting_list if setting['test_setting_name'] in setting_name_list]
+    return setting_list
+
+def print_reports(
+    result_dir: str = None, 
+    setting_name_list: list = None, 
+):
+    # usage/accuracy table of the newest result file of every (default) setting found in result_dir
+    if result_dir is None:
+        result_dir = os.getcwd()
+    if not setting_name_list:
+        empty_path_dict = {'METADATA_PATH': None, 'DATA_PATH': None}
+        setting_name_list = [setting['test_setting_name'] for setting in default_setting_list(empty_path_dict, empty_path_dict)]
+    report_dict = {}
+    for test_setting_name in setting_name_list:
+        for result_name in variant_names(test_setting_name):
+            result_path = find_result_file(result_dir, result_name)
+            if result_path is not None:
+                report_dict[result_name] = load_report(result_path)
+    if not report_dict:
+        print(f"no results in {result_dir}")
+        return report_dict
+    print_report_table(report_dict)
+    print_baseline_deltas(report_dict, result_dir=result_dir)
+    return report_dict
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="generate the REL/ABS datasets and evaluate a VLM on them")
+    subparsers = parser.add_subparsers(dest='command')
+
+    def add_generate_args(subparser):
+        subparser.add_argument("--kind", nargs='+', choices=['rel', 'abs'], default=['rel', 'abs'])
+        subparser.add_argument("--size", type=int, default=None, help="samples per dataset (default DATASET_SIZE)")
+        subparser.add_argument("--workers", type=int, default=1)
+        subparser.add_argument("--render-backend", choices=['matplotlib', 'raster'], default=None)
+        subparser.add_argument("--packed", action='store_true')
+        subparser.add_argument("--questions", type=int, default=1, help="questions per rendered image")
+        subparser.add_argument("--profile", action='store_true', help="write a per-stage generation profile")
+
+    def add_evaluate_args(subparser, find_datasets):
+        if find_datasets:
+            subparser.add_argument("--data-dir", default=None, help="where to look for the newest datasets (default cwd)")
+            for kind in ('rel', 'abs'):
+                subparser.add_argument(f"--{kind}-data", default=None)
+                subparser.add_argument(f"--{kind}-meta", default=None)
+        subparser.add_argument("--settings", nargs='+', default=None, help="setting names (default all)")
+        subparser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+        subparser.add_argument("--no-adaptive", action='store_true')
+        subparser.add_argument("--backend", default=None, help="registered inference backend (default openai)")
+        subparser.add_argument("--base-url", default=None)
+        subparser.add_argument("--result-dir", default=None)
+        subparser.add_argument("--resume", action='store_true')
+        subparser.add_argument("--cache-path", default=CACHE_PATH)
+        subparser.add_argument("--no-cache", action='store_true')
+        subparser.add_argument("--image-format", default=None, choices=['png', 'png-palette', 'jpeg', 'webp'])
+        subparser.add_argument("--image-quality", type=int, default=IMAGE_QUALITY)
+        subparser.add_argument("--image-max-side", type=int, default=None)
+        subparser.add_argument("--bundle", type=int, default=None, help="questions about one image per request")
+        subparser.add_argument("--answer-mode", choices=ANSWER_MODE_LIST, default='free', 
+                               help="'letter'/'json' ask for the option only, with a small max_tokens")
+        subparser.add_argument("--layout", choices=MESSAGE_LAYOUT_LIST, default='default', 
+                               help="'prefix' shares system, preamble and image as a cacheable prompt prefix")
+        subparser.add_argument("--batch-input", default=None, help="only write Batch API request files")
+        subparser.add_argument("--batch-output", nargs='+', default=None, help="score downloaded Batch API output")
+
+    add_generate_args(subparsers.add_parser('generate', help="generate datasets only"))
+    add_evaluate_args(subparsers.add_parser('evaluate', help="evaluate existing datasets"), find_datasets=True)
+    report_parser = subparsers.add_parser('report', help="print the usage/accuracy table of the newest results")
+    report_parser.add_argument("--result-dir", default=None)
+    report_parser.add_argument("--settings", nargs='+', default=None)
+    run_parser = subparsers.add_parser('run', help="generate, then evaluate (the default)")
+    add_generate_args(run_parser)
+    add_evaluate_args(run_parser, find_datasets=False)
+    return parser
+
+def main(
+    argv: list = None, 
+):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command is None:
+        # plain `python runVLMTesting.py` keeps generating both datasets and testing them
+        args = parser.parse_args(['run'])
+    command = args.command
+    if command == 'report':
+        return print_reports(result_dir=args.result_dir, setting_name_list=args.settings)
+
+    if command == 'run' and args.batch_input is None and args.batch_output is None:
+        # fails on a missing API key before spending the time on generation
+        make_backend(args.backend, base_url=args.base_url)
+    if command in ('generate', 'run'):
+        gen_kwargs = {
+            'workers': args.workers, 
+            'packed': args.packed, 
+            'profile': args.profile, 
+            'questions_per_image': args.questions, 
+        }
+        if args.size is not None:
+            gen_kwargs['dataset_size'] = args.size
+        if args.render_backend is not None:
+            gen_kwargs['backend'] = args.render_backend
+        path_dict = generate_datasets(kind_list=args.kind, **gen_kwargs)
+        if command == 'generate':
+            return path_dict
+    else:
+        # explicit paths select exactly those datasets, otherwise the newest of each kind in data_dir is used
+        explicit = any(getattr(args, f"{kind}_{part}") is not None for kind in ('rel', 'abs') for part in ('data', 'meta'))
+        path_dict = {}
+        for kind in ('rel', 'abs'):
+            data_path, metadata_path = getattr(args, f"{kind}_data"), getattr(args, f"{kind}_meta")
+            if data_path is not None and metadata_path is None and is_pack(data_path):
+                metadata_path = os.path.join(data_path, PACK_META_NAME)
+            if data_path is not None and metadata_path is not None:
+                path_dict[kind] = {'METADATA_PATH': metadata_path, 'DATA_PATH': data_path}
+            elif data_path is None and metadata_path is None:
+                path_dict[kind] = None if explicit else find_dataset(kind, args.data_dir)
+            else:
+                raise SystemExit(f"--{kind}-data needs --{kind}-meta (unless it is a pack)")
+        if not any(path_dict.values()):
+            raise SystemExit(f"no datasets found in {args.data_dir or os.getcwd()}, run 'generate' first")
+        for kind, kind_path_dict in path_dict.items():
+            if kind_path_dict is not None:
+                print(f"{kind}: {kind_path_dict['DATA_PATH']}")
+
+    return run_testingsets(
+        setting_list=select_settings(path_dict, args.settings), 
+        concurrency=args.concurrency, 
+        cache_path=None if args.no_cache else args.cache_path, 
+        result_dir=args.result_dir, 
+        resume=args.resume, 
+        base_url=args.base_url, 
+        adaptive=not args.no_adaptive, 
+        backend=args.backend, 
+        batch_input_path=args.batch_input, 
+        batch_output_path=args.batch_output, 
+        image_format=args.image_format, 
+        image_quality=args.image_quality, 
+        image_max_side=args.image_max_side, 
+        bundle_size=args.bundle, 
+        answer_mode=args.answer_mode, 
+        message_layout=args.layout, 
     )
+
+if __name__ == "__main__":
+    main()
     
 
 
@@ -0,0 +1,269 @@
+"""
+ SPDX-License-Identifier: MIT
+ Copyright (c) 2025, yasaisen (clover)
+ 
+ This file is part of a project licensed under the MIT License.
+ See the LICENSE file in the project root for more information.
+ 
+ last modified in 2610182140
+"""
+
+import numpy as np
+
+from stageProfiler import stage
+
+
+BACKEND = 'matplotlib'
+BACKEND_LIST = [
+    'matplotlib',
+    'raster',
+]
+
+FIGSIZE = (8, 8)
+DPI = 200
+POINT_SIZE = 300
+LABEL_OFFSET = 0.02
+FONT_SIZE = 12
+EDGE_WIDTH = 1
+SPINE_WIDTH = 1.5
+
+# default subplot box and bbox_inches='tight' padding of a matplotlib figure, in figure fractions / inches
+AXES_BOX = (0.125, 0.11, 0.9, 0.88)
+TIGHT_PAD = 0.1
+
+# vertices of the filled matplotlib markers for a marker of size 1, y axis pointing up
+MARKER_POLYGONS = {
+    "^": [(0.0, 0.5), (-0.5, -0.5), (0.5, -0.5)],
+    "v": [(0.0, -0.5), (0.5, 0.5), (-0.5, 0.5)],
+    "s": [(-0.5, -0.5), (0.5, -0.5), (0.5, 0.5), (-0.5, 0.5)],
+    "D": [(0.0, -0.7071), (0.7071, 0.0), (0.0, 0.7071), (-0.7071, 0.0)],
+    "p": [(0.0, 0.5), (-0.4755, 0.1545), (-0.2939, -0.4045), (0.2939, -0.4045), (0.4755, 0.1545)],
+    "h": [(0.0, 0.5), (-0.433, 0.25), (-0.433, -0.25), (0.0, -0.5), (0.433, -0.25), (0.433, 0.25)],
+    "H": [(-0.25, 0.433), (-0.5, 0.0), (-0.25, -0.433), (0.25, -0.433), (0.5, 0.0), (0.25, 0.433)],
+    "X": [(-0.25, -0.5), (0.0, -0.25), (0.25, -0.5), (0.5, -0.25), (0.25, 0.0), (0.5, 0.25),
+          (0.25, 0.5), (0.0, 0.25), (-0.25, 0.5), (-0.5, 0.25), (-0.25, 0.0), (-0.5, -0.25)],
+    "P": [(-0.1667, -0.5), (0.1667, -0.5), (0.1667, -0.1667), (0.5, -0.1667), (0.5, 0.1667), (0.1667, 0.1667),
+          (0.1667, 0.5), (-0.1667, 0.5), (-0.1667, 0.1667), (-0.5, 0.1667), (-0.5, -0.1667), (-0.1667, -0.1667)],
+    "8": [(-0.1913, 0.4619), (-0.4619, 0.1913), (-0.4619, -0.1913), (-0.1913, -0.4619),
+          (0.1913, -0.4619), (0.4619, -0.1913), (0.4619, 0.1913), (0.1913, 0.4619)],
+}
+
+
+class FigureRenderer:
+    # keeps one Figure/Axes alive and only updates the per-point artists between samples,
+    # the saved image is the same as building the figure from scratch with plt.subplots
+    def __init__(
+        self,
+        max_points: int = 10,
+        figsize: tuple = FIGSIZE,
+        dpi: int = DPI,
+    ):
+        # imported here so the raster backend never pays for matplotlib
+        import matplotlib.pyplot as plt
+
+        self.plt = plt
+        self.dpi = dpi
+        self.fig, self.ax = plt.subplots(figsize=figsize)
+        self.marker_paths = {}
+        self.collections = []
+        self.labels = []
+        self._ensure_slots(max_points)
+
+        self.ax.set_xlim(0,1)
+        self.ax.set_ylim(0,1)
+        self.ax.set_xticks([])
+        self.ax.set_yticks([])
+        for spine in self.ax.spines.values():
+            spine.set_linewidth(1.5)
+
+    def _ensure_slots(
+        self,
+        num_points,
+    ):
+        while len(self.collections) < num_points:
+            collection = self.ax.scatter(0, 0, marker='o', s=POINT_SIZE,
+                    facecolor='#000000', edgecolor='black', linewidth=1)
+            label = self.ax.text(LABEL_OFFSET, LABEL_OFFSET, '', fontsize=12, va='center')
+            collection.set_visible(False)
+            label.set_visible(False)
+            self.collections += [collection]
+            self.labels += [label]
+
+    def _marker_path(
+        self,
+        marker,
+    ):
+        # same path construction as Axes.scatter
+        from matplotlib.markers import MarkerStyle
+
+        if marker not in self.marker_paths:
+            marker_obj = MarkerStyle(marker)
+            self.marker_paths[marker] = marker_obj.get_path().transformed(
+                marker_obj.get_transform())
+        return self.marker_paths[marker]
+
+    def render(
+        self,
+        points_dict,
+        positions,
+        save_path,
+        sizes=None,
+    ):
+        if sizes is None:
+            sizes = {}
+        with stage('draw'):
+            self._ensure_slots(len(points_dict))
+
+            for slot_idx, (name, attrs) in enumerate(points_dict.items()):
+                x, y = positions[name]
+                collection = self.collections[slot_idx]
+                collection.set_paths([self._marker_path(attrs["marker"])])
+                collection.set_offsets([[x, y]])
+                collection.set_sizes([sizes.get(name, POINT_SIZE)])
+                collection.set_facecolor(attrs["color"])
+                collection.set_visible(True)
+
+                label = self.labels[slot_idx]
+                label.set_position((x + LABEL_OFFSET, y + LABEL_OFFSET))
+                label.set_text(name)
+                label.set_visible(True)
+
+            for slot_idx in range(len(points_dict), len(self.collections)):
+                self.collections[slot_idx].set_visible(False)
+                self.labels[slot_idx].set_visible(False)
+
+        with stage('savefig'):
+            self.fig.savefig(save_path, dpi=self.dpi, bbox_inches='tight')
+
+    def close(
+        self,
+    ):
+        self.plt.close(self.fig)
+
+class RasterRenderer:
+    # draws the same layout straight into a preallocated Pillow canvas without matplotlib,
+    # geometry follows the matplotlib backend (figure size, subplot box, tight padding, marker/spine widths)
+    def __init__(
+        self,
+        figsize: tuple = FIGSIZE,
+        dpi: int = DPI,
+        supersample: int = 1,
+    ):
+        from PIL import Image, ImageDraw, ImageFont
+
+        self.Image = Image
+        self.dpi = dpi
+        self.supersample = supersample
+        scale = dpi * supersample
+        pt2px = scale / 72
+
+        pad = TIGHT_PAD * scale
+        self.axes_w = (AXES_BOX[2] - AXES_BOX[0]) * figsize[0] * scale
+        self.axes_h = (AXES_BOX[3] - AXES_BOX[1]) * figsize[1] * scale
+        self.origin = (pad, pad)
+        self.size = (round(self.axes_w + 2 * pad), round(self.axes_h + 2 * pad))
+        self.out_size = (round(self.size[0] / supersample), round(self.size[1] / supersample))
+
+        self.pt2px = pt2px
+        self.edge_width = max(1, round(EDGE_WIDTH * pt2px))
+        try:
+            self.font = ImageFont.truetype("DejaVuSans.ttf", round(FONT_SIZE * pt2px))
+        except OSError:
+            self.font = ImageFont.load_default(size=round(FONT_SIZE * pt2px))
+
+        self.background = Image.new("RGB", self.size, "white")
+        spine_width = max(1, round(SPINE_WIDTH * pt2px))
+        half = spine_width / 2
+        ImageDraw.Draw(self.background).rectangle(
+            [self.origin[0] - half, self.origin[1] - half,
+             self.origin[0] + self.axes_w + half, self.origin[1] + self.axes_h + half],
+            outline="black", width=spine_width,
+        )
+        self.canvas = self.background.copy()
+        self.draw = ImageDraw.Draw(self.canvas)
+        self.marker_polygons = {
+            marker: np.array(vertices) * (1, -1) for marker, vertices in MARKER_POLYGONS.items()
+        }
+
+    def _to_px(
+        self,
+        x,
+        y,
+    ):
+        return (self.origin[0] + x * self.axes_w, self.origin[1] + (1 - y) * self.axes_h)
+
+    def _draw_marker(
+        self,
+        marker,
+        center,
+        size,
+        color,
+    ):
+        # scatter sizes are areas in points^2, the marker spans sqrt(s) points
+        marker_px = np.sqrt(size) * self.pt2px
+        if marker == "o":
+            radius = marker_px / 2
+            self.draw.ellipse(
+                [center[0] - radius, center[1] - radius, center[0] + radius, center[1] + radius],
+                fill=color, outline="black", width=self.edge_width,
+            )
+            return
+
+        vertices = [tuple(v) for v in self.marker_polygons[marker] * marker_px + center]
+        self.draw.polygon(vertices, fill=color)
+        self.draw.line(vertices + [vertices[0]], fill="black", width=self.edge_width, joint="curve")
+
+    def render(
+        self,
+        points_dict,
+        positions,
+        save_path,
+        sizes=None,
+    ):
+        if sizes is None:
+            sizes = {}
+        with stage('draw'):
+            self.canvas.paste(self.background)
+
+            for name, attrs in points_dict.items():
+                x, y = positions[name]
+                self._draw_marker(
+                    marker=attrs["marker"],
+                    center=self._to_px(x, y),
+                    size=sizes.get(name, POINT_SIZE),
+                    color=attrs["color"],
+                )
+            for name in points_dict:
+                x, y = positions[name]
+                self.draw.text(self._to_px(x + LABEL_OFFSET, y + LABEL_OFFSET), name,
+                        fill="black", font=self.font, anchor="lm")
+
+        with stage('savefig'):
+            image = self.canvas
+            if self.supersample > 1:
+                image = image.resize(self.out_size, self.Image.LANCZOS)
+            image.save(save_path, format="PNG")
+
+    def close(
+        self,
+    ):
+        pass
+
+_RENDERER_CACHE = {}
+
+def get_renderer(
+    max_points: int = 10, 
+    backend: str = BACKEND, 
+    figsize: tuple = FIGSIZE, 
+    dpi: int = DPI, 
+):
+    # one renderer per backend, size and process, worker processes each build their own on first use
+    key = (backend, tuple(figsize), dpi)
+    if key not in _RENDERER_CACHE:
+        if backend == 'matplotlib':
+            _RENDERER_CACHE[key] = FigureRenderer(max_points=max_points, figsize=figsize, dpi=dpi)
+        elif backend == 'raster':
+            _RENDERER_CACHE[key] = RasterRenderer(figsize=figsize, dpi=dpi)
+        else:
+            raise ValueError(f"Unknown backend '{backend}', expected one of {BACKEND_LIST}")
+    return _RENDERER_CACHE[key]
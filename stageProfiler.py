@@ -0,0 +1,233 @@
+"""
+ SPDX-License-Identifier: MIT
+ Copyright (c) 2025, yasaisen (clover)
+ 
+ This file is part of a project licensed under the MIT License.
+ See the LICENSE file in the project root for more information.
+ 
+ last modified in 2610182140
+"""
+
+import os
+import sys
+import time
+import json
+import pstats
+import cProfile
+import platform
+import contextlib
+import numpy as np
+from functools import partial
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+PROFILE_VERSION = 1
+
+# stage timings of the sample being built in this process, None while not profiling
+_ACTIVE_STAGES = None
+_NULL_STAGE = contextlib.nullcontext()
+
+
+class _Stage:
+    __slots__ = ('stage_dict', 'name', 'start')
+
+    def __init__(
+        self, 
+        stage_dict, 
+        name, 
+    ):
+        self.stage_dict = stage_dict
+        self.name = name
+
+    def __enter__(
+        self, 
+    ):
+        self.start = time.perf_counter()
+
+    def __exit__(
+        self, 
+        *exc_info, 
+    ):
+        self.stage_dict[self.name] = self.stage_dict.get(self.name, 0.0) + time.perf_counter() - self.start
+
+def stage(
+    name, 
+):
+    # with stage('savefig'): ... adds to the current sample's timings, a shared no-op when not profiling
+    if _ACTIVE_STAGES is None:
+        return _NULL_STAGE
+    return _Stage(_ACTIVE_STAGES, name)
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, KB elsewhere
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def profile_sample(
+    sample_fn, 
+    sample_idx, 
+    cprofile: bool = False, 
+):
+    # runs in whichever process builds the sample, so worker processes report their own timings and RSS;
+    # returns (result, sample profile, raw cProfile stats or None)
+    global _ACTIVE_STAGES
+    stage_dict = {}
+    profile = cProfile.Profile() if cprofile else None
+    _ACTIVE_STAGES = stage_dict
+    start = time.perf_counter()
+    try:
+        result = profile.runcall(sample_fn, sample_idx) if profile is not None else sample_fn(sample_idx)
+    finally:
+        _ACTIVE_STAGES = None
+    total_s = time.perf_counter() - start
+
+    raw_stats = None
+    if profile is not None:
+        profile.create_stats()
+        raw_stats = profile.stats
+    return result, {
+        'index': sample_idx, 
+        'pid': os.getpid(), 
+        'total_s': total_s, 
+        'stages': stage_dict, 
+        'rss_mb': peak_rss_mb(), 
+    }, raw_stats
+
+class _RawStats:
+    # what pstats.Stats.add expects from a profile object
+    def __init__(
+        self, 
+        stats, 
+    ):
+        self.stats = stats
+
+    def create_stats(
+        self, 
+    ):
+        pass
+
+class GenProfiler:
+    # collects per-sample stage timings from profile_sample (in-process or from workers) plus stages the
+    # caller times itself with profiler.stage(), which are added to the sample consumed last
+    def __init__(
+        self, 
+        cprofile: bool = False, 
+    ):
+        self.cprofile = cprofile
+        self.sample_list = []
+        self.stats = None
+        self.start = time.perf_counter()
+
+    def wrap(
+        self, 
+        sample_fn, 
+    ):
+        return partial(profile_sample, sample_fn, cprofile=self.cprofile)
+
+    def add(
+        self, 
+        profiled_result, 
+    ):
+        result, sample_profile, raw_stats = profiled_result
+        self.sample_list += [sample_profile]
+        if raw_stats is not None:
+            if self.stats is None:
+                self.stats = pstats.Stats(_RawStats(raw_stats))
+            else:
+                self.stats.add(_RawStats(raw_stats))
+        return result
+
+    def stage(
+        self, 
+        name, 
+    ):
+        if not self.sample_list:
+            return _NULL_STAGE
+        return _Stage(self.sample_list[-1].setdefault('caller_stages', {}), name)
+
+    def _sample_stages(
+        self, 
+        sample_profile, 
+    ):
+        return {**sample_profile['stages'], **sample_profile.get('caller_stages', {})}
+
+    def _sample_total_s(
+        self, 
+        sample_profile, 
+    ):
+        return sample_profile['total_s'] + sum(sample_profile.get('caller_stages', {}).values())
+
+    def summary(
+        self, 
+        **info, 
+    ):
+        wall_s = time.perf_counter() - self.start
+        stage_name_list = []
+        for sample_profile in self.sample_list:
+            stage_name_list += [name for name in self._sample_stages(sample_profile) if name not in stage_name_list]
+
+        total_s = sum(self._sample_total_s(sample_profile) for sample_profile in self.sample_list)
+        stage_summary = {}
+        for name in stage_name_list:
+            time_list = np.array([self._sample_stages(sample_profile).get(name, 0.0) for sample_profile in self.sample_list]) * 1000
+            stage_summary[name] = {
+                'total_s': float(time_list.sum()) / 1000, 
+                'share': float(time_list.sum()) / 1000 / total_s if total_s else None, 
+                'mean_ms': float(time_list.mean()), 
+                'p50_ms': float(np.percentile(time_list, 50)), 
+                'p95_ms': float(np.percentile(time_list, 95)), 
+                'max_ms': float(time_list.max()), 
+            }
+
+        rss_dict = {}
+        for sample_profile in self.sample_list:
+            if sample_profile['rss_mb'] is not None:
+                rss_dict[sample_profile['pid']] = max(rss_dict.get(sample_profile['pid'], 0.0), sample_profile['rss_mb'])
+        return {
+            'version': PROFILE_VERSION, 
+            **info, 
+            'python': platform.python_version(), 
+            'platform': platform.platform(), 
+            'samples': len(self.sample_list), 
+            'wall_s': wall_s, 
+            'sample_total_s': total_s, 
+            'stages': stage_summary, 
+            'peak_rss_mb': {
+                'main': peak_rss_mb(), 
+                'per_pid': {str(pid): rss for pid, rss in rss_dict.items()}, 
+            }, 
+            'per_sample': [{
+                'index': sample_profile['index'], 
+                'pid': sample_profile['pid'], 
+                'total_ms': self._sample_total_s(sample_profile) * 1000, 
+                'rss_mb': sample_profile['rss_mb'], 
+                **{f"{name}_ms": value * 1000 for name, value in self._sample_stages(sample_profile).items()}, 
+            } for sample_profile in self.sample_list], 
+        }
+
+    def write(
+        self, 
+        profile_path, 
+        **info, 
+    ):
+        # <profile_path>.json, and with cprofile the merged pstats dump next to it as .prof
+        # (python -m pstats <file>.prof, or snakeviz)
+        summary = self.summary(**info)
+        with open(profile_path, 'w', encoding='utf-8') as profile_file:
+            json.dump(summary, profile_file, indent=4)
+        if self.stats is not None:
+            self.stats.dump_stats(os.path.splitext(profile_path)[0] + '.prof')
+
+        print(f"\n{'stage':<12}{'total s':>9}{'share':>8}{'mean ms':>9}{'p95 ms':>9}{'max ms':>9}")
+        for name, stage_summary in summary['stages'].items():
+            print(f"{name:<12}{stage_summary['total_s']:>9.2f}{(stage_summary['share'] or 0) * 100:>7.1f}%"
+                  f"{stage_summary['mean_ms']:>9.2f}{stage_summary['p95_ms']:>9.2f}{stage_summary['max_ms']:>9.2f}")
+        print(f"peak RSS: {summary['peak_rss_mb']}")
+        print(profile_path)
+        return summary
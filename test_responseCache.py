@@ -0,0 +1,48 @@
+"""
+ SPDX-License-Identifier: MIT
+ Copyright (c) 2025, yasaisen (clover)
+ 
+ This file is part of a project licensed under the MIT License.
+ See the LICENSE file in the project root for more information.
+ 
+ last modified in 2610191220
+"""
+
+from responseCache import ResponseCache
+from vlmBackends import OpenAIBackend, DeterministicBackend
+
+
+def backend_key(
+    backend, 
+):
+    return ResponseCache.make_key(backend.model_name, backend.max_tokens, "prompt", "image-sha", **backend.cache_scope())
+
+def test_other_endpoint_misses(
+    tmp_path, 
+    monkeypatch, 
+):
+    monkeypatch.delenv("OPENAI_BASE_URL", raising=False)
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    api = OpenAIBackend()
+    cache.put(backend_key(api), "B. LowerRight", model=api.model_name)
+
+    assert cache.get(backend_key(api)) == "B. LowerRight"
+    # same model name, but served by the mock or a self-hosted endpoint
+    assert cache.get(backend_key(OpenAIBackend(base_url="http://127.0.0.1:8000/v1"))) is None
+    assert cache.get(backend_key(OpenAIBackend(base_url="http://127.0.0.1:8001/v1"))) is None
+    assert cache.get(backend_key(DeterministicBackend(model_name=api.model_name))) is None
+    cache.close()
+
+def test_endpoint_from_environment(
+    monkeypatch, 
+):
+    monkeypatch.setenv("OPENAI_BASE_URL", "http://127.0.0.1:8000/v1/")
+    assert backend_key(OpenAIBackend()) == backend_key(OpenAIBackend(base_url="http://127.0.0.1:8000/v1"))
+
+def test_openai_keys_unchanged(
+    monkeypatch, 
+):
+    # entries cached from the OpenAI API before endpoints were part of the key stay valid
+    monkeypatch.delenv("OPENAI_BASE_URL", raising=False)
+    api = OpenAIBackend()
+    assert backend_key(api) == ResponseCache.make_key(api.model_name, api.max_tokens, "prompt", "image-sha")
@@ -0,0 +1,80 @@
+"""
+ SPDX-License-Identifier: MIT
+ Copyright (c) 2025, yasaisen (clover)
+ 
+ This file is part of a project licensed under the MIT License.
+ See the LICENSE file in the project root for more information.
+ 
+ last modified in 2610191210
+"""
+
+import json
+
+from resultStore import load_results, ResultWriter
+
+
+def write_torn_results(
+    result_path, 
+    num_records, 
+):
+    # num_records complete records, then the first half of one more without its newline, as a crash leaves it
+    line_list = [json.dumps({'index': idx, 'status': 'ok'}) + "\n" for idx in range(num_records)]
+    torn_line = json.dumps({'index': num_records, 'status': 'ok'})
+    with open(result_path, 'w', encoding='utf-8') as file:
+        file.write("".join(line_list) + torn_line[:len(torn_line) // 2])
+
+def test_resume_after_torn_line(
+    tmp_path, 
+):
+    result_path = str(tmp_path / "testResult_2610191010_rel_sybVp_nP.jsonl")
+    write_torn_results(result_path, 11)
+    assert sorted(load_results(result_path)) == list(range(11))
+
+    writer = ResultWriter([result_path], resume=True)
+    writer.write(0, {'index': 11, 'status': 'ok'})
+    writer.close()
+
+    record_dict = load_results(result_path)
+    assert sorted(record_dict) == list(range(12))
+    assert all(record['status'] == 'ok' for record in record_dict.values())
+
+def test_resume_keeps_complete_file(
+    tmp_path, 
+):
+    result_path = str(tmp_path / "testResult_2610191010_rel_sybVp_nP.jsonl")
+    with open(result_path, 'w', encoding='utf-8') as file:
+        file.write(json.dumps({'index': 0, 'status': 'ok'}) + "\n")
+
+    writer = ResultWriter([result_path], resume=True)
+    writer.write(0, {'index': 1, 'status': 'ok'})
+    writer.close()
+
+    assert sorted(load_results(result_path)) == [0, 1]
+
+def test_torn_line_without_newline_before_it(
+    tmp_path, 
+):
+    # a crash during the very first record leaves no complete line at all
+    result_path = str(tmp_path / "testResult_2610191010_rel_sybVp_nP.jsonl")
+    write_torn_results(result_path, 0)
+
+    writer = ResultWriter([result_path], resume=True)
+    writer.write(0, {'index': 0, 'status': 'ok'})
+    writer.close()
+
+    assert sorted(load_results(result_path)) == [0]
+
+def test_fresh_run_replaces_file(
+    tmp_path, 
+):
+    # a run without resume that lands on the name of an earlier run in the same minute
+    result_path = str(tmp_path / "testResult_2610191010_rel_sybVp_nP.jsonl")
+    write_torn_results(result_path, 4)
+
+    writer = ResultWriter([result_path])
+    writer.write(0, {'index': 0, 'status': 'failed'})
+    writer.close()
+
+    record_dict = load_results(result_path)
+    assert list(record_dict) == [0]
+    assert record_dict[0]['status'] == 'failed'
@@ -0,0 +1,32 @@
+"""
+ SPDX-License-Identifier: MIT
+ Copyright (c) 2025, yasaisen (clover)
+ 
+ This file is part of a project licensed under the MIT License.
+ See the LICENSE file in the project root for more information.
+ 
+ last modified in 2610191250
+"""
+
+from usageReport import summarize_records
+
+
+def sent_record(
+    prompt_tokens, 
+    cached_tokens, 
+):
+    return {'status': 'ok', 'cached': False, 'correct': True, 'prompt_tokens': prompt_tokens, 'completion_tokens': 1, 'cached_tokens': cached_tokens}
+
+def test_unreported_cached_tokens_stay_missing():
+    # an endpoint without prompt_tokens_details is not an endpoint that never hits its cache
+    report = summarize_records([sent_record(1000, None), sent_record(1000, None)], model_name='gpt-4o-2024-08-06')
+    assert report['cached_tokens'] is None
+    assert report['cached_share'] is None
+    assert report['cache_saved_usd'] is None
+    assert report['cost_usd'] is not None
+
+def test_cached_share_covers_reported_records():
+    report = summarize_records([sent_record(1000, 500), sent_record(1000, None), sent_record(1000, 0)], model_name='gpt-4o-2024-08-06')
+    assert report['cached_tokens'] == 500
+    assert report['cached_share'] == 0.25
+    assert report['cache_saved_usd'] > 0
@@ -0,0 +1,183 @@
+"""
+ SPDX-License-Identifier: MIT
+ Copyright (c) 2025, yasaisen (clover)
+ 
+ This file is part of a project licensed under the MIT License.
+ See the LICENSE file in the project root for more information.
+ 
+ last modified in 2610191250
+"""
+
+import os
+import json
+import numpy as np
+
+from resultStore import load_results
+
+
+# USD per 1M tokens: (input, cached input, output); models not listed get no cost estimate
+PRICE_DICT = {
+    "gpt-4.1-nano-2025-04-14": (0.10, 0.025, 0.40), 
+    "gpt-4.1-mini-2025-04-14": (0.40, 0.10, 1.60), 
+    "gpt-4.1-2025-04-14": (2.00, 0.50, 8.00), 
+    "gpt-4o-mini-2024-07-18": (0.15, 0.075, 0.60), 
+    "gpt-4o-2024-08-06": (2.50, 1.25, 10.00), 
+}
+# Batch API requests are billed at half price
+BATCH_PRICE_SCALE = 0.5
+PERCENTILE_LIST = [50, 90, 99]
+
+
+def percentile_dict(
+    value_list, 
+    prefix, 
+    scale: float = 1.0, 
+):
+    value_list = np.array([value for value in value_list if value is not None], dtype=float) * scale
+    if len(value_list) == 0:
+        return {f"{prefix}_p{q}": None for q in PERCENTILE_LIST}
+    return {f"{prefix}_p{q}": float(np.percentile(value_list, q)) for q in PERCENTILE_LIST}
+
+def estimate_cost(
+    model_name, 
+    prompt_tokens, 
+    cached_tokens, 
+    completion_tokens, 
+    price_scale: float = 1.0, 
+):
+    if model_name not in PRICE_DICT:
+        return None
+    input_price, cached_price, output_price = PRICE_DICT[model_name]
+    cost = (prompt_tokens - cached_tokens) * input_price + cached_tokens * cached_price + completion_tokens * output_price
+    return cost / 1e6 * price_scale
+
+def summarize_records(
+    record_list: list, 
+    model_name: str = None, 
+    wall_s: float = None, 
+    price_scale: float = 1.0, 
+):
+    # latency percentiles cover requests that were actually sent (answered, not from the cache);
+    # token totals and cost only count requests the API billed;
+    # a bundled question counts as 1/bundle of a sent request;
+    # the cached share only covers responses that reported cached_tokens, None when none did
+    sent_list = [record for record in record_list if record.get('status') == 'ok' and not record.get('cached')]
+    reported_list = [record for record in sent_list if record.get('cached_tokens') is not None]
+    prompt_tokens = sum(record.get('prompt_tokens') or 0 for record in sent_list)
+    reported_prompt_tokens = sum(record.get('prompt_tokens') or 0 for record in reported_list)
+    cached_tokens = sum(record['cached_tokens'] for record in reported_list) if reported_list else None
+    completion_tokens = sum(record.get('completion_tokens') or 0 for record in sent_list)
+    correct_list = [bool(record.get('correct')) for record in record_list if record.get('status') == 'ok']
+    latency_list = [record['latency'] for record in sent_list if record.get('latency') is not None]
+    payload_list = [record.get('payload_bytes') for record in record_list if record.get('payload_bytes') is not None]
+    cost = estimate_cost(model_name, prompt_tokens, cached_tokens or 0, completion_tokens, price_scale=price_scale)
+    uncached_cost = estimate_cost(model_name, prompt_tokens, 0, completion_tokens, price_scale=price_scale)
+    return {
+        'model': model_name, 
+        'requests': len(record_list), 
+        'ok': sum(record.get('status') == 'ok' for record in record_list), 
+        'failed': sum(record.get('status') != 'ok' for record in record_list), 
+        'cached': sum(bool(record.get('cached')) for record in record_list), 
+        'sent_requests': sum(1 / (record.get('bundle') or 1) for record in record_list if not record.get('cached')), 
+        'retries': sum(record.get('retries') or 0 for record in record_list), 
+        'acc': float(np.mean(correct_list)) if correct_list else None, 
+        'latency_mean_ms': float(np.mean(latency_list)) * 1000 if latency_list else None, 
+        **percentile_dict([record.get('latency') for record in sent_list], 'latency_ms', scale=1000), 
+        **percentile_dict([record.get('ttfb') for record in sent_list], 'ttfb_ms', scale=1000), 
+        **percentile_dict([record.get('server_ms') for record in sent_list], 'server_ms'), 
+        'payload_kb_mean': float(np.mean(payload_list)) / 1024 if payload_list else None, 
+        'prompt_tokens': prompt_tokens, 
+        'cached_tokens': cached_tokens, 
+        'cached_share': cached_tokens / reported_prompt_tokens if cached_tokens is not None and reported_prompt_tokens else None, 
+        'completion_tokens': completion_tokens, 
+        'completion_tokens_mean': completion_tokens / len(sent_list) if sent_list else None, 
+        'wall_s': wall_s, 
+        'tokens_per_s': (prompt_tokens + completion_tokens) / wall_s if wall_s else None, 
+        'output_tokens_per_s': completion_tokens / wall_s if wall_s else None, 
+        'questions_per_s': len(record_list) / wall_s if wall_s else None, 
+        'cost_usd': cost, 
+        # what provider-side prompt caching took off the bill
+        'cache_saved_usd': uncached_cost - cost if cost is not None and cached_tokens is not None else None, 
+    }
+
+def report_path_for(
+    result_path, 
+):
+    # testResult_<nowtime>_<setting>.jsonl -> testReport_<nowtime>_<setting>.json next to it
+    result_dir, file_name = os.path.split(result_path)
+    file_name = os.path.splitext(file_name)[0].replace('testResult_', 'testReport_', 1) + '.json'
+    return os.path.join(result_dir, file_name)
+
+def write_report(
+    report, 
+    report_path, 
+):
+    with open(report_path, 'w', encoding='utf-8') as report_file:
+        json.dump(report, report_file, indent=4)
+    return report_path
+
+def load_report(
+    result_path, 
+):
+    # the report written next to a result file, or one summarized from its records
+    # (results of a run cut short, or written before reports existed)
+    report_path = report_path_for(result_path)
+    if os.path.isfile(report_path):
+        with open(report_path, 'r', encoding='utf-8') as report_file:
+            return json.load(report_file)
+    return summarize_records(list(load_results(result_path).values()))
+
+def print_report_table(
+    report_dict, 
+):
+    def fmt(value, spec):
+        if value is None or value != value:
+            return format('-', spec.split('.')[0])
+        return format(value, spec)
+
+    print(f"\n{'setting':<30}{'acc':>7}{'ok':>6}{'failed':>7}{'cached':>7}{'retries':>8}{'p50 ms':>8}{'p90 ms':>8}{'p99 ms':>8}"
+          f"{'ttfb p50':>9}{'prompt tok':>11}{'cached %':>9}{'out tok':>8}{'tok/s':>8}{'cost $':>9}{'saved $':>9}")
+    for test_setting_name, report in report_dict.items():
+        print(f"{test_setting_name:<30}{fmt(report.get('acc'), '>7.3f')}{report['ok']:>6}{report['failed']:>7}{report['cached']:>7}{report['retries']:>8}"
+              f"{fmt(report['latency_ms_p50'], '>8.0f')}{fmt(report['latency_ms_p90'], '>8.0f')}{fmt(report['latency_ms_p99'], '>8.0f')}"
+              f"{fmt(report['ttfb_ms_p50'], '>9.0f')}{report['prompt_tokens']:>11}"
+              f"{fmt(report['cached_share'] * 100 if report.get('cached_share') is not None else None, '>9.1f')}{report['completion_tokens']:>8}"
+              f"{fmt(report['tokens_per_s'], '>8.0f')}{fmt(report['cost_usd'], '>9.4f')}{fmt(report.get('cache_saved_usd'), '>9.4f')}")
+
+def print_delta_table(
+    report_dict, 
+    baseline_dict, 
+):
+    # each report against its baseline (e.g. '<setting>_bundled' against '<setting>'), relative changes in %;
+    # out tok is per answered question
+    def fmt(value, spec):
+        if value is None or value != value:
+            return format('-', spec.split('.')[0].replace('+', ''))
+        return format(value, spec)
+
+    def percent(share):
+        return share * 100 if share is not None else None
+
+    def change(value, base_value):
+        if value is None or not base_value:
+            return None
+        return (value / base_value - 1) * 100
+
+    print(f"\n{'setting':<30}{'acc':>7}{'base acc':>9}{'d acc':>8}{'requests':>9}{'base req':>9}{'p50 ms':>8}{'base p50':>9}"
+          f"{'out tok':>8}{'base out':>9}{'cached %':>9}{'base %':>7}{'d tok %':>9}{'d q/s %':>9}{'d cost %':>10}")
+    for test_setting_name, report in report_dict.items():
+        base = baseline_dict.get(test_setting_name)
+        if base is None:
+            print(f"{test_setting_name:<30}  (no baseline)")
+            continue
+        acc_delta = None
+        if report.get('acc') is not None and base.get('acc') is not None:
+            acc_delta = report['acc'] - base['acc']
+        print(f"{test_setting_name:<30}{fmt(report.get('acc'), '>7.3f')}{fmt(base.get('acc'), '>9.3f')}{fmt(acc_delta, '>+8.3f')}"
+              f"{fmt(report.get('sent_requests'), '>9.0f')}{fmt(base.get('sent_requests', base['requests'] - base['cached']), '>9.0f')}"
+              f"{fmt(report['latency_ms_p50'], '>8.0f')}{fmt(base['latency_ms_p50'], '>9.0f')}"
+              f"{fmt(report.get('completion_tokens_mean'), '>8.1f')}{fmt(base.get('completion_tokens_mean'), '>9.1f')}"
+              f"{fmt(percent(report.get('cached_share')), '>9.1f')}{fmt(percent(base.get('cached_share')), '>7.1f')}"
+              f"{fmt(change(report['prompt_tokens'] + report['completion_tokens'], base['prompt_tokens'] + base['completion_tokens']), '>+9.1f')}"
+              f"{fmt(change(report.get('questions_per_s'), base.get('questions_per_s')), '>+9.1f')}"
+              f"{fmt(change(report.get('cost_usd'), base.get('cost_usd')), '>+10.1f')}")
@@ -0,0 +1,397 @@
+"""
+ SPDX-License-Identifier: MIT
+ Copyright (c) 2025, yasaisen (clover)
+ 
+ This file is part of a project licensed under the MIT License.
+ See the LICENSE file in the project root for more information.
+ 
+ last modified in 2610191250
+"""
+
+import os
+import re
+import time
+import base64
+import asyncio
+
+from inferenceEngine import classify_error
+from mockAnswer import mock_answer
+
+
+BACKEND = 'openai'
+OPENAI_MODEL_NAME = "gpt-4.1-nano-2025-04-14"
+MAX_TOKENS = 512
+DETERMINISTIC_BATCH_SIZE = 32
+CALLABLE_BATCH_SIZE = 8
+
+# 'default': system, prompt, image; 'prefix': system, the prompt's static preamble, image, then the question,
+# so every request on one image shares the longest possible prefix for provider-side prompt caching
+MESSAGE_LAYOUT_LIST = ['default', 'prefix']
+# the preamble ends with the sentence before the one holding the first question mark
+PREAMBLE_PATTERN = re.compile(r"^(.*?[.!:])\s+([^.!:?]*\?.*)$", re.DOTALL)
+
+
+def split_preamble(
+    prompt, 
+):
+    # (preamble, question), the preamble is '' when the prompt has no question to split at
+    question_end = prompt.find('?')
+    if question_end < 0:
+        return '', prompt
+    match = PREAMBLE_PATTERN.match(prompt[:question_end + 1])
+    if match is None:
+        return '', prompt
+    return match.group(1), match.group(2) + prompt[question_end + 1:]
+
+def build_messages(
+    prompt, 
+    base64_img, 
+    mime: str = "image/png", 
+    layout: str = None, 
+):
+    image_part = {"type": "image_url", "image_url": {"url": f"data:{mime};base64,{base64_img}"}}
+    if layout == 'prefix':
+        preamble, question = split_preamble(prompt)
+        content = [{"type": "text", "text": preamble}] if preamble else []
+        content += [image_part, {"type": "text", "text": question}]
+    else:
+        content = [{"type": "text", "text": prompt}, image_part]
+    return [
+        {"role": "system", "content": "You are a helpful visual assistant."}, 
+        {"role": "user", "content": content}
+    ]
+
+def usage_dict(
+    usage, 
+):
+    if usage is None:
+        return None
+    details = getattr(usage, 'prompt_tokens_details', None)
+    return {
+        'prompt_tokens': usage.prompt_tokens, 
+        'completion_tokens': usage.completion_tokens, 
+        # None when the endpoint does not report it, which is not the same as nothing served from cache
+        'cached_tokens': getattr(details, 'cached_tokens', None), 
+    }
+
+def server_ms(
+    headers, 
+):
+    try:
+        return float(headers.get('openai-processing-ms'))
+    except (TypeError, ValueError):
+        return None
+
+async def run_vlm_inference_async(
+    prompt, 
+    base64_img, 
+    client, 
+    model_name: str = OPENAI_MODEL_NAME, 
+    max_tokens: int = MAX_TOKENS, 
+    mime: str = "image/png", 
+    stream: bool = False, 
+    layout: str = None, 
+):
+    # errors propagate so the engine can retry them or record the sample as failed;
+    # besides the answer returns token usage, the server's processing time (openai-processing-ms) and,
+    # when streaming, the time to the first content chunk
+    messages = build_messages(prompt, base64_img, mime, layout=layout)
+
+    start = time.perf_counter()
+    if not stream:
+        raw_response = await client.chat.completions.with_raw_response.create(
+            model=model_name, 
+            messages=messages, 
+            max_tokens=max_tokens
+        )
+        response = raw_response.parse()
+        return {
+            "answer": response.choices[0].message.content.strip(), 
+            "usage": usage_dict(response.usage), 
+            "server_ms": server_ms(raw_response.headers), 
+            "ttfb": None, 
+        }
+
+    raw_response = await client.chat.completions.with_raw_response.create(
+        model=model_name, 
+        messages=messages, 
+        max_tokens=max_tokens, 
+        stream=True, 
+        stream_options={"include_usage": True}, 
+    )
+    ttfb, usage, content_list = None, None, []
+    async for chunk in raw_response.parse():
+        if chunk.choices and chunk.choices[0].delta.content:
+            if ttfb is None:
+                ttfb = time.perf_counter() - start
+            content_list += [chunk.choices[0].delta.content]
+        if chunk.usage is not None:
+            usage = chunk.usage
+    return {
+        "answer": "".join(content_list).strip(), 
+        "usage": usage_dict(usage), 
+        "server_ms": server_ms(raw_response.headers), 
+        "ttfb": ttfb, 
+    }
+
+def get_retry_after(
+    e, 
+):
+    response = getattr(e, 'response', None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get('retry-after-ms') is not None:
+            return float(headers['retry-after-ms']) / 1000
+        if headers.get('retry-after') is not None:
+            return float(headers['retry-after'])
+    except ValueError:
+        return None
+    return None
+
+def classify_openai_error(
+    e, 
+):
+    import openai
+
+    if isinstance(e, openai.RateLimitError):
+        return True, True, get_retry_after(e)
+    if isinstance(e, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True, False, None
+    if isinstance(e, openai.APIStatusError) and (e.status_code in (408, 409) or e.status_code >= 500):
+        return True, False, get_retry_after(e)
+    return classify_error(e)
+
+class VLMBackend:
+    # a backend answers a batch of {'prompt', 'payload'} requests (payload as built by imageStore.encode_image,
+    # an optional 'max_tokens' overrides the backend's, 'layout' orders the message parts) with one {'answer'}
+    # dict or one exception per request;
+    # batch_size is how many it wants per call
+    name = 'base'
+    batch_size = 1
+
+    def __init__(
+        self, 
+        model_name: str, 
+        max_tokens: int = MAX_TOKENS, 
+        batch_size: int = None, 
+    ):
+        self.model_name = model_name
+        self.max_tokens = max_tokens
+        if batch_size is not None:
+            self.batch_size = batch_size
+        self.request_num = 0
+        self.batch_num = 0
+        self.wall_s = 0.0
+        self.start = None
+
+    async def __aenter__(
+        self, 
+    ):
+        await self.open()
+        self.start = time.perf_counter()
+        return self
+
+    async def __aexit__(
+        self, 
+        *exc_info, 
+    ):
+        self.wall_s += time.perf_counter() - self.start
+        await self.close()
+
+    async def open(
+        self, 
+    ):
+        pass
+
+    async def close(
+        self, 
+    ):
+        pass
+
+    async def infer_batch(
+        self, 
+        request_list, 
+    ):
+        raise NotImplementedError
+
+    async def run_batch(
+        self, 
+        request_list, 
+    ):
+        self.request_num += len(request_list)
+        self.batch_num += 1
+        return await self.infer_batch(request_list)
+
+    def classify_error(
+        self, 
+        e, 
+    ):
+        return classify_error(e)
+
+    def cache_scope(
+        self, 
+    ):
+        # what besides the model name tells this backend's answers apart in the response cache
+        return {'backend': self.name}
+
+    def stats(
+        self, 
+    ):
+        return {
+            'backend': self.name, 
+            'model': self.model_name, 
+            'batch_size': self.batch_size, 
+            'requests': self.request_num, 
+            'batches': self.batch_num, 
+            'avg_batch': self.request_num / max(1, self.batch_num), 
+            'wall_s': self.wall_s, 
+            'req_per_s': self.request_num / self.wall_s if self.wall_s else 0.0, 
+        }
+
+class OpenAIBackend(VLMBackend):
+    # one chat completion per sample, parallelism comes from the engine's concurrency window;
+    # stream=True measures time to first byte at the cost of a streamed response
+    name = 'openai'
+
+    def __init__(
+        self, 
+        model_name: str = OPENAI_MODEL_NAME, 
+        max_tokens: int = MAX_TOKENS, 
+        base_url: str = None, 
+        batch_size: int = None, 
+        stream: bool = False, 
+        api_key: str = None, 
+    ):
+        super().__init__(model_name=model_name, max_tokens=max_tokens, batch_size=batch_size)
+        self.base_url = base_url
+        self.api_key = api_key
+        self.stream = stream
+        self.client = None
+
+    async def open(
+        self, 
+    ):
+        # imported on first use, other backends never load the openai package;
+        # retries are handled by the engine, so the client must surface 429s instead of retrying them itself
+        import openai
+
+        self.client = openai.AsyncOpenAI(
+            api_key=self.api_key or openai.api_key or None, 
+            base_url=self.base_url, 
+            max_retries=0, 
+        )
+
+    async def close(
+        self, 
+    ):
+        await self.client.close()
+        self.client = None
+
+    async def infer_batch(
+        self, 
+        request_list, 
+    ):
+        return await asyncio.gather(*[
+            run_vlm_inference_async(
+                prompt=request['prompt'], 
+                base64_img=request['payload']['b64'], 
+                client=self.client, 
+                model_name=self.model_name, 
+                max_tokens=request.get('max_tokens') or self.max_tokens, 
+                mime=request['payload'].get('mime', "image/png"), 
+                stream=self.stream, 
+                layout=request.get('layout'), 
+            ) for request in request_list
+        ], return_exceptions=True)
+
+    def classify_error(
+        self, 
+        e, 
+    ):
+        return classify_openai_error(e)
+
+    def cache_scope(
+        self, 
+    ):
+        # the OpenAI API keeps the scope-free keys of earlier caches, any other endpoint (the mock, a
+        # self-hosted server with the same model name) gets its own entries
+        base_url = self.base_url or os.environ.get("OPENAI_BASE_URL")
+        if not base_url:
+            return {}
+        return {'base_url': base_url.rstrip('/')}
+
+class DeterministicBackend(VLMBackend):
+    # offline stand-in: picks one of the listed options from a hash of prompt and image, like the mock server,
+    # latency_s simulates the cost of one forward pass per batch
+    name = 'deterministic'
+    batch_size = DETERMINISTIC_BATCH_SIZE
+
+    def __init__(
+        self, 
+        model_name: str = 'deterministic', 
+        max_tokens: int = MAX_TOKENS, 
+        batch_size: int = None, 
+        latency_s: float = 0.0, 
+    ):
+        super().__init__(model_name=model_name, max_tokens=max_tokens, batch_size=batch_size)
+        self.latency_s = latency_s
+
+    async def infer_batch(
+        self, 
+        request_list, 
+    ):
+        if self.latency_s:
+            await asyncio.sleep(self.latency_s)
+        return [{'answer': mock_answer(request['prompt'], [request['payload']['sha']])} for request in request_list]
+
+class CallableBackend(VLMBackend):
+    # wraps an in-process model: infer_fn(prompt_list, image_bytes_list) -> answer_list runs one forward pass
+    # over the whole batch in a thread, so the event loop keeps feeding the next batch meanwhile
+    name = 'callable'
+    batch_size = CALLABLE_BATCH_SIZE
+
+    def __init__(
+        self, 
+        infer_fn, 
+        model_name: str = 'local', 
+        max_tokens: int = MAX_TOKENS, 
+        batch_size: int = None, 
+    ):
+        super().__init__(model_name=model_name, max_tokens=max_tokens, batch_size=batch_size)
+        self.infer_fn = infer_fn
+
+    async def infer_batch(
+        self, 
+        request_list, 
+    ):
+        answer_list = await asyncio.to_thread(
+            self.infer_fn, 
+            [request['prompt'] for request in request_list], 
+            [base64.b64decode(request['payload']['b64']) for request in request_list], 
+        )
+        return [{'answer': str(answer).strip()} for answer in answer_list]
+
+BACKEND_DICT = {
+    'openai': OpenAIBackend, 
+    'deterministic': DeterministicBackend, 
+    'callable': CallableBackend, 
+}
+
+def register_backend(
+    name, 
+    backend_cls, 
+):
+    BACKEND_DICT[name] = backend_cls
+
+def get_backend(
+    backend = BACKEND, 
+    **kwargs, 
+):
+    # accepts a registered name or an already built backend
+    if isinstance(backend, VLMBackend):
+        return backend
+    if backend not in BACKEND_DICT:
+        raise ValueError(f"Unknown backend '{backend}', expected one of {list(BACKEND_DICT)}")
+    return BACKEND_DICT[backend](**kwargs)